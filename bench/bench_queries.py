@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Query plans and timings for the hot Ingredient, Order and Bar queries in SQLite,
+before and after the indexes added by mixmind/migrations/9ce794341df0_index_hot_queries.py
+Only needs the standard library, the tables are a copy of the models' columns
+"""
+
+import argparse
+import datetime
+import importlib.util
+import os
+import random
+import sqlite3
+import timeit
+import uuid
+
+MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'mixmind', 'migrations', '9ce794341df0_index_hot_queries.py')
+
+SCHEMA = """
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY,
+    email VARCHAR(127) UNIQUE,
+    first_name VARCHAR(127),
+    last_name VARCHAR(127)
+);
+CREATE TABLE bar (
+    id INTEGER PRIMARY KEY,
+    cname VARCHAR(63) UNIQUE,
+    name VARCHAR(63),
+    is_public BOOLEAN,
+    is_default BOOLEAN,
+    owner_id INTEGER REFERENCES user (id)
+);
+CREATE TABLE ingredient (
+    uuid BINARY(16),
+    bar_id INTEGER NOT NULL REFERENCES bar (id),
+    "Category" VARCHAR(7),
+    "Type" VARCHAR(100) NOT NULL,
+    "Kind" VARCHAR(255) NOT NULL,
+    "In_Stock" BOOLEAN,
+    "ABV" FLOAT,
+    "Size_mL" FLOAT,
+    "Price_Paid" FLOAT,
+    type_ VARCHAR(100),
+    "Size_oz" FLOAT,
+    "Cost_per_mL" FLOAT,
+    "Cost_per_cL" FLOAT,
+    "Cost_per_oz" FLOAT,
+    PRIMARY KEY (bar_id, "Type", "Kind")
+);
+CREATE TABLE "order" (
+    id INTEGER PRIMARY KEY,
+    bar_id INTEGER REFERENCES bar (id),
+    user_id INTEGER REFERENCES user (id),
+    bartender_id INTEGER REFERENCES user (id),
+    timestamp DATETIME,
+    confirmed DATETIME,
+    user_email VARCHAR(127),
+    recipe_name VARCHAR(127),
+    recipe_html TEXT
+);
+"""
+
+CATEGORIES = 'Spirit Liqueur Vermouth Bitters Syrup Juice Mixer Wine Beer Dry Ice'.split()
+TYPES = ['white rum', 'dark rum', 'aged rum', 'rhum agricole', 'london dry gin', 'old tom gin',
+        'bourbon', 'rye whiskey', 'scotch', 'blanco tequila', 'mezcal', 'cognac', 'sweet vermouth',
+        'dry vermouth', 'campari', 'angostura bitters', 'simple syrup', 'lime juice', 'lemon juice',
+        'soda water']
+
+def load_indexes():
+    """ The migration's INDEXES, (name, table, columns)
+    """
+    spec = importlib.util.spec_from_file_location('index_hot_queries', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration.INDEXES
+
+def seed(conn, rand, bars, ingredients, orders, users):
+    """ Fill the tables, returning the values the queries pick their parameters from
+    """
+    conn.executemany("INSERT INTO user (id, email, first_name, last_name) VALUES (?, ?, ?, ?)",
+            [(i, 'user{}@example.com'.format(i), 'First{}'.format(i), 'Last{}'.format(i)) for i in range(1, users+1)])
+    conn.executemany("INSERT INTO bar (id, cname, name, is_public, is_default, owner_id) VALUES (?, ?, ?, ?, ?, ?)",
+            [(i, 'bar{}'.format(i), 'Bar {}'.format(i), rand.random() < 0.5, i == 1, rand.randint(1, users))
+                for i in range(1, bars+1)])
+    uuids = []
+    rows = []
+    for bar_id in range(1, bars+1):
+        for n in range(ingredients):
+            type_ = TYPES[n % len(TYPES)]
+            iid = uuid.UUID(int=rand.getrandbits(128))
+            uuids.append(iid)
+            size = rand.choice([375.0, 750.0, 1000.0])
+            price = rand.uniform(8, 60)
+            rows.append((iid.bytes, bar_id, rand.choice(CATEGORIES), type_.title(), 'Brand {}'.format(n),
+                rand.random() < 0.8, rand.uniform(0, 50), size, price, type_, size / 29.5735,
+                price / size, price / size * 10, price / size * 29.5735))
+    conn.executemany("INSERT INTO ingredient VALUES ({})".format(', '.join(['?']*14)), rows)
+    start = datetime.datetime(2018, 1, 1)
+    order_rows = []
+    for i in range(1, orders+1):
+        user_id = rand.randint(1, users)
+        order_rows.append((i, rand.randint(1, bars), user_id, rand.randint(1, users),
+            start + datetime.timedelta(minutes=i), None, 'user{}@example.com'.format(user_id),
+            'Recipe {}'.format(i % 500), '<div>...</div>'))
+    conn.executemany('INSERT INTO "order" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', order_rows)
+    conn.commit()
+    return uuids
+
+def hot_queries(rand, bars, users, uuids):
+    """ (label, sql, make_params) for each query as the app runs it
+    """
+    bar = lambda: (rand.randint(1, bars),)
+    return [
+        ("Barstock_SQL.resolver stock types",
+            "SELECT DISTINCT type_, \"Category\" FROM ingredient WHERE bar_id = ? AND \"In_Stock\" = 1", bar),
+        ("Barstock_Snapshot in stock rows",
+            "SELECT * FROM ingredient WHERE bar_id = ? AND \"In_Stock\" = 1", bar),
+        ("Barstock_SQL.slice_on_type",
+            "SELECT * FROM ingredient WHERE type_ IN (?, ?) AND \"Kind\" = ? AND bar_id = ? AND \"In_Stock\" = 1",
+            lambda: ('white rum', 'aged rum', 'Brand 0', rand.randint(1, bars))),
+        ("type_ LIKE '%rum%' in stock",
+            "SELECT * FROM ingredient WHERE bar_id = ? AND \"In_Stock\" = 1 AND type_ LIKE '%rum%'", bar),
+        ("ingredients page",
+            "SELECT * FROM ingredient WHERE bar_id = ? ORDER BY \"Category\", \"Type\"", bar),
+        ("Ingredient.query_by_iid",
+            "SELECT * FROM ingredient WHERE uuid = ?", lambda: (rand.choice(uuids).bytes,)),
+        ("bar's orders",
+            "SELECT * FROM \"order\" WHERE bar_id = ?", bar),
+        ("user's orders by email",
+            "SELECT * FROM \"order\" WHERE user_email = ?",
+            lambda: ('user{}@example.com'.format(rand.randint(1, users)),)),
+        ("user's orders by id",
+            "SELECT * FROM \"order\" WHERE user_id = ?", lambda: (rand.randint(1, users),)),
+        ("default bar",
+            "SELECT * FROM bar WHERE is_default = 1", lambda: ()),
+    ]
+
+def query_plan(conn, sql, params):
+    return '; '.join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+def time_query(conn, sql, make_params, number, repeat, budget=0.5):
+    """ Best time per query, running fewer than number of them
+    when that many would take longer than budget seconds
+    """
+    once = timeit.timeit(lambda: conn.execute(sql, make_params()).fetchall(), number=1)
+    number = max(1, min(number, int(budget / once)))
+    params = [make_params() for _ in range(number)]
+    def run():
+        for p in params:
+            conn.execute(sql, p).fetchall()
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / number
+
+def measure(conn, queries, number, repeat):
+    results = []
+    for label, sql, make_params in queries:
+        plan = query_plan(conn, sql, make_params())
+        results.append((label, plan, time_query(conn, sql, make_params, number, repeat)))
+    return results
+
+def get_parser():
+    p = argparse.ArgumentParser(description="Query plans and timings for the hot queries, before and after indexing")
+    p.add_argument('--bars', type=int, default=2000, help="Bars to seed")
+    p.add_argument('--ingredients', type=int, default=60, help="Ingredients per bar")
+    p.add_argument('--orders', type=int, default=200000, help="Orders to seed")
+    p.add_argument('--users', type=int, default=5000, help="Users to seed")
+    p.add_argument('-n', '--number', type=int, default=500, help="Queries per timing, at most")
+    p.add_argument('-r', '--repeat', type=int, default=7, help="Timings to take the best of")
+    p.add_argument('--db', default=':memory:', help="SQLite file to build, it's replaced if it exists")
+    return p
+
+def main():
+    args = get_parser().parse_args()
+    if args.db != ':memory:' and os.path.exists(args.db):
+        os.remove(args.db)
+    conn = sqlite3.connect(args.db)
+    conn.executescript(SCHEMA)
+    uuids = seed(conn, random.Random(0), args.bars, args.ingredients, args.orders, args.users)
+    print("{} bars, {} ingredients, {} orders, {} users".format(args.bars, args.bars*args.ingredients, args.orders, args.users))
+
+    queries = hot_queries(random.Random(1), args.bars, args.users, uuids)
+    before = measure(conn, queries, args.number, args.repeat)
+    for name, table, columns in load_indexes():
+        conn.execute('CREATE INDEX {} ON "{}" ({})'.format(name, table, ', '.join('"{}"'.format(c) for c in columns)))
+    conn.commit()
+    queries = hot_queries(random.Random(1), args.bars, args.users, uuids)
+    after = measure(conn, queries, args.number, args.repeat)
+
+    for (label, plan_before, t_before), (_, plan_after, t_after) in zip(before, after):
+        print()
+        print(label)
+        print("  before: {:10.1f} us/query  {}".format(t_before * 1e6, plan_before))
+        print("  after:  {:10.1f} us/query  {}  ({:.1f}x)".format(t_after * 1e6, plan_after, t_before / t_after))
+
+if __name__ == "__main__":
+    main()
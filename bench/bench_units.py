@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for util.convert_units and util.convert_many
+Compares against the if/elif dispatch convert_units used before the factor table,
+over every pair of units in util.CONVERSION_FACTORS, rounded and not
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+# run from anywhere, e.g. python bench/bench_units.py
+# importing the package doesn't build the app, see mixmind.create_app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mixmind.util as util
+
+
+def legacy_convert_units(amount, from_unit, to_unit, rounded=False):
+    """ convert_units as it was, rebuilding the dispatch dict every call
+    """
+    if from_unit == 'literal':
+        return amount
+    amount = float(amount)
+    if from_unit == to_unit:
+        return amount
+    unit_conversions = {
+            'ds': legacy_dash_to_volume,
+            'tsp': legacy_tsp_to_volume,
+            'mL': legacy_mL_to_volume,
+            'cL': legacy_cL_to_volume,
+            'oz': legacy_oz_to_volume,
+            'drop': legacy_drop_to_volume,
+            }
+    convert = unit_conversions.get(from_unit, lambda x,y,z: util.no_conversion(from_unit, to_unit))
+    return convert(amount, to_unit, rounded)
+
+def legacy_dash_to_volume(amount, unit, rounded=False):
+    mL_per_oz = util.ML_PER_OZ if not rounded else util.ML_PER_OZ_ROUNDED
+    if unit == 'mL':
+        return amount * util.ML_PER_DS
+    elif unit == 'cL':
+        return amount * util.ML_PER_DS / util.ML_PER_CL
+    elif unit == 'oz':
+        return amount / mL_per_oz
+    else:
+        util.no_conversion('dash', unit)
+
+def legacy_tsp_to_volume(amount, unit, rounded=False):
+    mL_per_tsp = util.ML_PER_TSP if not rounded else util.ML_PER_TSP_ROUNDED
+    if unit == 'oz':
+        return amount * util.OZ_PER_TSP
+    elif unit == 'mL':
+        return amount * mL_per_tsp
+    elif unit == 'cL':
+        return amount * mL_per_tsp / util.ML_PER_CL
+    else:
+        util.no_conversion('tsp', unit)
+
+def legacy_oz_to_volume(amount, unit, rounded=False):
+    mL_per_oz = util.ML_PER_OZ if not rounded else util.ML_PER_OZ_ROUNDED
+    if unit == 'mL':
+        return amount * mL_per_oz
+    elif unit == 'cL':
+        return amount * mL_per_oz / util.ML_PER_CL
+    elif unit == 'tsp':
+        return amount / util.OZ_PER_TSP
+    elif unit == 'ds':
+        return amount / util.OZ_PER_DS
+    elif unit == 'drop':
+        return amount / util.OZ_PER_DROP
+    else:
+        util.no_conversion('oz', unit)
+
+def legacy_mL_to_volume(amount, unit, rounded=False):
+    mL_per_oz = util.ML_PER_OZ if not rounded else util.ML_PER_OZ_ROUNDED
+    mL_per_tsp = util.ML_PER_TSP if not rounded else util.ML_PER_TSP_ROUNDED
+    if unit == 'oz':
+        return amount / mL_per_oz
+    elif unit == 'cL':
+        return amount / util.ML_PER_CL
+    elif unit == 'ds':
+        return amount / util.ML_PER_DS
+    elif unit == 'tsp':
+        return amount / mL_per_tsp
+    elif unit == 'drop':
+        return amount / util.ML_PER_DROP
+    elif unit == 'mL':
+        return amount
+    else:
+        util.no_conversion('mL', unit)
+
+def legacy_drop_to_volume(amount, unit, rounded=False):
+    if unit == 'oz':
+        return amount * util.OZ_PER_DROP
+    elif unit == 'mL':
+        return amount * util.ML_PER_DROP
+    elif unit == 'cL':
+        return amount * util.ML_PER_DROP / util.ML_PER_CL
+    else:
+        util.no_conversion('drop', unit)
+
+def legacy_cL_to_volume(amount, unit, rounded=False):
+    try:
+        return legacy_mL_to_volume(amount, unit, rounded) * util.ML_PER_CL
+    except NotImplementedError:
+        util.no_conversion('cL', unit)
+
+# every conversion the table knows, and a unit to itself
+PAIRS = sorted(util.CONVERSION_FACTORS[False]) + [(unit, unit) for unit in util.UNITS]
+
+def get_parser():
+    p = argparse.ArgumentParser(description="Time unit conversions")
+    p.add_argument('-n', '--number', type=int, default=200000, help="Conversions per timing")
+    p.add_argument('-r', '--repeat', type=int, default=5, help="Timings to take the best of")
+    return p
+
+def best(fn, number, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) / number
+
+def main():
+    args = get_parser().parse_args()
+    rand = random.Random(0)
+    amounts = [rand.uniform(0.25, 750.0) for _ in range(args.number)]
+    units = [rand.choice(PAIRS) + (rand.random() < 0.5,) for _ in range(args.number)]
+    # the table has to give the same answers as the dispatch for every pair
+    for f, t in PAIRS:
+        for rounded in (False, True):
+            if abs(legacy_convert_units(1.5, f, t, rounded) - util.convert_units(1.5, f, t, rounded)) > 1e-12:
+                raise AssertionError("mismatch converting {} to {}, rounded={}".format(f, t, rounded))
+    for a, (f, t, r) in zip(amounts, units):
+        if abs(legacy_convert_units(a, f, t, r) - util.convert_units(a, f, t, r)) > 1e-9 * abs(a):
+            raise AssertionError("mismatch converting {} {} to {}".format(a, f, t))
+
+    def run(convert):
+        return lambda: [convert(a, f, t, r) for a, (f, t, r) in zip(amounts, units)]
+    print("{} unit pairs, rounded and not".format(len(PAIRS)))
+    legacy = best(run(legacy_convert_units), args.number, args.repeat)
+    table = best(run(util.convert_units), args.number, args.repeat)
+    print("convert_units, legacy dispatch: {:8.1f} ns/conversion".format(legacy * 1e9))
+    print("convert_units, factor table:    {:8.1f} ns/conversion  ({:.1f}x)".format(table * 1e9, legacy / table))
+    if util.has_numpy:
+        for to_unit in util.UNITS:
+            from_units = [f for f, t, r in units if t == to_unit and not r]
+            amounts_to = [a for a, (f, t, r) in zip(amounts, units) if t == to_unit and not r]
+            loop = best(lambda: [util.convert_units(a, f, to_unit) for a, f in zip(amounts_to, from_units)], len(amounts_to), args.repeat)
+            batch = best(lambda: util.convert_many(amounts_to, from_units, to_unit), len(amounts_to), args.repeat)
+            print("to {:<5} convert_units loop:    {:8.1f} ns/conversion".format(to_unit + ',', loop * 1e9))
+            print("to {:<5} convert_many:          {:8.1f} ns/conversion  ({:.1f}x)".format(to_unit + ',', batch * 1e9, loop / batch))
+
+if __name__ == "__main__":
+    main()
@@ -44,6 +44,46 @@ MIXMIND_DEFAULT_INGREDIENTS = ["ExampleBarstock.csv"]
 
 MIXMIND_DEFAULT_BAR_NAME = u"Home Bar"
 
+# how recipe examples are calculated, 'scalar', 'numpy' (falls back to scalar without numpy),
+# or 'closed_form' which gets the stats without enumerating every combination of kinds
+MIXMIND_EXAMPLE_ENGINE = 'closed_form'
+# recipes with more combinations of kinds than this use closed_form, whatever the engine
+MIXMIND_MAX_COMBINATIONS = 250000
+
+# worker processes used to generate recipe libraries, 0 or 1 to generate serially
+MIXMIND_GENERATION_WORKERS = 0
+# how those processes start, "spawn" workers only import mixmind.generate and what it needs
+MIXMIND_GENERATION_START_METHOD = 'spawn'
+# generate every bar's recipe library at startup instead of on first use
+MIXMIND_PREGENERATE_LIBRARIES = False
+
+# total size of rendered recipe cards kept for reuse, 0 to turn off
+MIXMIND_FRAGMENT_CACHE_BYTES = 8 * 1024 * 1024
+# total size of whole rendered browse pages kept to answer repeat visits, 0 to turn off
+MIXMIND_RESPONSE_CACHE_BYTES = 4 * 1024 * 1024
+
+# cache shared between worker processes so each recipe library is only generated
+# once and stock edits reach every worker, one of None (off), "local" (this process
+# only), "sqlite:///path/to/cache.db" or "redis://host:port/db" (needs redis)
+MIXMIND_SHARED_CACHE = None
+# seconds a worker waits for another worker that's generating the same bar's library,
+# before generating one itself
+MIXMIND_SHARED_LIBRARY_WAIT = 30
+
+# orders on each page of the order history tables, and from /api/orders
+MIXMIND_ORDERS_PER_PAGE = 50
+
+# seconds each worker keeps bar settings and the bar list before reloading them, edits made
+# through the site reload them right away (in every worker when there's a shared cache)
+MIXMIND_BAR_CONFIG_MAX_AGE = 30
+
+# directory under MIXMIND_DIR to save each bar's processed recipe library in,
+# so restarts load them instead of generating again, None to turn off
+MIXMIND_SNAPSHOT_DIR = None
+
+# words spelled differently between recipes and ingredient stock, mapped to one spelling
+MIXMIND_INGREDIENT_SYNONYMS = {'whisky': 'whiskey'}
+
 # time
 TIMEZONE = 'US/Eastern'
 HUMAN_FORMAT = 'ddd, D MMM YYYY, at LT'
@@ -4,33 +4,44 @@ from mixmind.logger import get_logger
 log = get_logger('mixmind')
 
 
-from flask import Flask
-from flask_uploads import UploadSet, DATA, configure_uploads
-
-app = Flask(__name__, instance_relative_config=True)
-app.config.from_object('config')
-app.config.from_pyfile('config.py')
-
-# flask-uploads
-app.config['UPLOADS_DEFAULT_DEST'] = './stockdb'
-datafiles = UploadSet('datafiles', DATA)
-configure_uploads(app, (datafiles,))
-
-from mixmind.database import db, init_db, alembic
-db.init_app(app)
-alembic.init_app(app)
-with app.app_context():
-    init_db()
-
-from mixmind.notifier import mail
-mail.init_app(app)
-
-from mixmind.configuration_management import MixMindServer, get_bar_config
-with app.app_context():
-    mms = MixMindServer(app)
-
-from werkzeug.local import LocalProxy
-current_bar = LocalProxy(get_bar_config)
-
-with app.app_context():
-    import mixmind.views # to assosciate views with app
+def create_app():
+    """ Build the app and everything hung off it, once.
+    Importing the package doesn't, so recipe generation workers (see mixmind.generate)
+    and the cli can use the modules that don't need it. flask run finds this
+    through FLASK_APP=mixmind, a wsgi file does `application = create_app()`
+    """
+    global app, datafiles, db, alembic, mail, mms, current_bar
+    if 'app' in globals():
+        return app
+
+    from flask import Flask
+    from flask_uploads import UploadSet, DATA, configure_uploads
+
+    app = Flask(__name__, instance_relative_config=True)
+    app.config.from_object('config')
+    app.config.from_pyfile('config.py')
+
+    # flask-uploads
+    app.config['UPLOADS_DEFAULT_DEST'] = './stockdb'
+    datafiles = UploadSet('datafiles', DATA)
+    configure_uploads(app, (datafiles,))
+
+    from mixmind.database import db, init_db, alembic
+    db.init_app(app)
+    alembic.init_app(app)
+    with app.app_context():
+        init_db()
+
+    from mixmind.notifier import mail
+    mail.init_app(app)
+
+    from mixmind.configuration_management import MixMindServer, get_bar_config
+    with app.app_context():
+        mms = MixMindServer(app)
+
+    from werkzeug.local import LocalProxy
+    current_bar = LocalProxy(get_bar_config)
+
+    with app.app_context():
+        import mixmind.views # to assosciate views with app
+    return app
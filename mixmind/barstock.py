@@ -2,6 +2,8 @@ import csv
 import string
 import itertools
 import codecs
+import uuid
+from collections import namedtuple, OrderedDict
 
 try:
     import pandas as pd
@@ -9,12 +11,20 @@ try:
 except ImportError:
     has_pandas = False
 
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
 from sqlalchemy import and_
 from sqlalchemy.exc import SQLAlchemyError
 
 from . import util
 from .database import db
 from .ingredient import Categories, Ingredient, display_name_mappings
+from .type_resolver import get_resolver
+from .generate import StockRow, Barstock_Snapshot
 from .logger import get_logger
 log = get_logger(__name__)
 
@@ -38,7 +48,7 @@ def _calculated_columns(thing):
     """ Given an object with the required fields,
     calculate and add the other fields
     """
-    thing['Size (oz)'] = util.convert_units(thing['Size (mL)'], 'mL', 'oz')
+    thing['Size (oz)'] = util.convert_many(thing['Size (mL)'], 'mL', 'oz')
     thing['$/mL'] = thing['Price Paid'] / thing['Size (mL)']
     thing['$/cL'] = thing['Price Paid']*10 / thing['Size (mL)']
     thing['$/oz'] = thing['Price Paid'] / thing['Size (oz)']
@@ -55,33 +65,177 @@ def _update_computed_fields(row):
     except ZeroDivisionError:
         log.warning("Ingredient missing size field: {}".format(row))
 
+def _computed_fields_many(rows):
+    """ _update_computed_fields for a batch of clean row dicts, vectorized when numpy is available.
+    Rows without a size keep whatever costs they had
+    """
+    sizes = [row['Size_mL'] or 0.0 for row in rows]
+    prices = [row['Price_Paid'] or 0.0 for row in rows]
+    sizes_oz = util.convert_many(sizes, 'mL', 'oz')
+    if has_numpy:
+        sizes, prices = np.asarray(sizes, dtype=float), np.asarray(prices, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_mL = (prices / sizes).tolist()
+            per_cL = (prices*10 / sizes).tolist()
+            per_oz = (prices / sizes_oz).tolist()
+        sizes_oz = sizes_oz.tolist()
+        sizes = sizes.tolist()
+    else:
+        per_mL = [price / size if size else None for price, size in zip(prices, sizes)]
+        per_cL = [price*10 / size if size else None for price, size in zip(prices, sizes)]
+        per_oz = [price / size if size else None for price, size in zip(prices, sizes_oz)]
+    for i, row in enumerate(rows):
+        row['type_'] = row['Type'].lower()
+        row['Size_oz'] = sizes_oz[i]
+        if sizes[i]:
+            row['Cost_per_mL'] = per_mL[i]
+            row['Cost_per_cL'] = per_cL[i]
+            row['Cost_per_oz'] = per_oz[i]
+        else:
+            log.warning("Ingredient missing size field: {}".format(row))
+
+def _clean_row(row):
+    """ Convert a dict of fields from the csv to Model field names and types
+    """
+    return {display_name_mappings[k]['k'] : display_name_mappings[k]['v'](v)
+            for k,v in row.items()
+            if k in display_name_mappings}
+
 class DataError(Exception):
     pass
 
+def read_csv_rows(fp, source):
+    """ Generate (source, line number, row dict) from an open text file of CSV,
+    checking the header has the columns every row needs before going any further
+    :raises DataError: for a bad header, encoding or CSV syntax
+    """
+    try:
+        reader = csv.DictReader(fp)
+        fields = reader.fieldnames or []
+        if not ({'Ingredient', 'Type'} & set(fields)) or not ({'Kind', 'Bottle'} & set(fields)):
+            raise DataError("{}: header needs Ingredient (or Type) and Kind (or Bottle) columns, found: {}".format(
+                source, ', '.join(fields) or 'nothing'))
+        for row in reader:
+            yield source, reader.line_num, row
+    except (UnicodeDecodeError, csv.Error) as err:
+        raise DataError("{}: not a UTF-8 CSV file: {}".format(source, err))
+
+RejectedRow = namedtuple('RejectedRow', 'source,line,reason')
+
+class ImportReport(object):
+    """ What a bulk import did, with the (Type, Kind) of each row inserted
+    or updated, and a RejectedRow for each row that was left out
+    """
+    def __init__(self):
+        self.inserted = []
+        self.updated = []
+        self.rejected = []
+
+    def reject(self, source, line, reason):
+        self.rejected.append(RejectedRow(source, line, reason))
+
+    def __str__(self):
+        return "{} inserted, {} updated, {} rejected".format(len(self.inserted), len(self.updated), len(self.rejected))
+
 class Barstock(object):
     pass
 
 class Barstock_SQL(Barstock):
     def __init__(self, bar_id):
         self.bar_id = bar_id
+        self._resolver = None
+
+    @property
+    def resolver(self):
+        """ TypeResolver for the types currently in stock at this bar
+        """
+        if self._resolver is None:
+            stock_types = Ingredient.query.with_entities(Ingredient.type_, Ingredient.Category)\
+                    .filter_by(bar_id=self.bar_id, In_Stock=True).distinct().all()
+            self._resolver = get_resolver([tuple(pair) for pair in stock_types])
+        return self._resolver
+
     def load_from_csv(self, csv_list, bar_id, replace_existing=True):
         """Load the given CSVs
         if replace_existing is True, will replace the whole db for this bar
         bar_id is the active bar
+        Valid rows are all applied in one transaction, see import_rows
+        :returns: ImportReport
+        """
+        def read_rows():
+            for csv_file in csv_list:
+                # utf-8-sig handles the BOM, /uffef
+                with open(csv_file, encoding='utf-8-sig') as fp:
+                    yield from read_csv_rows(fp, csv_file)
+        return self.import_rows(read_rows(), bar_id, replace_existing=replace_existing)
+
+    def load_from_stream(self, stream, bar_id, replace_existing=True, source='upload'):
+        """Load a CSV from a binary stream, e.g. an uploaded file, as it's read
+        A bad header is raised before the rest of the stream is read
+        :returns: ImportReport
+        :raises DataError: for a bad header or encoding, or see import_rows
+        """
+        fp = codecs.getreader('utf-8-sig')(stream)
+        return self.import_rows(read_csv_rows(fp, source), bar_id, replace_existing=replace_existing)
+
+    def import_rows(self, rows, bar_id, replace_existing=True):
+        """Insert or update ingredients in bulk, in a single transaction
+        Every row is parsed and validated first, bad rows are rejected and
+        the rest applied, later rows for the same (Type, Kind) win
+        :param rows: iterable of (source, line number, dict of fields from the csv)
+        :param bool replace_existing: delete the bar's current stock first
+        :returns: ImportReport
+        :raises DataError: if the database rejects the import, nothing is changed
         """
-        if replace_existing:
-            rows_deleted = Ingredient.query.filter_by(bar_id=bar_id).delete()
+        report = ImportReport()
+        parsed = OrderedDict() # (Type, Kind) -> clean row
+        for source, line, row in rows:
+            if not any(row.values()):
+                continue
+            if not row.get('Ingredient', row.get('Type')) or not row.get('Kind', row.get('Bottle')):
+                report.reject(source, line, "Primary key (Ingredient, Kind) missing")
+                continue
+            try:
+                clean_row = _clean_row(row)
+            except (ValueError, TypeError) as err:
+                report.reject(source, line, "Bad value: {}".format(err))
+                continue
+            if clean_row.get('Category') and clean_row['Category'] not in Categories:
+                report.reject(source, line, "Unknown Category: {}".format(clean_row['Category']))
+                continue
+            parsed.setdefault((clean_row['Type'], clean_row['Kind']), {}).update(clean_row)
+
+        self._resolver = None
+        try:
+            if replace_existing:
+                rows_deleted = Ingredient.query.filter_by(bar_id=bar_id).delete()
+                log.info("Dropping {} rows for {} table".format(rows_deleted, Ingredient.__tablename__))
+                existing = {}
+            else:
+                existing = {(row.Type, row.Kind): row for row in Ingredient.query.filter_by(bar_id=bar_id)}
+            columns = list(Ingredient.__table__.columns.keys())
+            inserts, updates = [], []
+            for key, clean_row in parsed.items():
+                row = existing.get(key)
+                if row is None:
+                    values = {'uuid': uuid.uuid4(), 'bar_id': bar_id, 'In_Stock': True,
+                            'ABV': 0.0, 'Size_mL': 0.0, 'Price_Paid': 0.0}
+                    inserts.append(values)
+                    report.inserted.append(key)
+                else:
+                    values = {column: row[column] for column in columns}
+                    updates.append(values)
+                    report.updated.append(key)
+                values.update(clean_row)
+            _computed_fields_many(inserts + updates)
+            db.session.bulk_insert_mappings(Ingredient, inserts)
+            db.session.bulk_update_mappings(Ingredient, updates)
             db.session.commit()
-            log.info("Dropped {} rows for {} table".format(rows_deleted, Ingredient.__tablename__))
-        for csv_file in csv_list:
-            # utf-8-sig handles the BOM, /uffef
-            with open(csv_file, encoding='utf-8-sig') as fp:
-                reader = csv.DictReader(fp)
-                for row in reader:
-                    try:
-                        self.add_row(row, bar_id)
-                    except DataError as e:
-                        log.warning(e)
+        except SQLAlchemyError as err:
+            db.session.rollback()
+            raise DataError("{}: importing {} rows".format(err, len(parsed)))
+        log.info("Imported ingredients for bar {}: {}".format(bar_id, report))
+        return report
 
     def add_row(self, row, bar_id):
         """ where row is a dict of fields from the csv
@@ -89,9 +243,8 @@ class Barstock_SQL(Barstock):
         if not row.get('Ingredient', row.get('Type')) or not row.get('Kind', row.get('Bottle')):
             log.debug("Primary key (Ingredient, Kind) missing, skipping ingredient: {}".format(row))
             return
-        clean_row = {display_name_mappings[k]['k'] : display_name_mappings[k]['v'](v)
-                for k,v in row.items()
-                if k in display_name_mappings}
+        clean_row = _clean_row(row)
+        self._resolver = None
         try:
             ingredient = Ingredient(bar_id=bar_id, **clean_row)
             row = Ingredient.query.filter_by(bar_id=ingredient.bar_id,
@@ -111,12 +264,19 @@ class Barstock_SQL(Barstock):
             msg = "{}: on row: {}".format(err, clean_row)
             raise DataError(msg)
 
+    def get_kind_lists(self, specifiers):
+        """ For a given list of ingredient specifiers, return a list of lists
+        where each list is the kinds in stock for that ingredient
+        e.g. Martini passes in ['gin', 'vermouth'], gets [['Beefeater', 'Knickerbocker'], ['Noilly Prat']]
+        """
+        return [[b.Kind for b in self.slice_on_type(i)] for i in specifiers]
+
     def get_all_kind_combinations(self, specifiers):
         """ For a given list of ingredient specifiers, return a list of lists
         where each list is a specific way to make the drink
         e.g. Martini passes in ['gin', 'vermouth'], gets [['Beefeater', 'Noilly Prat'], ['Knickerbocker', 'Noilly Prat']]
         """
-        kind_lists = [[b.Kind for b in self.slice_on_type(i)] for i in specifiers]
+        kind_lists = self.get_kind_lists(specifiers)
         opts = itertools.product(*kind_lists)
         return opts
 
@@ -148,19 +308,12 @@ class Barstock_SQL(Barstock):
     # TODO sqlqlchemy exception decorator?
     def slice_on_type(self, specifier):
         """ Return query results for rows matching an ingredient specifier
-        Handles several special cases
+        Special cases like "rum" or "any spirit" are handled by the resolver
         """
-        type_ = specifier.ingredient.lower()
-        if type_ in ['rum', 'whiskey', 'whisky', 'tequila', 'vermouth']:
-            type_ = 'whisk' if type_ == 'whisky' else type_
-            filter_ = Ingredient.type_.like('%{}%'.format(type_))
-        elif type_ == 'any spirit':
-            spirits = ['dry gin', 'rye whiskey', 'bourbon whiskey', 'amber rum', 'dark rum', 'white rum', 'genever', 'cognac', 'brandy', 'aquavit']
-            filter_ = Ingredient.type_.in_(spirits)
-        elif type_ == 'bitters':
-            filter_ = Ingredient.Category == 'Bitters'
-        else:
-            filter_ = Ingredient.type_ == type_
+        types = self.resolver.resolve(specifier.ingredient)
+        if not types:
+            return []
+        filter_ = Ingredient.type_.in_(types)
 
         if specifier.kind:
             filter_ = and_(filter_, Ingredient.Kind == specifier.kind)
@@ -183,13 +336,29 @@ class Barstock_DF(Barstock):
 
     def __init__(self, df):
         self.df = df
+        self._resolver = None
+
+    @property
+    def resolver(self):
+        """ TypeResolver for the types in the dataframe
+        """
+        if self._resolver is None:
+            self._resolver = get_resolver(set(zip(self.df['type'], self.df['Category'])))
+        return self._resolver
+
+    def get_kind_lists(self, specifiers):
+        """ For a given list of ingredient specifiers, return a list of lists
+        where each list is the kinds in stock for that ingredient
+        e.g. Martini passes in ['gin', 'vermouth'], gets [['Beefeater', 'Knickerbocker'], ['Noilly Prat']]
+        """
+        return [self.slice_on_type(i)['Kind'].tolist() for i in specifiers]
 
     def get_all_kind_combinations(self, specifiers):
         """ For a given list of ingredient specifiers, return a list of lists
         where each list is a specific way to make the drink
         e.g. Martini passes in ['gin', 'vermouth'], gets [['Beefeater', 'Noilly Prat'], ['Knickerbocker', 'Noilly Prat']]
         """
-        kind_lists = [self.slice_on_type(i)['Kind'].tolist() for i in specifiers]
+        kind_lists = self.get_kind_lists(specifiers)
         opts = itertools.product(*kind_lists)
         return opts
 
@@ -219,17 +388,7 @@ class Barstock_DF(Barstock):
         return row
 
     def slice_on_type(self, specifier):
-        type_ = specifier.ingredient.lower()
-        if type_ in ['rum', 'whiskey', 'whisky', 'tequila', 'vermouth']:
-            type_ = 'whisk' if type_ == 'whisky' else type_
-            matching = self.df[self.df['type'].str.contains(type_)]
-        elif type_ == 'any spirit':
-            matching = self.df[self.df.type.isin(['dry gin', 'rye whiskey', 'bourbon whiskey', 'amber rum', 'dark rum', 'white rum', 'genever', 'brandy', 'aquavit'])]
-            #matching = self.df[self.df['Category'] == 'Spirit']
-        elif type_ == 'bitters':
-            matching = self.df[self.df['Category'] == 'Bitters']
-        else:
-            matching = self.df[self.df['type'] == type_]
+        matching = self.df[self.df['type'].isin(self.resolver.resolve(specifier.ingredient))]
         if specifier.kind:
             return matching[matching['Kind'] == specifier.kind].reset_index(drop=True)
         else:
@@ -245,6 +404,7 @@ class Barstock_DF(Barstock):
         row = {k:[v] for k,v in row.items()}
         row = pd.DataFrame.from_dict(row)
         self.df = pd.concat([self.df, row])
+        self._resolver = None
 
     @classmethod
     def load(cls, barstock_csv, include_all=False):
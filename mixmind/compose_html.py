@@ -1,5 +1,8 @@
 """ Helper utils to compose objects as blobs of html
 """
+import threading
+from collections import OrderedDict
+
 import yattag
 
 from . import util
@@ -24,6 +27,79 @@ def small_br(content, **kwargs):
 def wrap_link(link, content, **kwargs):
     return '<a href={}>{}</a>'.format(link, content, **kwargs)
 
+class FragmentCache(object):
+    """ LRU cache of rendered html fragments, evicting the least recently used
+    once the fragments add up to more than max_bytes. Keys must include
+    everything the fragment depends on, there is no other invalidation
+    """
+    def __init__(self, max_bytes, shared=None):
+        """
+        :param shared_cache.SharedFragments shared: to also look in and store to,
+            for str fragments that other workers can reuse
+        """
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict() # key -> (fragment, size)
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """ Cached fragment for key, or call render() to make it and cache the result
+        """
+        fragment = self.get(key)
+        if fragment is None:
+            fragment = render()
+            self.put(key, fragment)
+        return fragment
+
+    def get(self, key):
+        """ Cached fragment for key, None if there isn't one
+        """
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        if self.shared is not None:
+            fragment = self.shared.get(key)
+            if fragment is not None:
+                self.put(key, fragment, share=False)
+            return fragment
+        return None
+
+    def put(self, key, fragment, size=None, share=True):
+        """
+        :param int size: bytes to count the fragment as, for things other than a str
+        :param bool share: store to the shared cache too, if there is one
+        """
+        if self.shared is not None and share:
+            self.shared.set(key, fragment)
+        if size is None:
+            size = len(fragment.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._fragments.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._fragments[key] = (fragment, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._fragments.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._fragments)
+
 def recipe_as_html(recipe, display_opts, order_link=None, condense_ingredients=False, fancy=True, convert_to=None):
     """ use yattag lib to build an html blob contained in a div for the recipe"""
     doc, tag, text, line = yattag.Doc().ttl()
@@ -47,7 +123,7 @@ def recipe_as_html(recipe, display_opts, order_link=None, condense_ingredients=F
     }
 
     if convert_to:
-        recipe.convert(convert_to)
+        recipe = recipe.in_unit(convert_to)
 
     main_tag = 'div'
     extra_kwargs = {"klass": "card card-body h-100"}
@@ -96,8 +172,8 @@ def recipe_as_html(recipe, display_opts, order_link=None, condense_ingredients=F
             doc.asis(ingredients+'<br>')
         else:
             with tag('ul', id='ingredients'):
-                for item in recipe.ingredients:
-                    line('li', item.str(), type="none")
+                for item in recipe.ingredient_lines():
+                    line('li', item, type="none")
 
         if display_opts.variants:
             if condense_ingredients:
@@ -153,20 +229,25 @@ def as_table(objects, headings, cells, formatters, outer_div="", table_id="", ta
                                 doc.asis(close(formatter(getattr(obj, cell)), 'td'))
     return str(doc.getvalue())
 
-def users_as_table(users):
+def users_as_table(users, order_counts=None):
+    """ :param dict order_counts: {user id: number of orders}, instead of loading each user's orders
+    """
     headings = "ID,Email,First,Last,Nickname,Logins,Last,Confirmed,Roles,Orders".split(',')
     cells = "id,email,first_name,last_name,nickname,login_count,last_login_at,confirmed_at,get_role_names,orders".split(',')
     formatters = [str, str, str, str, str, str, str, str, lambda x: x(), len]
+    if order_counts is not None:
+        cells[-1] = 'id'
+        formatters[-1] = lambda user_id: order_counts.get(user_id, 0)
     return as_table(users, headings, cells, formatters, outer_div="table-responsive-sm", table_cls="table table-sm")
 
 def yes_no(b):
     return 'yes' if b else 'no'
 
-def orders_as_table(orders):
+def orders_as_table(orders, table_id=""):
     headings = "ID,Timestamp,Confirmed,User ID,Bar ID,Recipe".split(',')
     cells = "id,timestamp,confirmed,user_id,bar_id,recipe_name".split(',')
     formatters = [str, str, yes_no, str, str, str]
-    return as_table(orders, headings, cells, formatters, outer_div="table-responsive-sm", table_cls="table table-sm")
+    return as_table(orders, headings, cells, formatters, outer_div="table-responsive-sm", table_id=table_id, table_cls="table table-sm")
 
 def bars_as_table(bars):
     headings = "ID,Name,CName,Total Orders".split(',')
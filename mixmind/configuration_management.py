@@ -2,23 +2,35 @@
 - uses backing database to get all "global" config required in a request
 - makes available to request in the flask.g via a local proxy
 - ensures changes to global config don't cause races in the middle of a request
-TODO:
-    - recipe library still technically needs synchronization
+- recipe libraries are immutable snapshots, swapped whole when they change
 """
 import os.path
+import atexit
+import threading
+import time
+import bisect
+import operator
 from collections import namedtuple
 
 from flask import g, flash
 from flask_login import current_user
 
-from .recipe import DrinkRecipe
+from .recipe import DrinkRecipe, MAX_COMBINATIONS
 from .barstock import Barstock_SQL, Ingredient
+from .generate import Barstock_Snapshot, generate_partition, generate_in_pool, START_METHOD
 from .database import db
 from .models import Bar, User
-from .util import load_recipe_json, to_human_diff, get_ts_formatter
+from .type_resolver import configure_synonyms, RecipeDependencies
+from .search_index import RecipeSearchIndex
+from .shared_cache import get_shared_cache, SharedLibraries
+from .snapshots import LibrarySnapshots, recipes_fingerprint
+from .util import load_recipe_json, to_human_diff, get_ts_formatter, normalize_name, slugify
 from .logger import get_logger
 log = get_logger(__name__)
 
+# seconds between looks at the shared cache while another worker holds a bar's lease
+SHARED_POLL_INTERVAL = 0.2
+
 def get_recipe_files(app):
     return get_checked_files(app,
             app.config.get('MIXMIND_RECIPES_DIR'),
@@ -39,12 +51,220 @@ def get_checked_files(app, partial_path, files):
             log.warning("{} not found, will be omitted".format(f))
     return list(set(files) - missing)
 
+class RecipeNameIndex(object):
+    """ Lookup of recipe names by their normalized form and by slug,
+    only depends on the names so it's shared by every snapshot of a library
+    """
+    __slots__ = ('_names', '_normalized', '_slugs', '_slug_by_name')
+
+    def __init__(self, names):
+        self._names = set()
+        self._normalized = {}
+        self._slugs = {}
+        self._slug_by_name = {}
+        for name in names:
+            self._names.add(name)
+            self._normalized.setdefault(normalize_name(name), name)
+            # stable as long as the recipe files don't change order
+            slug = base = slugify(name) or 'recipe'
+            suffix = 2
+            while slug in self._slugs:
+                slug = "{}-{}".format(base, suffix)
+                suffix += 1
+            self._slugs[slug] = name
+            self._slug_by_name[name] = slug
+
+    def lookup(self, name):
+        """ The recipe name matching the exact name, a URL-quoted or differently
+        cased or spaced version of it, or its slug, None if there's no match
+        """
+        if name in self._names:
+            return name
+        normalized = normalize_name(name)
+        return self._normalized.get(normalized) or self._slugs.get(normalized)
+
+    def slug(self, name):
+        return self._slug_by_name.get(name)
+
+# the RecipeStats attributes results can be sorted on
+SORTABLE_STATS = ('avg_abv', 'avg_cost', 'avg_std_drinks')
+
+class SortOrder(object):
+    """ Permutation of a library's recipes by one of their stats.
+    Recipes without stats, i.e. ones that can't be made, are kept apart to go last
+    """
+    __slots__ = ('attr', 'keys', 'missing', 'ascending', 'descending', 'unmade', 'ties')
+
+    def __init__(self, attr, recipes, keys, missing):
+        """
+        :param tuple recipes: the library's recipes
+        :param list keys: sorted (value, position) pairs of the recipes with stats
+        :param list missing: sorted positions of the recipes without
+        """
+        self.attr = attr
+        self.keys = keys
+        self.missing = missing
+        self.ascending = tuple(recipes[position] for value, position in keys)
+        # equal values stay in position order either way, like a stable sort
+        self.descending = tuple(recipes[position] for value, position in sorted(keys, key=lambda key: (-key[0], key[1])))
+        self.unmade = tuple(recipes[position] for position in missing)
+        self.ties = any(a[0] == b[0] for a, b in zip(keys, keys[1:]))
+
+    @classmethod
+    def build(cls, attr, recipes):
+        keys, missing = [], []
+        for position, recipe in enumerate(recipes):
+            if recipe.stats is None:
+                missing.append(position)
+            else:
+                keys.append((getattr(recipe.stats, attr), position))
+        keys.sort()
+        return cls(attr, recipes, keys, missing)
+
+    def update(self, recipes, changed):
+        """ A new SortOrder for the recipes, with just the ones at the changed positions re-keyed
+        """
+        keys = [key for key in self.keys if key[1] not in changed]
+        missing = [position for position in self.missing if position not in changed]
+        for position in changed:
+            stats = recipes[position].stats
+            if stats is None:
+                bisect.insort(missing, position)
+            else:
+                bisect.insort(keys, (getattr(stats, self.attr), position))
+        return SortOrder(self.attr, recipes, keys, missing)
+
+    def walk(self, recipes, reverse=False, positions=None):
+        """ The recipes, which must all be from the library, sorted the same as a
+        stable sort of the list would
+        :param dict positions: recipe name to library position, to check whether the list
+            is in library order when that matters, otherwise it's assumed not to be
+        """
+        wanted = set(recipes)
+        unmade = [] if wanted.isdisjoint(self.unmade) else [recipe for recipe in self.unmade if recipe in wanted]
+        in_order = False
+        if positions is not None and (self.ties or len(unmade) > 1):
+            order = [positions.get(recipe.name, -1) for recipe in recipes]
+            in_order = all(map(operator.lt, order, order[1:]))
+        if self.ties and not in_order:
+            result = self._walk_ties(recipes, reverse)
+        else:
+            result = [recipe for recipe in (self.descending if reverse else self.ascending) if recipe in wanted]
+        if not in_order and len(unmade) > 1:
+            rank = {recipe: i for i, recipe in enumerate(recipes)}
+            unmade.sort(key=rank.get)
+        return result + unmade
+
+    def _walk_ties(self, recipes, reverse):
+        # equal values keep their order from the list, like a stable sort
+        rank = {recipe: i for i, recipe in enumerate(recipes)}
+        ordered = self.descending if reverse else self.ascending
+        values = [value for value, position in self.keys]
+        if reverse:
+            values.sort(reverse=True)
+        result = []
+        group = []
+        last = None
+        for value, recipe in zip(values, ordered):
+            if recipe not in rank:
+                continue
+            if group and value != last:
+                result.extend(sorted(group, key=rank.get))
+                group = []
+            group.append(recipe)
+            last = value
+        result.extend(sorted(group, key=rank.get))
+        return result
+
+class RecipeLibrary(object):
+    """ Snapshot of a bar's recipe library, never modified once published.
+    Changes build a new snapshot with the next version that replaces this one,
+    so readers keep a consistent library for as long as they hold it
+    """
+    __slots__ = ('bar_id', 'version', 'recipes', 'by_name', 'positions', 'versions', 'index', 'search',
+            '_orders', '_stale_orders')
+
+    def __init__(self, bar_id, version, recipes, versions=None, index=None, search=None, stale_orders=None):
+        """
+        :param dict versions: recipe name to the library version that recipe was last
+            replaced in, defaults to this version for every recipe
+        :param RecipeNameIndex index: for these recipe names, built if not given
+        :param RecipeSearchIndex search: for these recipes, built if not given
+        :param dict stale_orders: stat -> (SortOrder, set of positions changed since),
+            from an earlier version, updated rather than rebuilt when first needed
+        """
+        self.bar_id = bar_id
+        self.version = version
+        self.recipes = tuple(recipes)
+        self.by_name = {recipe.name: recipe for recipe in self.recipes}
+        self.positions = {recipe.name: position for position, recipe in enumerate(self.recipes)}
+        self.versions = versions or {recipe.name: version for recipe in self.recipes}
+        self.index = index or RecipeNameIndex(self.by_name)
+        self.search = search or RecipeSearchIndex(self.recipes)
+        self._orders = {}
+        self._stale_orders = stale_orders or {}
+
+    def replace(self, recipes_by_name, version=None):
+        """ The next version, with the given recipes swapped in by name
+        :param int version: of the new library, defaults to one more than this
+        """
+        version = version or self.version + 1
+        versions = dict(self.versions)
+        versions.update((name, version) for name in recipes_by_name if name in self.by_name)
+        changed = set(self.positions[name] for name in recipes_by_name if name in self.by_name)
+        stale_orders = {attr: (order, stale | changed) for attr, (order, stale) in self._stale_orders.items()}
+        stale_orders.update((attr, (order, changed)) for attr, order in self._orders.items())
+        return RecipeLibrary(self.bar_id, version,
+                (recipes_by_name.get(recipe.name, recipe) for recipe in self.recipes), versions, self.index, self.search,
+                stale_orders)
+
+    def sort_order(self, attr):
+        """ SortOrder of the recipes by the RecipeStats attribute, built on first use
+        since it needs the stats of every recipe
+        """
+        order = self._orders.get(attr)
+        if order is None:
+            if attr in self._stale_orders:
+                stale, changed = self._stale_orders[attr]
+                order = stale.update(self.recipes, changed)
+            else:
+                order = SortOrder.build(attr, self.recipes)
+            self._orders[attr] = order
+        return order
+
+    def sort(self, recipes, attr, reverse=False):
+        """ Recipes from this library sorted by the RecipeStats attribute, the same as
+        sorted() would, with the ones that can't be made last
+        """
+        result = self.sort_order(attr).walk(recipes, reverse, self.positions)
+        if len(result) != len(recipes):
+            # some weren't from this library
+            return sorted(recipes, key=lambda r: getattr(r.stats, attr), reverse=reverse)
+        return result
+
+    def find(self, name):
+        """ Recipe by name, see RecipeNameIndex.lookup for what matches
+        """
+        return self.by_name.get(self.index.lookup(name))
+
+    def recipe_version(self, name):
+        """ Changes whenever the named recipe is regenerated, e.g. for cache keys
+        """
+        return self.versions.get(name)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def __repr__(self):
+        return "{}:{}v{}".format(self.__class__.__name__, self.bar_id, self.version)
+
 class MixMindServer():
     """ Contains the global recipe library and handle to the barstock"""
     def __init__(self, app):
         self.time_diff_formatter = to_human_diff
         self.time_human_formatter = get_ts_formatter(app.config.get('HUMAN_FORMAT'), app.config.get('TIMEZONE'))
         self.timestamp_formatter = get_ts_formatter(app.config.get('PRECISE_FORMAT'), app.config.get('TIMEZONE'))
+        configure_synonyms(app.config.get('MIXMIND_INGREDIENT_SYNONYMS'))
         # setup default Bar
         default_bar = Bar(name=app.config['MIXMIND_DEFAULT_BAR_NAME'],
                 cname=app.config.get('MIXMIND_DEFAULT_BAR_CNAME', app.config['MIXMIND_DEFAULT_BAR_NAME']),
@@ -66,70 +286,480 @@ class MixMindServer():
         recipe_files = get_recipe_files(app)
         log.info("STARTUP: Loading recipes from files: {}".format(recipe_files))
         self.base_recipes = load_recipe_json(recipe_files)
-        self._processed_recipes = {}
+        parsed_recipes = [DrinkRecipe(name, recipe) for name, recipe in self.base_recipes.items()]
+        self.recipe_dependencies = RecipeDependencies(parsed_recipes)
+        # these only depend on the recipe definitions, so every bar's library shares them
+        self.recipe_index = RecipeNameIndex(self.base_recipes)
+        self.search_index = RecipeSearchIndex(parsed_recipes)
+        self._libraries = {}
+        self._library_lock = threading.Lock() # only held by writers
+        self.example_engine = app.config.get('MIXMIND_EXAMPLE_ENGINE', 'scalar')
+        self.generation_workers = app.config.get('MIXMIND_GENERATION_WORKERS', 0)
+        self.generation_start_method = app.config.get('MIXMIND_GENERATION_START_METHOD', START_METHOD)
+        self.max_combinations = app.config.get('MIXMIND_MAX_COMBINATIONS', MAX_COMBINATIONS)
+        # libraries published by any worker, see library()
+        self.shared_cache = get_shared_cache(app.config.get('MIXMIND_SHARED_CACHE'))
+        self.shared_libraries = SharedLibraries(self.shared_cache) if self.shared_cache else None
+        self.shared_wait = app.config.get('MIXMIND_SHARED_LIBRARY_WAIT', 30)
+        self._unstored = {} # bar_id -> newest library built here, while it's being stored
+        self._leases = {} # bar_id -> lease token taken to generate the library
+        self._store_lock = threading.Lock() # for these, and _unsaved
+        bar_configs.configure(self.shared_cache, app.config.get('MIXMIND_BAR_CONFIG_MAX_AGE', 30))
+        # libraries saved to disk for the next start
+        snapshot_dir = app.config.get('MIXMIND_SNAPSHOT_DIR')
+        self.snapshots = LibrarySnapshots(os.path.join(app.config.get('MIXMIND_DIR'), snapshot_dir)) if snapshot_dir else None
+        self.recipes_fingerprint = recipes_fingerprint(self.base_recipes)
+        self._unsaved = {} # bar_id -> (library, fingerprint), while it's being saved
+        self._saveable = {} # bar_id -> (library, fingerprint) built here, saved again at exit
+        if self.snapshots is not None:
+            # recipes generated on demand since the last save
+            atexit.register(self.save_snapshots)
+        if app.config.get('MIXMIND_PREGENERATE_LIBRARIES', False):
+            self.generate_all_recipes(Bar.query.all())
+
+    def library(self, bar):
+        """Current RecipeLibrary for the given bar, built on first use, or taken
+        from the shared cache when another worker has published a newer one"""
+        library = self._libraries.get(bar.id)
+        if self.shared_libraries is not None:
+            library = self._load_shared(bar.id, library)
+            if library is None:
+                library = self._wait_for_shared(bar.id)
+        if library is None:
+            try:
+                self.generate_recipes(bar)
+            except Exception:
+                self._release_lease(bar.id)
+                raise
+            library = self._libraries[bar.id]
+        return library
 
     def processed_recipes(self, bar):
         """Allow lazy loading of the recipes for a given bar"""
-        if bar.id not in self._processed_recipes:
-            self.generate_recipes(bar)
-        return self._processed_recipes[bar.id]
+        return self.library(bar).recipes
 
     def find_recipe(self, bar, name):
-        """Find specific recipe at bar"""
-        for recipe in self.processed_recipes(bar):
-            if recipe.name == name:
-                return recipe
-        return None
-
-    def generate_recipes(self, bar):
-        log.info("Generating recipe library for {}".format(bar.cname))
-        barstock = Barstock_SQL(bar.id)
-        self._processed_recipes[bar.id] = [DrinkRecipe(name, recipe).generate_examples(barstock, stats=True)
-                for name, recipe in list(self.base_recipes.items())]
-
-    def regenerate_recipes(self, bar, ingredient=None, recipe_name=None):
-        """Regenerate the examples and statistics data for the recipes at the given bar
-        :param string ingredient: only updates recipes with the given ingredient
+        """Find specific recipe at bar, by name, URL-quoted name or slug"""
+        return self.library(bar).find(name)
+
+    def find_recipe_json(self, name):
+        """Recipe json from the recipe files, by name, URL-quoted name or slug"""
+        return self.base_recipes.get(self.recipe_index.lookup(name))
+
+    def _load_shared(self, bar_id, library):
+        """The library from the shared cache if it's newer than the given one"""
+        version = self.shared_libraries.version(bar_id)
+        if not version or (library is not None and library.version >= version):
+            return library
+        loaded = self.shared_libraries.load(bar_id, version)
+        if loaded is None:
+            return library
+        versions, generated = loaded
+        return self._publish(bar_id, recipes=self._loaded_recipes(generated), version=version, versions=versions)
+
+    def _wait_for_shared(self, bar_id):
+        """The library from the shared cache, waiting up to MIXMIND_SHARED_LIBRARY_WAIT
+        seconds if another worker is generating it. None when this worker takes
+        the lease and should generate it, or the wait runs out"""
+        with self._store_lock:
+            if bar_id in self._leases:
+                return None # taken here already
+        deadline = time.time() + self.shared_wait
+        while True:
+            token = self.shared_libraries.acquire(bar_id)
+            # looked for again, it may have been published or built here meanwhile
+            library = self._load_shared(bar_id, self._libraries.get(bar_id))
+            if token is not None:
+                if library is not None:
+                    self.shared_libraries.release(bar_id, token)
+                else:
+                    with self._store_lock:
+                        self._leases[bar_id] = token
+                return library
+            if library is not None or time.time() >= deadline:
+                return library
+            time.sleep(SHARED_POLL_INTERVAL)
+
+    def _claim_shared(self, bar_id):
+        """True if no worker has published the bar's library or is generating it,
+        and this one has taken the lease to"""
+        if self._load_shared(bar_id, None) is not None:
+            return False
+        token = self.shared_libraries.acquire(bar_id)
+        if token is None:
+            return False
+        with self._store_lock:
+            self._leases[bar_id] = token
+        return True
+
+    def _release_lease(self, bar_id):
+        with self._store_lock:
+            token = self._leases.pop(bar_id, None)
+        if token is not None:
+            self.shared_libraries.release(bar_id, token)
+
+    def _in_background(self, queued, bar_id, item, work):
+        """Call work(item) from a background thread, one per bar for each queued dict,
+        which moves on to the newest item queued meanwhile when it's done with this one,
+        skipping any in between"""
+        with self._store_lock:
+            running = bar_id in queued
+            queued[bar_id] = item
+        if not running:
+            threading.Thread(target=self._work_queued, args=(queued, bar_id, work), daemon=True).start()
+
+    def _work_queued(self, queued, bar_id, work):
+        item = queued[bar_id]
+        while True:
+            work(item)
+            with self._store_lock:
+                if queued[bar_id] is item:
+                    del queued[bar_id]
+                    return
+                item = queued[bar_id]
+
+    def _queue_store(self, library):
+        """Store the library in the shared cache in the background"""
+        self._in_background(self._unstored, library.bar_id, library, self._store_shared)
+
+    def _store_shared(self, library, token=None):
+        try:
+            self._store_with_lease(library, token)
+        except Exception as err:
+            log.warning("Failed to share recipe library for bar {}: {}: {}".format(library.bar_id, err.__class__.__name__, err))
+
+    def _store_with_lease(self, library, token=None):
+        """Store and publish the library, unless a newer one has been already.
+        Takes the bar's lease, unless its token is given and the caller releases it"""
+        bar_id = library.bar_id
+        lease = token
+        if lease is None:
+            with self._store_lock:
+                lease = self._leases.pop(bar_id, None)
+        while lease is None:
+            if self.shared_libraries.version(bar_id) >= library.version:
+                return
+            lease = self.shared_libraries.acquire(bar_id)
+            if lease is None:
+                time.sleep(SHARED_POLL_INTERVAL)
+        try:
+            if self.shared_libraries.version(bar_id) < library.version:
+                # generates whatever hasn't been yet, once for every worker
+                self.shared_libraries.store(library)
+        finally:
+            if token is None:
+                self.shared_libraries.release(bar_id, lease)
+
+    def _wait_for_lease(self, bar_id):
+        """The bar's lease, waiting up to MIXMIND_SHARED_LIBRARY_WAIT seconds
+        for another worker to release it, None if the wait runs out"""
+        with self._store_lock:
+            token = self._leases.pop(bar_id, None) # taken here to generate the library
+        deadline = time.time() + self.shared_wait
+        while token is None:
+            token = self.shared_libraries.acquire(bar_id)
+            if token is None:
+                if time.time() >= deadline:
+                    log.warning("Gave up waiting for the shared library lease for bar {}".format(bar_id))
+                    return None
+                time.sleep(SHARED_POLL_INTERVAL)
+        return token
+
+    def _loaded_recipes(self, generated):
+        """DrinkRecipes from (name, DrinkRecipe.dump_examples()) pairs"""
+        return [DrinkRecipe(name, self.base_recipes[name]).load_examples(data)
+                for name, data in generated if name in self.base_recipes]
+
+    def _fingerprint(self, barstock, engine):
+        """What a bar's library depends on, for matching it to a snapshot"""
+        return "{}:{}:{}:{}".format(self.recipes_fingerprint, engine, self.max_combinations, barstock.fingerprint())
+
+    def _save_snapshot(self, library, fingerprint, background=True):
+        """Save what's been generated of the library for the next start, by default
+        in the background, where a run of edits only saves the newest library once.
+        It's saved again at exit with whatever has been generated since"""
+        self._saveable[library.bar_id] = (library, fingerprint)
+        if background:
+            self._in_background(self._unsaved, library.bar_id, (library, fingerprint), self._store_snapshot)
+        else:
+            self._store_snapshot((library, fingerprint))
+
+    def _store_snapshot(self, saveable):
+        library, fingerprint = saveable
+        try:
+            self.snapshots.store(library, fingerprint)
+        except Exception as err:
+            log.warning("Failed to save library snapshot for bar {}: {}: {}".format(library.bar_id, err.__class__.__name__, err))
+
+    def save_snapshots(self):
+        """Save what's been generated of each library built here, e.g. at exit"""
+        for saveable in list(self._saveable.values()):
+            self._store_snapshot(saveable)
+
+    def _publish(self, bar_id, recipes=None, replaced=None, version=None, versions=None, lease=None):
+        """Swap in a new library snapshot for the bar, and share it with the other
+        workers in the background if there's a shared cache
+        :param list recipes: the whole library
+        :param dict replaced: or recipe name to DrinkRecipe, for just those recipes
+            to be replaced in the current library
+        :param int version: and versions, of a library loaded from the shared cache
+        :param lease: token for the bar's lease, held by the caller, to share it
+            right away instead
+        """
+        share = self.shared_libraries is not None and version is None
+        with self._library_lock:
+            current = self._libraries.get(bar_id)
+            if replaced is not None and current is None:
+                return None
+            if current is not None and version is not None and current.version >= version:
+                return current
+            if share:
+                version = self.shared_libraries.next_version(bar_id)
+            if replaced is not None:
+                library = current.replace(replaced, version)
+            else:
+                library = RecipeLibrary(bar_id, version or (current.version + 1 if current else 1), recipes,
+                        versions=versions, index=self.recipe_index, search=self.search_index)
+            self._libraries[bar_id] = library
+        if share and lease is not None:
+            self._store_shared(library, lease)
+        elif share:
+            self._queue_store(library)
+        return library
+
+    def generate_recipes(self, bar, engine=None):
+        """Build the recipe library for the given bar, a recipe's examples and
+        statistics are only generated once something reads them
+        :param string engine: one of recipe.EXAMPLE_ENGINES, defaults to MIXMIND_EXAMPLE_ENGINE
+        """
+        engine = engine or self.example_engine
+        barstock = Barstock_Snapshot.load(bar.id)
+        generated = {}
+        if self.snapshots is not None:
+            fingerprint = self._fingerprint(barstock, engine)
+            generated = dict(self.snapshots.load(bar.id, fingerprint) or [])
+        if generated:
+            log.info("Loading {} of {} recipes for {} from snapshot, the rest on demand ({} engine)".format(
+                len(generated), len(self.base_recipes), bar.cname, engine))
+        else:
+            log.info("Loading recipe library for {} ({} engine, on demand)".format(bar.cname, engine))
+        recipes = [DrinkRecipe(name, recipe).load_examples(generated[name]) if name in generated
+                else DrinkRecipe(name, recipe).defer_examples(barstock, stats=True, engine=engine,
+                    max_combinations=self.max_combinations)
+                for name, recipe in self.base_recipes.items()]
+        library = self._publish(bar.id, recipes=recipes)
+        if self.snapshots is not None:
+            # nothing new to save until recipes are read, that's left for exit
+            self._saveable[bar.id] = (library, fingerprint)
+
+    def generate_all_recipes(self, bars, engine=None, workers=None):
+        """Build the recipe libraries for the given bars, with the work for every bar
+        partitioned across a pool of worker processes
+        :param list bars: Bar objects
+        :param string engine: one of recipe.EXAMPLE_ENGINES, defaults to MIXMIND_EXAMPLE_ENGINE
+        :param int workers: number of processes, defaults to MIXMIND_GENERATION_WORKERS,
+            0 or 1 generates serially in this process
+        """
+        engine = engine or self.example_engine
+        workers = self.generation_workers if workers is None else workers
+        items = list(self.base_recipes.items())
+        if self.shared_libraries is not None:
+            # another worker may have generated them already, or be generating them now
+            bars = [bar for bar in bars if self._claim_shared(bar.id)]
+        # workers never touch the database, each bar's stock is loaded here once
+        snapshots = {bar.id: Barstock_Snapshot.load(bar.id) for bar in bars}
+        fingerprints = {}
+        if self.snapshots is not None:
+            for bar in bars:
+                fingerprints[bar.id] = self._fingerprint(snapshots[bar.id], engine)
+                generated = self.snapshots.load(bar.id, fingerprints[bar.id])
+                # partly generated ones are generated in full here
+                if generated is not None and len(generated) == len(self.base_recipes):
+                    log.info("Loading recipe library for {} from snapshot".format(bar.cname))
+                    self._publish(bar.id, recipes=self._loaded_recipes(generated))
+                    del snapshots[bar.id]
+        for bar in bars:
+            if bar.id in snapshots:
+                log.info("Generating recipe library for {} ({} engine)".format(bar.cname, engine))
+        results = None
+        if workers > 1:
+            try:
+                results = generate_in_pool(items, snapshots, engine, workers, self.max_combinations,
+                        start_method=self.generation_start_method)
+            except Exception as err:
+                log.warning("Parallel recipe generation failed, falling back to serial: {}: {}".format(err.__class__.__name__, err))
+        if results is None:
+            results = {bar_id: generate_partition(items, barstock, engine, self.max_combinations) for bar_id, barstock in snapshots.items()}
+        for bar_id, generated in results.items():
+            recipes = [DrinkRecipe(name, self.base_recipes[name]).load_examples(data) for name, data in generated]
+            library = self._publish(bar_id, recipes=recipes)
+            # the stats are all here already, so the sort orders and snapshot are cheap now
+            for attr in SORTABLE_STATS:
+                library.sort_order(attr)
+            if self.snapshots is not None:
+                self._save_snapshot(library, fingerprints[bar_id], background=False)
+
+    def regenerate_recipes(self, bar, ingredient=None, recipe_name=None, category=None):
+        """Regenerate the examples and statistics data for the recipes at the given bar,
+        the work happens on demand the next time each recipe is read.
+        Affected recipes are rebuilt and published in a new library snapshot,
+        the current one is left untouched for any requests still using it.
+        With a shared cache, they replace those in the latest shared library, and
+        are generated and shared holding the bar's lease, so edits made through
+        different workers don't undo each other
+        :param string ingredient: only updates recipes that can use this stock type
         :param string reipce_name: only updates the given recipe
+        :param string category: Category of the ingredient stock type, if known
         """
+        if self.shared_libraries is None:
+            return self._regenerate_recipes(bar, self._libraries.get(bar.id), ingredient, recipe_name, category)
+        token = self._wait_for_lease(bar.id)
+        try:
+            # this worker's copy may be older than edits made through another one
+            library = self._load_shared(bar.id, self._libraries.get(bar.id))
+            self._regenerate_recipes(bar, library, ingredient, recipe_name, category, lease=token)
+        finally:
+            if token is not None:
+                self.shared_libraries.release(bar.id, token)
+
+    def _regenerate_recipes(self, bar, library, ingredient, recipe_name, category, lease=None):
+        engine = self.example_engine
+        if library is None or not (ingredient or recipe_name):
+            if library is not None:
+                log.info("Regenerating recipe library for {}".format(bar.cname))
+            self.generate_recipes(bar)
+            return
         if ingredient:
-            log.info("Updating recipes containing {} for {}".format(ingredient, bar.cname))
-            [recipe.generate_examples(Barstock_SQL(bar.id), stats=True) for recipe in self.processed_recipes(bar)
-                            if recipe.contains_ingredient(ingredient)]
-        elif recipe_name:
-            recipe = find_recipe(bar, recipe_name)
-            if recipe is None:
-                log.info("Error: no recipe found matching name \"{}\"".format(recipe_name))
-            log.info("Updating recipe {} at {}".format(recipe, bar.cname))
-            recipe.generate_examples(Barstock_SQL(bar.id), stats=True)
+            names = [name for name in self.recipe_dependencies.recipes_using(ingredient, category)
+                    if name in library.by_name]
+            log.info("Updating {} recipes that can use {} for {}".format(len(names), ingredient, bar.cname))
         else:
-            log.info("Regenerating recipe library for {}".format(bar.cname))
-            [recipe.generate_examples(Barstock_SQL(bar.id), stats=True) for recipe in self.processed_recipes(bar)]
+            if recipe_name not in library.by_name:
+                log.info("Error: no recipe found matching name \"{}\"".format(recipe_name))
+                return
+            names = [recipe_name]
+            log.info("Updating recipe {} at {}".format(recipe_name, bar.cname))
+        barstock = Barstock_Snapshot.load(bar.id)
+        replaced = {name: DrinkRecipe(name, self.base_recipes[name]).defer_examples(barstock, stats=True,
+                    engine=engine, max_combinations=self.max_combinations)
+                for name in names}
+        library = self._publish(bar.id, replaced=replaced, lease=lease)
+        if library is not None and self.snapshots is not None:
+            self._save_snapshot(library, self._fingerprint(barstock, engine))
 
 BarConfig = namedtuple("BarConfig", "id,cname,name,tagline,owner,bartender,markup,prices,stats,examples,convert,prep_line,origin,info,variants,summarize,is_closed,is_public")
+# what the nav needs to list the other bars
+BarListing = namedtuple("BarListing", "id,cname,name,is_public,is_default,owner_id")
+
+class BarUser(object):
+    """ The parts of a User that a BarConfig uses, as plain data that can be kept
+    between requests. Compares equal to the User with the same id, e.g. current_user
+    """
+    __slots__ = ('id', 'email', 'first_name', 'last_name', 'nickname')
+
+    def __init__(self, user):
+        for attr in self.__slots__:
+            setattr(self, attr, getattr(user, attr))
+
+    def get_name(self, short=False):
+        return User.get_name(self, short=short)
+
+    def get_name_with_email(self):
+        return User.get_name_with_email(self)
+
+    def __eq__(self, other):
+        return self.id == getattr(other, 'id', None)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+class BarConfigCache(object):
+    """ Every bar's BarConfig and the bar list, loaded with two queries and kept
+    until a version counter moves on, or they're older than max_age seconds.
+    Writes to bars, or to the users that own or tend them, call invalidate()
+    """
+    VERSION_KEY = 'mixmind:bars:version'
+    State = namedtuple('State', 'version,loaded_at,bars,configs,default_ids')
+
+    def __init__(self, shared_cache=None, max_age=30):
+        self._local_version = 0
+        self._state = None
+        self._lock = threading.Lock()
+        self.configure(shared_cache, max_age)
+
+    def configure(self, shared_cache=None, max_age=30):
+        """
+        :param shared_cache: keeps the version when there are several workers, see shared_cache
+        :param int max_age: seconds, a backstop for writes no worker was told about
+        """
+        self.shared_cache = shared_cache
+        self.max_age = max_age
+        self._state = None
+
+    def version(self):
+        if self.shared_cache is not None:
+            value = self.shared_cache.get(self.VERSION_KEY)
+            return int(value) if value else 0
+        return self._local_version
+
+    def invalidate(self):
+        with self._lock:
+            self._local_version += 1
+            self._state = None
+        if self.shared_cache is not None:
+            self.shared_cache.incr(self.VERSION_KEY)
+
+    def current(self):
+        """ The State for the current version, loaded if it isn't already
+        """
+        state = self._state
+        version = self.version()
+        if state is None or state.version != version or time.time() - state.loaded_at > self.max_age:
+            state = self._load(version)
+            self._state = state
+        return state
+
+    def _load(self, version):
+        bars = Bar.query.all()
+        user_ids = set(bar.owner_id for bar in bars) | set(bar.bartender_on_duty for bar in bars)
+        user_ids.discard(None)
+        users = {user.id: BarUser(user) for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+        configs = {}
+        for bar in bars:
+            bartender = users.get(bar.bartender_on_duty)
+            configs[bar.id] = BarConfig(id=bar.id, cname=bar.cname, name=bar.name,
+                    tagline=bar.tagline, owner=users.get(bar.owner_id), bartender=bartender, markup=bar.markup,
+                    prices=bar.prices, stats=bar.stats, examples=bar.examples, convert=bar.convert,
+                    prep_line=bar.prep_line, origin=bar.origin, info=bar.info, variants=bar.variants,
+                    summarize=bar.summarize, is_closed=not bartender, is_public=bar.is_public)
+        listing = tuple(BarListing(id=bar.id, cname=bar.cname, name=bar.name, is_public=bar.is_public,
+                is_default=bar.is_default, owner_id=bar.owner_id) for bar in bars)
+        return self.State(version, time.time(), listing, configs, [bar.id for bar in bars if bar.is_default])
+
+bar_configs = BarConfigCache()
 
 def get_bar_config():
     """ For now, only one bar bay me "active" at a time
     """
+    if 'bar_list' in g and 'current_bar' in g:
+        return g.current_bar
+    # one snapshot for both, so they agree even if the cache reloads in between
+    state = bar_configs.current()
     if 'bar_list' not in g:
-        # HAX just putting it here for now to get initialized
-        g.bar_list = Bar.query.all()
+        g.bar_list = state.bars
     if 'current_bar' not in g:
-        bar = None
+        config = None
         if current_user.is_authenticated and current_user.current_bar_id:
-            bar = Bar.query.filter_by(id=current_user.current_bar_id).one_or_none()
-        if not bar:
-            default_list = Bar.query.filter_by(is_default=True).all()
-            if len(default_list) == 0:
+            config = state.configs.get(current_user.current_bar_id)
+        if not config:
+            if len(state.default_ids) == 0:
                 flash("No bars currently set to default!", 'danger')
                 raise RuntimeError("No bar set to default in the database - must be at least one.")
-            elif len(default_list) > 1:
+            elif len(state.default_ids) > 1:
                 flash("More than one bar is set to default, using first one", 'danger')
-            bar = default_list[0]
-        bartender = User.query.filter_by(id=bar.bartender_on_duty).one_or_none()
-        g.current_bar = BarConfig(id=bar.id, cname=bar.cname, name=bar.name,
-                tagline=bar.tagline, owner=bar.owner, bartender=bartender, markup=bar.markup,
-                prices=bar.prices, stats=bar.stats, examples=bar.examples, convert=bar.convert,
-                prep_line=bar.prep_line, origin=bar.origin, info=bar.info, variants=bar.variants,
-                summarize=bar.summarize, is_closed=not bartender, is_public=bar.is_public)
+            config = state.configs[state.default_ids[0]]
+        g.current_bar = config
     return g.current_bar
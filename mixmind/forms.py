@@ -1,7 +1,7 @@
 """
 Definitions of the various forms used
 """
-from wtforms import validators, widgets, Form, Field, FormField, FieldList, TextField, TextAreaField, BooleanField, DecimalField, IntegerField, SelectField, SelectMultipleField, FileField, PasswordField, StringField, SubmitField, HiddenField, compat
+from wtforms import validators, widgets, Form, Field, FormField, FieldList, TextField, TextAreaField, BooleanField, DecimalField, IntegerField, SelectField, SelectMultipleField, FileField, PasswordField, StringField, SubmitField, HiddenField, DateField, compat
 from flask import g
 
 from .models import User
@@ -270,9 +270,25 @@ class EditBarForm(BaseForm):
     edit_bar = SubmitField("Commit Changes", render_kw={"class": "btn btn-primary"})
 
 class SetBarOwnerForm(BaseForm):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, users=None, **kwargs):
+        """ :param list users: to choose from, if they're loaded already
+        """
         super(SetBarOwnerForm, self).__init__(*args, **kwargs)
-        choices = [('', '')]+[(user.email, user.get_name_with_email()) for user in User.query.all()]
+        users = User.query.all() if users is None else users
+        choices = [('', '')]+[(user.email, user.get_name_with_email()) for user in users]
         self.owner.choices = choices
     owner = SelectField("Assign Bar Owner", description="Assign an owner who can manage the bar's stock and settings", choices=[])
     submit = SubmitField("Commit Changes", render_kw={"class": "btn btn-primary"})
+
+class OrderFilterForm(BaseForm):
+    """ Filters for the order history, submitted with GET so they
+    carry over to the urls for the pages after the first
+    """
+    def __init__(self, *args, **kwargs):
+        super(OrderFilterForm, self).__init__(*args, **kwargs)
+        self.bar_id.choices = [('', 'All')]+[(str(bar.id), bar.name) for bar in g.bar_list]
+    bar_id = SelectField("Bar", choices=[], default='')
+    since = DateField("From", validators=[validators.Optional()], render_kw={"type": "date"})
+    until = DateField("To", validators=[validators.Optional()], render_kw={"type": "date"})
+    confirmed = SelectField("Confirmed", default='', choices=[('', 'Any'), ('yes', 'Confirmed'), ('no', 'Unconfirmed')])
+    filter_orders = SubmitField("Filter", render_kw={"class": "btn btn-primary"})
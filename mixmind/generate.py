@@ -0,0 +1,141 @@
+""" Recipe library generation that can run in worker processes
+Nothing here imports the app, so a spawned worker only loads what
+generating examples needs, see generate_in_pool
+"""
+import hashlib
+import itertools
+import multiprocessing
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .recipe import DrinkRecipe
+from .type_resolver import get_resolver
+
+# fork would copy the server's threads and locks mid-use, spawn starts clean
+START_METHOD = 'spawn'
+
+# the fields of an Ingredient row that recipe generation needs
+StockRow = namedtuple('StockRow', 'Category,Type,type_,Kind,ABV,Cost_per_mL,Cost_per_cL,Cost_per_oz')
+
+class Barstock_Snapshot(object):
+    """ In-memory copy of a bar's in stock ingredients, loaded with a single query
+    Answers the same lookups as Barstock_SQL without going back to the database,
+    and holds only plain data so it can be pickled
+    """
+    def __init__(self, bar_id, rows):
+        self.bar_id = bar_id
+        self._by_type = OrderedDict()
+        self._by_key = {}
+        for row in rows:
+            self._by_type.setdefault(row.type_, []).append(row)
+            self._by_key[(row.type_, row.Kind)] = row
+        self._rows = list(rows)
+        self._slices = {}
+        self.resolver = get_resolver(set((row.type_, row.Category) for row in self._rows))
+
+    @classmethod
+    def load(cls, bar_id):
+        # here so worker processes can unpickle snapshots without the app
+        from .ingredient import Ingredient
+        rows = Ingredient.query.filter_by(bar_id=bar_id, In_Stock=True).all()
+        return cls(bar_id, [StockRow(*(row[field] for field in StockRow._fields)) for row in rows])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def fingerprint(self):
+        """ Hash of the rows, in order, which changes whenever anything recipe
+        generation uses does
+        """
+        return hashlib.sha1(repr(self._rows).encode('utf-8')).hexdigest()
+
+    def get_kind_lists(self, specifiers):
+        """ For a given list of ingredient specifiers, return a list of lists
+        where each list is the kinds in stock for that ingredient
+        e.g. Martini passes in ['gin', 'vermouth'], gets [['Beefeater', 'Knickerbocker'], ['Noilly Prat']]
+        """
+        return [[b.Kind for b in self.slice_on_type(i)] for i in specifiers]
+
+    def get_all_kind_combinations(self, specifiers):
+        """ For a given list of ingredient specifiers, return a list of lists
+        where each list is a specific way to make the drink
+        e.g. Martini passes in ['gin', 'vermouth'], gets [['Beefeater', 'Noilly Prat'], ['Knickerbocker', 'Noilly Prat']]
+        """
+        kind_lists = self.get_kind_lists(specifiers)
+        opts = itertools.product(*kind_lists)
+        return opts
+
+    def get_kind_abv(self, ingredient):
+        return self.get_kind_field(ingredient, 'ABV')
+
+    def get_kind_category(self, ingredient):
+        return self.get_kind_field(ingredient, 'Category')
+
+    def cost_by_kind_and_volume(self, ingredient, amount, unit='oz'):
+        per_unit = self.get_kind_field(ingredient, 'Cost_per_{}'.format(unit))
+        return per_unit * amount
+
+    def get_kind_field(self, ingredient, field):
+        if field not in StockRow._fields:
+            raise AttributeError("get-kind-field '{}' not a valid field in the data".format(field))
+        return getattr(self.get_ingredient_row(ingredient), field)
+
+    def get_ingredient_row(self, ingredient):
+        if ingredient.kind is None:
+            raise ValueError("ingredient {} has no kind specified".format(ingredient.__repr__()))
+        row = [self._by_key[(type_, ingredient.kind)] for type_ in self.resolver.resolve(ingredient.ingredient)
+                if (type_, ingredient.kind) in self._by_key]
+        if len(row) > 1:
+            raise ValueError('{} has multiple entries in the input data!'.format(ingredient.__repr__()))
+        elif len(row) < 1:
+            raise ValueError('{} has no entry in the input data!'.format(ingredient.__repr__()))
+        return row[0]
+
+    def slice_on_type(self, specifier):
+        """ Return rows matching an ingredient specifier
+        Special cases like "rum" or "any spirit" are handled by the resolver
+        """
+        type_ = specifier.ingredient.lower()
+        if type_ not in self._slices:
+            types = self.resolver.resolve(type_)
+            if len(types) == 1:
+                self._slices[type_] = self._by_type.get(types[0], [])
+            else:
+                # keep the database ordering across types
+                self._slices[type_] = [row for row in self._rows if row.type_ in types]
+        matching = self._slices[type_]
+        if specifier.kind:
+            return [row for row in matching if row.Kind == specifier.kind]
+        return matching
+
+
+def generate_partition(recipes, barstock, engine, max_combinations):
+    """Generate the examples for a slice of the recipe library, suitable to run in a worker process
+    :param list recipes: (name, recipe_dict) pairs
+    :param Barstock_Snapshot barstock: picklable stock for the bar
+    :param int max_combinations: see DrinkRecipe.generate_examples
+    :returns: list of (name, DrinkRecipe.dump_examples()) pairs
+    """
+    return [(name, DrinkRecipe(name, recipe).generate_examples(barstock, stats=True, engine=engine,
+                max_combinations=max_combinations).dump_examples())
+            for name, recipe in recipes]
+
+def partition(items, n_parts):
+    """Split a list into at most n_parts contiguous chunks of similar size"""
+    size = max(1, -(-len(items) // max(1, n_parts)))
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+def generate_in_pool(items, snapshots, engine, workers, max_combinations, start_method=START_METHOD):
+    """Fan (bar, recipe partition) tasks out over a process pool
+    :param list items: (name, recipe_dict) pairs
+    :param dict snapshots: bar_id to Barstock_Snapshot
+    :param string start_method: multiprocessing start method for the workers
+    :returns: dict of bar_id to generate_partition results, in library order
+    """
+    chunks = partition(items, workers)
+    context = multiprocessing.get_context(start_method)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {bar_id: [executor.submit(generate_partition, chunk, barstock, engine, max_combinations) for chunk in chunks]
+                for bar_id, barstock in snapshots.items()}
+        return {bar_id: [result for future in bar_futures for result in future.result()]
+                for bar_id, bar_futures in futures.items()}
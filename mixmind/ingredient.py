@@ -4,7 +4,7 @@ import urllib.request, urllib.parse, urllib.error
 import copy
 import uuid
 
-from sqlalchemy import Boolean, DateTime, Column, Integer, ForeignKey, Enum, Float, Unicode
+from sqlalchemy import Boolean, DateTime, Column, Integer, ForeignKey, Enum, Float, Unicode, Index
 from sqlalchemy_utils import UUIDType
 
 from . import util
@@ -34,7 +34,7 @@ display_name_mappings = {
 
 # TODO value constraints (e.g. 100% max abv, no negative price, etc.)
 class Ingredient(db.Model):
-    uuid       = Column(UUIDType(), default=uuid.uuid4)
+    uuid       = Column(UUIDType(), default=uuid.uuid4, index=True)
     bar_id     = Column(Integer(), ForeignKey('bar.id'), primary_key=True)
     Category   = Column(Enum(*Categories))
     Type       = Column(Unicode(length=100), primary_key=True)
@@ -50,6 +50,11 @@ class Ingredient(db.Model):
     Cost_per_cL  = Column(Float(), default=0.0)
     Cost_per_oz  = Column(Float(), default=0.0)
 
+    # queries on bar_id alone use the primary key
+    __table_args__ = (
+        Index('ix_ingredient_bar_stock', 'bar_id', 'In_Stock', 'type_', 'Category'),
+    )
+
     def as_dict(self):
         data = {'iid': self.iid()}
         for attr in 'Category Type Kind In_Stock ABV Size_mL Price_Paid Size_oz Cost_per_oz'.split(' '):
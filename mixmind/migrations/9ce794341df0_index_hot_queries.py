@@ -0,0 +1,53 @@
+"""Index the columns the hot Ingredient, Order and Bar queries filter on
+
+Revision ID: 9ce794341df0
+Revises:
+Create Date: 2026-10-18 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9ce794341df0'
+down_revision = None
+branch_labels = ('default',)
+depends_on = None
+
+# (name, table, columns), as declared on the models
+INDEXES = [
+    # covers the resolver's in stock types, and narrows the snapshot and slice_on_type
+    ('ix_ingredient_bar_stock', 'ingredient', ['bar_id', 'In_Stock', 'type_', 'Category']),
+    # Ingredient.query_by_iid
+    ('ix_ingredient_uuid', 'ingredient', ['uuid']),
+    # a bar's, or a user's orders, newest last
+    ('ix_order_bar_timestamp', 'order', ['bar_id', 'timestamp']),
+    ('ix_order_user_email_timestamp', 'order', ['user_email', 'timestamp']),
+    ('ix_order_user_timestamp', 'order', ['user_id', 'timestamp']),
+    # the default bar
+    ('ix_bar_is_default', 'bar', ['is_default']),
+]
+
+
+def _existing(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() makes these for new databases before upgrading, so only add what's missing
+    existing = {}
+    for name, table, columns in INDEXES:
+        if table not in existing:
+            existing[table] = _existing(table)
+        if name not in existing[table]:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    existing = {}
+    for name, table, columns in reversed(INDEXES):
+        if table not in existing:
+            existing[table] = _existing(table)
+        if name in existing[table]:
+            op.drop_index(name, table_name=table)
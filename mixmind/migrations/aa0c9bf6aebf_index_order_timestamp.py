@@ -0,0 +1,31 @@
+"""Index orders by timestamp for the paged order history across every bar
+
+Revision ID: aa0c9bf6aebf
+Revises: 9ce794341df0
+Create Date: 2026-10-18 19:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aa0c9bf6aebf'
+down_revision = '9ce794341df0'
+branch_labels = None
+depends_on = None
+
+
+def _exists(name, table):
+    return name in {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() makes it for new databases before upgrading
+    if not _exists('ix_order_timestamp', 'order'):
+        op.create_index('ix_order_timestamp', 'order', ['timestamp'])
+
+
+def downgrade():
+    if _exists('ix_order_timestamp', 'order'):
+        op.drop_index('ix_order_timestamp', table_name='order')
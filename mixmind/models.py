@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 from sqlalchemy.orm import relationship, backref
-from sqlalchemy import Boolean, DateTime, Column, Integer, String, ForeignKey, Enum, Float, Text, Unicode
+from sqlalchemy import Boolean, DateTime, Column, Integer, String, ForeignKey, Enum, Float, Text, Unicode, Index, and_, or_, func
+
+import datetime
+import re
+from collections import namedtuple
 
 import pendulum
 
@@ -73,6 +77,13 @@ class Order(db.Model):
     recipe_name = Column(Unicode(length=127))
     recipe_html = Column(Text())
 
+    __table_args__ = (
+        Index('ix_order_timestamp', 'timestamp'),
+        Index('ix_order_bar_timestamp', 'bar_id', 'timestamp'),
+        Index('ix_order_user_email_timestamp', 'user_email', 'timestamp'),
+        Index('ix_order_user_timestamp', 'user_id', 'timestamp'),
+    )
+
     def where(self):
         bar = Bar.query.filter_by(id=self.bar_id).one_or_none()
         if bar:
@@ -84,6 +95,73 @@ class Order(db.Model):
         diff = pendulum.instance(self.confirmed) - pendulum.instance(self.timestamp)
         return "{} minutes, {} seconds".format(diff.minutes, diff.remaining_seconds)
 
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'timestamp': str(self.timestamp),
+            'confirmed': str(self.confirmed) if self.confirmed else None,
+            'user_id': self.user_id,
+            'bar_id': self.bar_id,
+            'recipe_name': self.recipe_name,
+            }
+
+    def cursor(self):
+        """ Position of this order in the history, for Order.page's after
+        """
+        return '{}_{}'.format(self.timestamp.strftime(CURSOR_TIME_FORMAT), self.id)
+
+    @classmethod
+    def page(cls, limit, after=None, bar_id=None, since=None, until=None, confirmed=None):
+        """ Orders newest first, paged by (timestamp, id) so each page seeks
+        the timestamp indexes instead of counting past the pages before it
+        :param int limit: orders per page
+        :param str after: Order.cursor() of the last order on the previous page
+        :param int bar_id: only orders for this bar
+        :param datetime.date since: only orders on or after this day (UTC)
+        :param datetime.date until: only orders on or before this day (UTC)
+        :param bool confirmed: only orders that are, or aren't, confirmed
+        :raises ValueError: for an invalid cursor
+        """
+        query = cls.query.filter(cls.timestamp != None)
+        if bar_id is not None:
+            query = query.filter(cls.bar_id == bar_id)
+        if since is not None:
+            query = query.filter(cls.timestamp >= datetime.datetime.combine(since, datetime.time()))
+        if until is not None:
+            query = query.filter(cls.timestamp < datetime.datetime.combine(until + datetime.timedelta(days=1), datetime.time()))
+        if confirmed is not None:
+            query = query.filter(cls.confirmed != None if confirmed else cls.confirmed == None)
+        if after:
+            timestamp, order_id = parse_order_cursor(after)
+            # the <= bounds the index range, the rest breaks ties on id
+            query = query.filter(cls.timestamp <= timestamp,
+                    or_(cls.timestamp < timestamp, and_(cls.timestamp == timestamp, cls.id < order_id)))
+        orders = query.order_by(cls.timestamp.desc(), cls.id.desc()).limit(limit + 1).all()
+        more = len(orders) > limit
+        orders = orders[:limit]
+        return OrderPage(orders, orders[-1].cursor() if more else None)
+
+    @classmethod
+    def counts_by(cls, column):
+        """ {value: number of orders} for each value of the column, e.g. Order.bar_id
+        """
+        return dict(db.session.query(column, func.count(cls.id)).group_by(column))
+
+CURSOR_TIME_FORMAT = '%Y%m%dT%H%M%S.%f'
+# what Order.cursor() gives, ids are kept to what fits in a 64 bit integer column
+CURSOR_PATTERN = re.compile(r'(\d{8}T\d{6}\.\d{6})_(\d{1,18})', re.ASCII)
+# orders on one page, and the cursor for the next one, None on the last page
+OrderPage = namedtuple('OrderPage', 'orders,next')
+
+def parse_order_cursor(cursor):
+    """ (timestamp, id) from an Order.cursor()
+    :raises ValueError: for anything else
+    """
+    match = CURSOR_PATTERN.fullmatch(cursor)
+    if not match:
+        raise ValueError("Invalid order cursor: {}".format(cursor))
+    return datetime.datetime.strptime(match.group(1), CURSOR_TIME_FORMAT), int(match.group(2))
+
 
 class Bar(db.Model):
     id = Column(Integer(), primary_key=True)
@@ -91,7 +169,7 @@ class Bar(db.Model):
     name = Column(Unicode(length=63))
     tagline = Column(Unicode(length=255), default="Tips – always appreciated, never required")
     is_public = Column(Boolean(), default=False) # visible to public customers
-    is_default = Column(Boolean(), default=False) # the current default bar
+    is_default = Column(Boolean(), default=False, index=True) # the current default bar
     bartender_on_duty = Column(Integer(), ForeignKey('user.id'))
     owner_id = Column(Integer(), ForeignKey('user.id'))
     owner = relationship('User', back_populates="owns", foreign_keys=[owner_id])
@@ -0,0 +1,77 @@
+""" Whole rendered pages kept to answer repeat visits, with an ETag for 304s
+and a gzipped copy made the first time a client that accepts gzip asks
+"""
+import datetime
+import gzip
+import hashlib
+
+from flask import request, session, make_response
+
+from .compose_html import FragmentCache
+
+class CachedPage(object):
+    """ A rendered page body, its strong ETag and when it was rendered
+    """
+    __slots__ = ('body', 'etag', 'last_modified', '_gzipped')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self._gzipped = None
+
+    @property
+    def compressed(self):
+        return self._gzipped is not None
+
+    def gzipped(self):
+        """ The body gzipped, compressed on first use
+        """
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body)
+        return self._gzipped
+
+    @property
+    def size(self):
+        return len(self.body) + len(self._gzipped or b'')
+
+class PageCache(object):
+    """ LRU of CachedPage up to max_bytes, keyed the same way as FragmentCache
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.pages = FragmentCache(max_bytes)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def response(self, key, render):
+        """ Response for a page that only depends on what's in key, rendered once.
+        Answers If-None-Match and If-Modified-Since with 304, and is never cached
+        when there are flashed messages to show or the cache is turned off
+        """
+        if not self.enabled or '_flashes' in session:
+            return make_response(render())
+        page = self.pages.get(key)
+        if page is None:
+            page = CachedPage(render().encode('utf-8'))
+            self.pages.put(key, page, size=page.size)
+        use_gzip = bool(request.accept_encodings['gzip'])
+        body = page.body
+        if use_gzip:
+            compressed = page.compressed
+            body = page.gzipped()
+            if not compressed:
+                # count the compressed copy too
+                self.pages.put(key, page, size=page.size)
+        response = make_response(body)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        # strong etags have to differ between encodings
+        response.set_etag(page.etag + ('-gzip' if use_gzip else ''))
+        response.last_modified = page.last_modified
+        response.vary.update(('Accept-Encoding', 'Cookie'))
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
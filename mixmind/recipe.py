@@ -4,11 +4,20 @@ can provide itself as a dict/json, tuple of values, do conversions, etc.
 Just generally make it better OOP
 """
 import re
+import copy
 from fractions import Fraction
+from collections import namedtuple
 from recordtype import recordtype
 import itertools
+import random
 import string
 
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
 from . import util
 
 # water volume added by preperation method for ABV estimate
@@ -16,19 +25,103 @@ WATER_BY_PREP = {'shake': 1.6, 'stir': 1.3, 'build': 1.0, 'pour': 1.0}
 WATER_BY_ICE = {'cubed': 1.1, 'crushed': 1.4, 'neat': 1.0}
 
 EXAMPLE_LIMIT = 3
+# the median example is the median by cost of this many combinations, picked at random
+EXAMPLE_SAMPLE_SIZE = 101
+EXAMPLE_SAMPLE_SEED = 0
+# past this many combinations of kinds a recipe uses the closed_form engine
+MAX_COMBINATIONS = 250000
+# kinds from these categories are listed in an example, e.g. leave out juice
+EXAMPLE_CATEGORIES = ['Vermouth', 'Liqueur', 'Bitters', 'Spirit', 'Wine']
+# scalar walks every combination of kinds, numpy broadcasts over all of them at once,
+# closed_form works out the stats from each ingredient without visiting any combination
+EXAMPLE_ENGINES = ['scalar', 'numpy', 'closed_form']
+
+# everything an example needs to know about the kinds that can fill one ingredient
+KindSlot = namedtuple('KindSlot', 'kinds,costs,std_drinks,listed')
 
 class RecipeError(Exception):
     pass
 
+def count_combinations(sizes):
+    """ Number of ways to make a drink, from the kind lists for each ingredient, or their lengths
+    """
+    count = 1
+    for size in sizes:
+        count *= size if isinstance(size, int) else len(size)
+    return count
+
+def sample_indices(n_examples):
+    """ Indices of the combinations used to find the median example,
+    the same for every engine and every run
+    """
+    return random.Random(EXAMPLE_SAMPLE_SEED).sample(range(n_examples), min(n_examples, EXAMPLE_SAMPLE_SIZE))
+
+def representative_indices(n_examples, cheapest, priciest, cost_of):
+    """ Indices of the examples to keep, all of them if there are only a few,
+    otherwise the cheapest, the median and the priciest
+    :param cost_of: function to get the cost of the combination at an index in sample_indices
+    """
+    if n_examples <= EXAMPLE_LIMIT:
+        return list(range(n_examples))
+    sample = sorted(sample_indices(n_examples))
+    median = sorted(sample, key=cost_of)[(len(sample)-1)//2]
+    indices = []
+    for index in (cheapest, median, priciest):
+        if index not in indices:
+            indices.append(index)
+    return indices
+
+class ExampleSummary(object):
+    """ Running stats over a stream of examples, min and max keep the first
+    occurrence like sorting the full list would
+    """
+    def __init__(self):
+        self.count = 0
+        self.sums = {'cost': 0, 'abv': 0, 'std_drinks': 0}
+        self.min_cost = self.max_cost = None
+        self.min_abv = self.max_abv = None
+        self.min_std_drinks = self.max_std_drinks = None
+        self.volume = 0
+
+    def add(self, index, example):
+        self.count += 1
+        for attr in self.sums:
+            value = getattr(example, attr)
+            self.sums[attr] += value
+            lowest = getattr(self, 'min_'+attr)
+            if lowest is None or value < getattr(lowest[1], attr):
+                setattr(self, 'min_'+attr, (index, example))
+            highest = getattr(self, 'max_'+attr)
+            if highest is None or value > getattr(highest[1], attr):
+                setattr(self, 'max_'+attr, (index, example))
+        self.volume = max(self.volume, example.volume)
+
+    def extremes(self):
+        """ (index, example) pairs for the cheapest and priciest examples
+        """
+        return [self.min_cost, self.max_cost]
+
+    def stats(self, recipe_stats):
+        """ Fill in a DrinkRecipe.RecipeStats
+        """
+        for attr in self.sums:
+            setattr(recipe_stats, 'min_'+attr, getattr(self, 'min_'+attr)[1])
+            setattr(recipe_stats, 'max_'+attr, getattr(self, 'max_'+attr)[1])
+            setattr(recipe_stats, 'avg_'+attr, self.sums[attr] / float(self.count))
+        recipe_stats.volume = self.volume
+        return recipe_stats
+
 class DrinkRecipe(object):
     """ Initialize a drink with a handle to the available stock data and its recipe json
     """
+    __slots__ = ('name', 'info', 'style', 'tag', 'iba_info', 'origin', 'unit', 'prep', 'ice', 'glass',
+            'variants', 'ingredients', 'show_examples', '_pending', '_can_make', '_max_cost', '_examples', '_stats', '_views')
     RecipeExample = recordtype('RecipeExample', [('kinds', []), ('cost', 0), ('abv', 0), ('std_drinks', 0), ('volume', 0)])
     RecipeStats = recordtype('RecipeStats', 'min_cost,max_cost,min_abv,max_abv,min_std_drinks,max_std_drinks,avg_abv,avg_cost,avg_std_drinks,volume', default=RecipeExample)
 
-    @util.default_initializer
-    def __init__(self, name, recipe_dict, stock_df=None):
+    def __init__(self, name, recipe_dict):
         # from recipe dict pull out other info and set defaults
+        self.name      =  name
         self.info      =  recipe_dict.get('info', '')
         self.style     =  recipe_dict.get('style', '')
         self.tag       =  recipe_dict.get('tag', '')
@@ -39,6 +132,9 @@ class DrinkRecipe(object):
         self.ice       =  recipe_dict.get('ice', 'cubed') # crushed, neat
         self.glass     =  recipe_dict.get('glass', 'cocktail') # rocks, martini, flute, collins, highball
         self.variants  =  recipe_dict.get('variants',  [])
+        self._pending     =  None # (barstock, stats, engine) until examples are generated
+        self._can_make    =  None
+        self._views       =  {} # unit -> ConvertedRecipe
         self.max_cost     =  0
         self.examples     =  []
         self.ingredients  =  []
@@ -59,7 +155,7 @@ class DrinkRecipe(object):
         """
         lines = []
         lines.append(self.name)
-        lines.extend([i.str() for i in self.ingredients])
+        lines.extend(self.ingredient_lines())
         if self.variants:
             lines.append("\tVariants:")
             lines.extend(['\t'+v for v in self.variants])
@@ -79,33 +175,138 @@ class DrinkRecipe(object):
 
     @property
     def can_make(self):
+        if self._pending:
+            # every ingredient having some kind in stock is enough, don't generate yet
+            if self._can_make is None:
+                barstock = self._pending[0]
+                self._can_make = all(barstock.get_kind_lists([i.specifier for i in self._get_quantized_ingredients()]))
+            return self._can_make
         return bool(self.examples)
 
+    @property
+    def generated(self):
+        """ False while the examples and stats are waiting to be generated, see defer_examples
+        """
+        return not self._pending
+
+    @property
+    def examples(self):
+        self._resolve_examples()
+        return self._examples
+
+    @examples.setter
+    def examples(self, examples):
+        self._examples = examples
+
+    @property
+    def stats(self):
+        self._resolve_examples()
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats):
+        self._stats = stats
+
+    @property
+    def max_cost(self):
+        self._resolve_examples()
+        return self._max_cost
+
+    @max_cost.setter
+    def max_cost(self, max_cost):
+        self._max_cost = max_cost
+
+    def ingredient_lines(self):
+        """ Each ingredient as text, e.g. "1 1/2 oz dry gin"
+        """
+        return [i.str() for i in self.ingredients]
+
     def convert(self, to_unit, rounded=True, convert_nonstandard=False):
-        """ Convert the main unit of this recipe
+        """ Convert the main unit of this recipe in place,
+        use in_unit instead for recipes that are shared
         """
         if self.unit == to_unit:
             return
         for ingredient in self.ingredients:
-            ingredient.recipe_unit = to_unit
-            if ingredient.unit in ['ds', 'drop'] and not convert_nonstandard:
-                continue
-            try:
-                ingredient.convert(to_unit, rounded=rounded)
-            except NotImplementedError:
-                pass
+            _convert_ingredient(ingredient, to_unit, rounded, convert_nonstandard)
         self.unit = to_unit
+        self._views = {}
 
-    def generate_examples(self, barstock, stats=False):
+    def in_unit(self, unit):
+        """ Read-only view of this recipe with its amounts in the given unit,
+        made once and then shared, this recipe isn't changed
+        :param str unit: oz, mL or cL, None for the recipe's own unit
+        """
+        unit = unit or self.unit
+        view = self._views.get(unit)
+        if view is None:
+            view = ConvertedRecipe(self, unit)
+            self._views[unit] = view
+        return view
+
+    def generate_examples(self, barstock, stats=False, engine='scalar', max_combinations=MAX_COMBINATIONS):
         """ Given a Barstock, calculate examples drinks from the data
         e.g. For every dry gin and vermouth in Barstock, generate every Martini
         that can be made, along with the cost,abv,std_drinks from the ingredients
+        :param str engine: one of EXAMPLE_ENGINES, numpy falls back to scalar if not installed
+        :param int max_combinations: recipes with more combinations of kinds than this
+            use the closed_form engine instead of enumerating them
+        """
+        if engine not in EXAMPLE_ENGINES:
+            raise RecipeError("Unknown example engine: {}".format(engine))
+        self._pending = None
+        self._can_make = None
+        self.stats = None # stale after a stock change
+        if engine == 'closed_form':
+            self._generate_examples_closed_form(barstock, stats)
+        elif engine == 'numpy' and has_numpy:
+            self._generate_examples_numpy(barstock, stats, max_combinations)
+        else:
+            self._generate_examples_scalar(barstock, stats, max_combinations)
+        return self # so it can be used when chained
+
+    def defer_examples(self, barstock, stats=False, engine='scalar', max_combinations=MAX_COMBINATIONS):
+        """ Same as generate_examples, but the work waits until examples, stats
+        or max_cost are first read. Calling again, e.g. after a stock change,
+        drops anything already generated
+        """
+        if engine not in EXAMPLE_ENGINES:
+            raise RecipeError("Unknown example engine: {}".format(engine))
+        self._pending = (barstock, stats, engine, max_combinations)
+        self._can_make = None
+        self._max_cost = 0
+        self._examples = []
+        self._stats = None
+        return self # so it can be used when chained
+
+    def _resolve_examples(self):
+        pending = self._pending
+        if pending:
+            # generate on a copy, and only clear _pending once the results are all in place,
+            # so another thread reading meanwhile generates its own rather than seeing partial results
+            barstock, stats, engine, max_combinations = pending
+            generated = copy.copy(self).generate_examples(barstock, stats=stats, engine=engine, max_combinations=max_combinations)
+            self._max_cost, self._examples, self._stats = generated._max_cost, generated._examples, generated._stats
+            self._pending = None
+
+    def _generate_examples_scalar(self, barstock, stats, max_combinations):
+        """ Streams every combination of kinds, only holding on to the running
+        stats and the examples that can still be kept, so memory stays the same
+        however many kinds are in stock
         """
         ingredients = self._get_quantized_ingredients()
-        example_kinds = barstock.get_all_kind_combinations((i.specifier for i in ingredients))
-        del self.examples # need to make possible to run again
+        kind_lists = barstock.get_kind_lists([i.specifier for i in ingredients])
+        n_examples = count_combinations(kind_lists)
         self.examples = []
-        for kinds in example_kinds:
+        if not n_examples:
+            return
+        if n_examples > max_combinations:
+            return self._generate_examples_closed_form(barstock, stats)
+        volume = self._example_volume()
+        sample = set(sample_indices(n_examples))
+        summary = ExampleSummary()
+        kept = {}
+        for index, kinds in enumerate(itertools.product(*kind_lists)):
             # TODO refactor to generate IngredientSpecifiers for the kind lists
             example = DrinkRecipe.RecipeExample(); example.kinds = []
             for kind, ingredient in zip(kinds, ingredients):
@@ -113,28 +314,198 @@ class DrinkRecipe(object):
                     continue
                 example.cost       += ingredient.get_cost(kind, barstock)
                 example.std_drinks += ingredient.get_std_drinks(kind, barstock)
-                example.volume     += ingredient.get_amount_as(self.unit, rounded=False, single_value=True)
                 # remove juice and such from the kinds listed
-                if barstock.get_kind_category(util.IngredientSpecifier(ingredient.specifier.ingredient, kind)) in ['Vermouth', 'Liqueur', 'Bitters', 'Spirit', 'Wine']:
+                if barstock.get_kind_category(util.IngredientSpecifier(ingredient.specifier.ingredient, kind)) in EXAMPLE_CATEGORIES:
                     example.kinds.append(kind)
             example.kinds = ', '.join(example.kinds);
-            example.volume *= WATER_BY_PREP.get(self.prep, 1.0)
-            example.volume *= WATER_BY_ICE.get(self.ice, 1.0)
+            example.volume = volume
             example.abv = util.calculate_abv(example.std_drinks, example.volume, self.unit)
-            self.max_cost = max(self.max_cost, example.cost)
-            self.examples.append(example)
-        if stats and self.examples:
-            self.calculate_stats()
+            summary.add(index, example)
+            if index in sample:
+                kept[index] = example
+        kept.update(summary.extremes())
+        self.max_cost = max(self.max_cost, summary.max_cost[1].cost)
+        if stats:
+            self.stats = summary.stats(self.RecipeStats())
+            # attempting to use an average here instead of max_cost
+            self.max_cost = self.stats.avg_cost
+        indices = representative_indices(n_examples, summary.min_cost[0], summary.max_cost[0],
+                lambda i: kept[i].cost)
+        self.examples = [kept[i] for i in indices]
+
+    def _generate_examples_numpy(self, barstock, stats, max_combinations):
+        """ Same results as the scalar engine, but each kind is looked up once
+        and the totals for every combination come from broadcasting the
+        per-ingredient arrays against each other. Only the examples that are
+        kept (or referenced by the stats) get built as RecipeExamples
+        """
+        slots, volume = self._gather_kind_slots(barstock)
+        shape = [len(slot.kinds) for slot in slots]
+        self.examples = []
+        n_examples = count_combinations(shape)
+        if not n_examples:
+            return
+        if n_examples > max_combinations:
+            return self._generate_examples_closed_form(barstock, stats, gathered=(slots, volume))
+        cost = np.zeros(shape)
+        std_drinks = np.zeros(shape)
+        for axis, slot in enumerate(slots):
+            # ravel order of the result matches the itertools.product ordering
+            axis_shape = [1] * len(shape)
+            axis_shape[axis] = shape[axis]
+            cost += np.array(slot.costs).reshape(axis_shape)
+            std_drinks += np.array(slot.std_drinks).reshape(axis_shape)
+        cost = cost.ravel()
+        std_drinks = std_drinks.ravel()
+        abv = util.calculate_abv(std_drinks, volume, self.unit)
+        self.max_cost = max(self.max_cost, float(cost.max()))
+
+        def _example(i):
+            return self._build_example(slots, np.unravel_index(i, shape), cost[i], abv[i], std_drinks[i], volume)
+        if stats:
+            def _mean(values):
+                # summed like the scalar engine so the results are identical
+                return sum(values.tolist()) / float(n_examples)
+            self.stats = self.RecipeStats()
+            self.stats.min_cost = _example(cost.argmin())
+            self.stats.max_cost = _example(cost.argmax())
+            self.stats.min_abv = _example(abv.argmin())
+            self.stats.max_abv = _example(abv.argmax())
+            self.stats.min_std_drinks = _example(std_drinks.argmin())
+            self.stats.max_std_drinks = _example(std_drinks.argmax())
+            self.stats.volume = volume
+            self.stats.avg_cost = _mean(cost)
+            self.stats.avg_abv = _mean(abv)
+            self.stats.avg_std_drinks = _mean(std_drinks)
+            # attempting to use an average here instead of max_cost
+            self.max_cost = self.stats.avg_cost
+        indices = representative_indices(n_examples, int(cost.argmin()), int(cost.argmax()), lambda i: cost[i])
+        self.examples = [_example(i) for i in indices]
+
+    def _generate_examples_closed_form(self, barstock, stats, gathered=None):
+        """ Cost and std drinks add up across the ingredients, so their extremes
+        and means follow from each ingredient's own extremes and means. The volume
+        is the same for every example, so ABV goes up and down with std drinks.
+        Only the examples that are kept (or referenced by the stats) get built,
+        the combinations themselves are never enumerated
+        :param gathered: output of _gather_kind_slots, if it's already been called
+        """
+        slots, volume = gathered or self._gather_kind_slots(barstock)
+        shape = [len(slot.kinds) for slot in slots]
+        self.examples = []
+        n_examples = count_combinations(shape)
+        if not n_examples:
+            return
+
+        def _totals(indices):
+            cost = std_drinks = 0
+            for slot, i in zip(slots, indices):
+                cost += slot.costs[i]
+                std_drinks += slot.std_drinks[i]
+            return cost, std_drinks
+        def _example(indices):
+            cost, std_drinks = _totals(indices)
+            abv = util.calculate_abv(std_drinks, volume, self.unit)
+            return self._build_example(slots, indices, cost, abv, std_drinks, volume)
+        def _pick(attr, fn):
+            # first occurrence, to agree with the enumerating engines on ties
+            return [values.index(fn(values)) for values in (getattr(slot, attr) for slot in slots)]
+        def _mean(attr):
+            return sum(sum(getattr(slot, attr)) / float(len(slot.kinds)) for slot in slots)
+        def _ravel(indices):
+            index = 0
+            for size, i in zip(shape, indices):
+                index = index * size + i
+            return index
+
+        min_cost = _example(_pick('costs', min))
+        max_cost = _example(_pick('costs', max))
+        self.max_cost = max(self.max_cost, max_cost.cost)
+        if stats:
+            self.stats = self.RecipeStats()
+            self.stats.min_cost = min_cost
+            self.stats.max_cost = max_cost
+            self.stats.min_std_drinks = _example(_pick('std_drinks', min))
+            self.stats.max_std_drinks = _example(_pick('std_drinks', max))
+            self.stats.min_abv = self.stats.min_std_drinks
+            self.stats.max_abv = self.stats.max_std_drinks
+            self.stats.volume = volume
+            self.stats.avg_cost = _mean('costs')
+            self.stats.avg_std_drinks = _mean('std_drinks')
+            self.stats.avg_abv = util.calculate_abv(self.stats.avg_std_drinks, volume, self.unit)
             # attempting to use an average here instead of max_cost
             self.max_cost = self.stats.avg_cost
-        # Apply a limit on the number of examples used
-        if len(self.examples) > EXAMPLE_LIMIT:
-            # TODO grabbing spaced indicies
-            self.examples = [self.examples[0],
-                    self.examples[(len(self.examples)-1)//2],
-                    self.examples[len(self.examples)-1]]
+        indices = representative_indices(n_examples, _ravel(_pick('costs', min)), _ravel(_pick('costs', max)),
+                lambda i: _totals(self._unravel_index(i, shape))[0])
+        self.examples = [_example(self._unravel_index(i, shape)) for i in indices]
+
+    @staticmethod
+    def _unravel_index(index, shape):
+        """ Kind indices of the index-th combination, in itertools.product order
+        """
+        indices = []
+        for size in reversed(shape):
+            index, i = divmod(index, size)
+            indices.append(i)
+        return indices[::-1]
+
+    def dump_examples(self):
+        """ Compact, picklable copy of the generated examples and stats,
+        e.g. for returning results from a worker process
+        """
+        stats = None
+        if self.stats:
+            stats = tuple(tuple(value) if isinstance(value, DrinkRecipe.RecipeExample) else value
+                    for value in self.stats)
+        return (self.max_cost, [tuple(example) for example in self.examples], stats)
+
+    def load_examples(self, data):
+        """ Restore examples and stats from the output of dump_examples
+        """
+        max_cost, examples, stats = data
+        self.max_cost = max_cost
+        self.examples = [DrinkRecipe.RecipeExample(*example) for example in examples]
+        self.stats = None
+        if stats:
+            self.stats = self.RecipeStats(*(DrinkRecipe.RecipeExample(*value) if isinstance(value, tuple) else value
+                    for value in stats))
         return self # so it can be used when chained
 
+    def _gather_kind_slots(self, barstock):
+        """ Look up each kind that can fill each quantized ingredient exactly once
+        :returns: list of KindSlot, one per quantized ingredient, and the diluted
+            volume of the drink, which is the same for every example
+        """
+        ingredients = self._get_quantized_ingredients()
+        kind_lists = barstock.get_kind_lists([i.specifier for i in ingredients])
+        slots = []
+        for kinds, ingredient in zip(kind_lists, ingredients):
+            if ingredient.unit == 'literal':
+                slots.append(KindSlot(kinds, [0.0]*len(kinds), [0.0]*len(kinds), [False]*len(kinds)))
+                continue
+            slots.append(KindSlot(kinds,
+                [ingredient.get_cost(kind, barstock) for kind in kinds],
+                [ingredient.get_std_drinks(kind, barstock) for kind in kinds],
+                [barstock.get_kind_category(util.IngredientSpecifier(ingredient.specifier.ingredient, kind)) in EXAMPLE_CATEGORIES
+                    for kind in kinds]))
+        return slots, self._example_volume()
+
+    def _example_volume(self):
+        """ Diluted volume of the drink in the recipe's unit, the same for every example
+        """
+        volume = sum(i.amount_mL for i in self._get_quantized_ingredients() if i.unit != 'literal')
+        volume = util.convert_units(volume, 'mL', self.unit)
+        volume *= WATER_BY_PREP.get(self.prep, 1.0)
+        volume *= WATER_BY_ICE.get(self.ice, 1.0)
+        return volume
+
+    def _build_example(self, slots, indices, cost, abv, std_drinks, volume):
+        """ Build the RecipeExample that uses kind indices[i] for each slot i
+        """
+        kinds = [slot.kinds[i] for slot, i in zip(slots, indices) if slot.listed[i]]
+        return DrinkRecipe.RecipeExample(kinds=', '.join(kinds), cost=float(cost),
+                abv=float(abv), std_drinks=float(std_drinks), volume=volume)
+
     def calculate_stats(self):
         """ After generating examples, calculate stats for this drink
         """
@@ -163,31 +534,105 @@ class DrinkRecipe(object):
         max_amount = 0
         max_ingredient = None
         for i in self._get_quantized_ingredients(): # TODO enforce ingredient Category tags
-            amount = i.get_amount_as(self.unit, rounded=False, single_value=True)
-            if amount > max_amount and not i.top_with:
-                max_amount = amount
+            if i.unit == 'literal':
+                continue
+            if i.amount_mL > max_amount and not i.top_with:
+                max_amount = i.amount_mL
                 max_ingredient = i.specifier.ingredient
         return max_ingredient
 
     def first_ingredient(self):
         return self.ingredients[0].specifier
 
+    def stock_dependencies(self):
+        """ Names of the ingredients whose stock determines the examples
+        """
+        return [i.specifier.ingredient for i in self._get_quantized_ingredients()]
+
     def contains_ingredient(self, ingredient, include_optional=False):
         ingredients = self.ingredients if include_optional else self._get_quantized_ingredients()
         return any((ingredient in i for i in ingredients))
 
+    def ingredient_search_text(self, include_optional=False):
+        """ Every piece of text contains_ingredient checks for a substring
+        """
+        ingredients = self.ingredients if include_optional else self._get_quantized_ingredients()
+        return [text for i in ingredients for text in i.search_text()]
+
     def _get_quantized_ingredients(self, include_optional=False):
         return [i for i in self.ingredients if type(i) == QuantizedIngredient]
 
+class ConvertedRecipe(DrinkRecipe):
+    """ What DrinkRecipe.in_unit gives, a copy of the recipe with converted
+    amounts and its ingredient lines formatted up front. Examples and stats are
+    read from the source recipe, they aren't affected by the unit shown
+    """
+    __slots__ = ('_source', '_lines')
+
+    def __init__(self, source, unit):
+        for attr in ('name', 'info', 'style', 'tag', 'iba_info', 'origin', 'prep', 'ice', 'glass', 'variants', 'show_examples'):
+            setattr(self, attr, getattr(source, attr))
+        self._source = source
+        self._pending = None
+        self._can_make = None
+        self._views = {}
+        self.unit = unit
+        self.ingredients = [copy.copy(i) for i in source.ingredients]
+        if unit != source.unit:
+            for ingredient in self.ingredients:
+                _convert_ingredient(ingredient, unit, True, False)
+        self._lines = tuple(i.str() for i in self.ingredients)
+
+    @property
+    def can_make(self):
+        return self._source.can_make
+
+    @property
+    def generated(self):
+        return self._source.generated
+
+    @property
+    def examples(self):
+        return self._source.examples
+
+    @property
+    def stats(self):
+        return self._source.stats
+
+    @property
+    def max_cost(self):
+        return self._source.max_cost
+
+    def ingredient_lines(self):
+        return list(self._lines)
+
+    def in_unit(self, unit):
+        return self._source.in_unit(unit)
+
+    def convert(self, *args, **kwargs):
+        raise RecipeError("{} is read-only, use in_unit".format(self.__repr__()))
+
+def _convert_ingredient(ingredient, to_unit, rounded, convert_nonstandard):
+    ingredient.recipe_unit = to_unit
+    if ingredient.unit in ['ds', 'drop'] and not convert_nonstandard:
+        return
+    try:
+        ingredient.convert(to_unit, rounded=rounded)
+    except NotImplementedError:
+        pass
+
 class Ingredient(object):
     """ An "ingredient" is every item that should be represented in standard text
     """
+    __slots__ = ('description', 'unit', 'recipe_unit', 'specifier')
+
     def _repr_fmt(self):
         return "<{}[{{}}]>".format(self.__class__.__name__)
 
-    @util.default_initializer
     def __init__(self, description):
+        self.description = description
         self.unit = None
+        self.recipe_unit = None
         self.specifier = util.IngredientSpecifier(description)
 
     def str(self):
@@ -197,7 +642,12 @@ class Ingredient(object):
         return self._repr_fmt().format(self.description)
 
     def __contains__(self, item):
-        return item in self.description.lower()
+        return any(item in text for text in self.search_text())
+
+    def search_text(self):
+        """ The lowercase text that "in" matches against
+        """
+        return [self.description.lower()]
 
     def convert(self, *args, **kwargs):
         pass
@@ -206,6 +656,8 @@ class Ingredient(object):
 class Garnish(Ingredient):
     """ An ingredient line that denotes it's a garnish
     """
+    __slots__ = ()
+
     def str(self):
         return "{}, for garnish".format(super(Garnish, self).str())
 
@@ -218,11 +670,15 @@ class QuantizedIngredient(Ingredient):
     type_str: as written in the recipe, may be in the form ingredient:kind
     ingredient: identify an ingredient, e.g. rye whiskey
     kind: specify an ingredient, e.g. Bulliet Rye
+    amount_mL: parsed once when the recipe is loaded, the midpoint for a range,
+        what examples are calculated from no matter what unit it's displayed in
     TODO: support quantized unit that is a number of items (basil leaves, raspberries, etc.)
         - may need to use regex to match against "3-4"
     """
-    @util.default_initializer
+    __slots__ = ('amount', 'top_with', 'amount_mL')
+
     def __init__(self, type_str, raw_quantity, recipe_unit):
+        self.recipe_unit = recipe_unit
         self.top_with = False
         self.specifier = util.IngredientSpecifier.from_string(type_str)
 
@@ -271,10 +727,16 @@ class QuantizedIngredient(Ingredient):
         else:
             self.amount = raw_quantity
             self.unit = recipe_unit
+        self.amount_mL = None
+        if self.unit != 'literal':
+            # by way of the recipe unit, which is what examples have always been calculated in
+            self.amount_mL = util.convert_units(self.get_amount_as(recipe_unit, rounded=False, single_value=True), recipe_unit, 'mL')
 
-    def __contains__(self, item):
-        return item in self.specifier.ingredient.lower() or \
-             (self.specifier.kind and item in self.specifier.kind.lower())
+    def search_text(self):
+        texts = [self.specifier.ingredient.lower()]
+        if self.specifier.kind:
+            texts.append(self.specifier.kind.lower())
+        return texts
 
     def __repr__(self):
         return super(QuantizedIngredient, self)._repr_fmt().format("{},{},{}".format(self.amount, self.unit, self.specifier))
@@ -288,12 +750,13 @@ class QuantizedIngredient(Ingredient):
     def get_amount_as(self, new_unit, rounded=True, single_value=False):
         if self.unit == 'literal':
             return
+        factor = util.unit_factor(self.unit, new_unit, rounded=rounded)
         if isinstance(self.amount, tuple):
-            lower  = util.convert_units(self.amount[0], self.unit, new_unit, rounded=rounded)
-            higher = util.convert_units(self.amount[1], self.unit, new_unit, rounded=rounded)
+            lower  = float(self.amount[0]) * factor
+            higher = float(self.amount[1]) * factor
             amount = (lower+higher)/2.0 if single_value else (lower, higher)
         else:
-            amount = util.convert_units(self.amount, self.unit, new_unit, rounded=rounded)
+            amount = float(self.amount) * factor
         return amount
 
     def str(self):
@@ -344,20 +807,20 @@ class QuantizedIngredient(Ingredient):
     def get_cost(self, kind, barstock):
         if self.unit == 'literal':
             return 0
-        amount = self.get_amount_as(self.recipe_unit, rounded=False, single_value=True)
-        return barstock.cost_by_kind_and_volume(util.IngredientSpecifier(self.specifier.ingredient, kind), amount, self.recipe_unit)
+        return barstock.cost_by_kind_and_volume(util.IngredientSpecifier(self.specifier.ingredient, kind), self.amount_mL, 'mL')
 
     def get_std_drinks(self, kind, barstock):
         if self.unit == 'literal':
             return 0
-        amount = self.get_amount_as(self.recipe_unit, rounded=False, single_value=True)
         abv = barstock.get_kind_abv(util.IngredientSpecifier(self.specifier.ingredient, kind))
-        return util.calculate_std_drinks(abv, amount, self.recipe_unit)
+        return util.calculate_std_drinks(abv, self.amount_mL, 'mL')
 
 
 class OptionalIngredient(QuantizedIngredient):
     """ A quantized ingredient that just gets an extra output tag
     """
+    __slots__ = ()
+
     def str(self):
         return "{}, (optional)".format(super(OptionalIngredient, self).str())
 
@@ -0,0 +1,115 @@
+""" Inverted index over the text filter_recipes searches, so a search is
+a few set lookups instead of a substring test on every recipe.
+Matches are exactly the substring matches of a scan, the index only narrows
+down which pieces of text need checking.
+Each recipe gets a dense integer id, and matches are bitmaps of those ids
+(Python ints, bit n set for recipe n) so facets combine with & and |
+"""
+
+def _attribute(attr):
+    return lambda recipe: [(getattr(recipe, attr) or '').lower()]
+
+# fields that can be searched, and how to get the text for each from a DrinkRecipe
+SEARCH_FIELDS = {
+        'ingredients':          lambda recipe: recipe.ingredient_search_text(include_optional=True),
+        'required_ingredients': lambda recipe: recipe.ingredient_search_text(include_optional=False),
+        'style':                _attribute('style'),
+        'glass':                _attribute('glass'),
+        'prep':                 _attribute('prep'),
+        'ice':                  _attribute('ice'),
+        'tag':                  _attribute('tag'),
+        }
+
+# every gram up to this long is indexed, so shorter terms are answered
+# by their own postings, longer terms by intersecting their trigrams
+GRAM_SIZE = 3
+
+def grams(text, size):
+    return set(text[i:i+size] for i in range(len(text) - size + 1))
+
+def bits(bitmap):
+    """ The ids set in the bitmap, in increasing order
+    """
+    ids = []
+    while bitmap:
+        low = bitmap & -bitmap
+        ids.append(low.bit_length() - 1)
+        bitmap ^= low
+    return ids
+
+class RecipeSearchIndex(object):
+    """ Postings from the 1, 2 and 3 character grams of each distinct piece of
+    text to that text, and from each text to the bitmap of recipes using it in
+    each field. Only depends on the recipe definitions, not the stock
+    """
+    def __init__(self, recipes):
+        """
+        :param recipes: iterable of DrinkRecipe
+        """
+        self._recipe_ids = {}
+        self._texts = []
+        self._text_ids = {}
+        self._grams = {}
+        self._postings = {field: {} for field in SEARCH_FIELDS}
+        for recipe in recipes:
+            bit = 1 << self._recipe_ids.setdefault(recipe.name, len(self._recipe_ids))
+            for field, get_text in SEARCH_FIELDS.items():
+                postings = self._postings[field]
+                for text in get_text(recipe):
+                    text_id = self._add_text(text)
+                    postings[text_id] = postings.get(text_id, 0) | bit
+
+    def recipe_id(self, name):
+        """ The recipe's bit in the bitmaps, None if it wasn't indexed
+        """
+        return self._recipe_ids.get(name)
+
+    def _add_text(self, text):
+        text_id = self._text_ids.get(text)
+        if text_id is None:
+            text_id = len(self._texts)
+            self._texts.append(text)
+            self._text_ids[text] = text_id
+            for size in range(1, GRAM_SIZE+1):
+                for gram in grams(text, size):
+                    self._grams.setdefault(gram, set()).add(text_id)
+        return text_id
+
+    def _texts_containing(self, term):
+        """ Ids of the texts that have term as a substring
+        """
+        if not term:
+            return range(len(self._texts))
+        if len(term) <= GRAM_SIZE:
+            return self._grams.get(term, ())
+        postings = sorted((self._grams.get(gram, set()) for gram in grams(term, GRAM_SIZE)), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        return [text_id for text_id in candidates if term in self._texts[text_id]]
+
+    def matching(self, field, term):
+        """ Bitmap of the recipes with some text in the field containing term,
+        e.g. matching('ingredients', 'rum') has recipes with dark rum or rum raisin
+        """
+        postings = self._postings[field]
+        bitmap = 0
+        for text_id in self._texts_containing(term):
+            bitmap |= postings.get(text_id, 0)
+        return bitmap
+
+    def all_matching(self, field, terms):
+        """ Bitmap of the recipes matching every term
+        """
+        bitmap = None
+        for term in terms:
+            bitmap = self.matching(field, term) if bitmap is None else bitmap & self.matching(field, term)
+            if not bitmap:
+                break
+        return bitmap or 0
+
+    def any_matching(self, field, terms):
+        """ Bitmap of the recipes matching at least one term
+        """
+        bitmap = 0
+        for term in terms:
+            bitmap |= self.matching(field, term)
+        return bitmap
@@ -0,0 +1,239 @@
+""" Cache shared between worker processes, so a recipe library is generated
+once for every worker and a stock edit seen by one is picked up by all.
+Backends store bytes under string keys and keep integer counters, with the
+subset of the Redis API that's needed: get, set (with an optional ttl in
+seconds, and nx to only set a key that isn't there), delete and incr
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import pickle
+import hashlib
+import urllib.parse
+
+try:
+    import redis
+    has_redis = True
+except ImportError:
+    has_redis = False
+
+from .logger import get_logger
+log = get_logger(__name__)
+
+class LocalCache(object):
+    """ In-process stand-in with the same interface, for a single worker or
+    for testing, also usable as the client for RedisCache
+    """
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._values.get(key, (None, None))
+            if expires is not None and expires < time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None, nx=False):
+        """ True if the value was set, None if nx and the key was already there
+        """
+        with self._lock:
+            if nx and key in self._values:
+                expires = self._values[key][1]
+                if expires is None or expires >= time.time():
+                    return None
+            self._values[key] = (value, time.time() + ex if ex else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._values.get(key, (0, None))[0]) + 1
+            self._values[key] = (str(value).encode(), None)
+            return value
+
+class SQLiteCache(object):
+    """ Cache in a sqlite file that every worker on the host opens,
+    expired values are pruned every so often as values are set
+    """
+    PRUNE_EVERY = 200
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key, value, ex=None, nx=False):
+        """ True if the value was set, None if nx and the key was already there
+        """
+        conn = self._connection()
+        with conn:
+            if nx:
+                # checked and set in one write transaction, like incr
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT expires FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and (row[0] is None or row[0] >= time.time()):
+                    return None
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                    (key, sqlite3.Binary(value), time.time() + ex if ex else None))
+            self._sets += 1
+            if self._sets % self.PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        return True
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def incr(self, key):
+        conn = self._connection()
+        with conn:
+            # the write lock is taken up front so two workers can't read the same value
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row else 1
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, NULL)", (key, str(value).encode()))
+        return value
+
+class RedisCache(object):
+    """ Cache in Redis, or anything with a redis-py compatible client, e.g. LocalCache
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        return True if self.client.set(key, value, ex=ex, nx=nx) else None
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return int(self.client.incr(key))
+
+def get_shared_cache(url):
+    """ Backend for the MIXMIND_SHARED_CACHE setting, None if it's not set
+    :param str url: "local", "sqlite:///path/to/file.db" or "redis://host:port/db"
+    """
+    if not url:
+        return None
+    parsed = urllib.parse.urlparse(url)
+    if url == 'local':
+        return LocalCache()
+    if parsed.scheme == 'sqlite':
+        path = parsed.path[1:] if parsed.path.startswith('//') else parsed.path
+        return SQLiteCache(os.path.abspath(path))
+    if parsed.scheme in ('redis', 'rediss'):
+        if not has_redis:
+            raise ImportError("The redis package is required for MIXMIND_SHARED_CACHE={}".format(url))
+        return RedisCache(redis.Redis.from_url(url))
+    raise ValueError("Unknown MIXMIND_SHARED_CACHE: {}".format(url))
+
+class SharedLibraries(object):
+    """ Processed recipe libraries in a shared cache, with the version of the
+    latest one per bar that every worker checks to see if its own copy is out of date.
+    Versions are handed out by a counter, and only published once a library is
+    stored under its version. Storing is done holding the bar's lease, which a
+    worker also takes before generating a library no worker has yet, so the
+    others wait for it instead of generating their own
+    """
+    def __init__(self, cache, prefix='mixmind', lease_ttl=300):
+        self.cache = cache
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+
+    def _key(self, bar_id, *parts):
+        return ':'.join([self.prefix, 'bar', str(bar_id)] + [str(part) for part in parts])
+
+    def version(self, bar_id):
+        """ Latest published version of the bar's library, 0 if there is none
+        """
+        value = self.cache.get(self._key(bar_id, 'version'))
+        return int(value) if value else 0
+
+    def next_version(self, bar_id):
+        """ A version for a new library, unique across workers but not published yet
+        """
+        return self.cache.incr(self._key(bar_id, 'counter'))
+
+    def acquire(self, bar_id):
+        """ Take the bar's lease, returns the token to release it with,
+        None if another worker holds it. It expires after lease_ttl seconds
+        """
+        token = uuid.uuid4().hex.encode()
+        if self.cache.set(self._key(bar_id, 'lease'), token, ex=self.lease_ttl, nx=True):
+            return token
+        return None
+
+    def release(self, bar_id, token):
+        # not atomic, but the lease only goes to someone else after it expires
+        if self.cache.get(self._key(bar_id, 'lease')) == token:
+            self.cache.delete(self._key(bar_id, 'lease'))
+
+    def store(self, library):
+        """ Write the library's examples and stats, generating any that haven't
+        been yet, then publish its version. Call holding the bar's lease
+        """
+        previous = self.version(library.bar_id)
+        data = pickle.dumps({
+            'versions': library.versions,
+            'recipes': [(recipe.name, recipe.dump_examples()) for recipe in library.recipes],
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+        self.cache.set(self._key(library.bar_id, 'library', library.version), data)
+        self.cache.set(self._key(library.bar_id, 'version'), str(library.version).encode())
+        if previous:
+            self.cache.delete(self._key(library.bar_id, 'library', previous))
+
+    def load(self, bar_id, version):
+        """ (recipe versions, [(name, DrinkRecipe.dump_examples())]) as stored, None if
+        the version isn't there, e.g. it's been replaced since
+        """
+        data = self.cache.get(self._key(bar_id, 'library', version))
+        if data is None:
+            return None
+        data = pickle.loads(data)
+        return data['versions'], data['recipes']
+
+class SharedFragments(object):
+    """ Rendered fragments in a shared cache, as the backing store for a FragmentCache
+    """
+    def __init__(self, cache, ttl=24*60*60, prefix='mixmind'):
+        self.cache = cache
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        return '{}:fragment:{}'.format(self.prefix, hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        value = self.cache.get(self._key(key))
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, fragment):
+        self.cache.set(self._key(key), fragment.encode('utf-8'), ex=self.ttl)
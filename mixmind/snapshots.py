@@ -0,0 +1,68 @@
+""" Processed recipe libraries saved to disk, so a restart can load each bar's
+examples and stats instead of generating them again.
+A snapshot is only used when its fingerprint matches, which covers the recipe
+definitions, the bar's ingredient rows and the settings that change the results
+"""
+import os
+import pickle
+import hashlib
+import json
+import tempfile
+
+from .logger import get_logger
+log = get_logger(__name__)
+
+# bump whenever what's stored, or how examples are generated, changes
+SNAPSHOT_FORMAT = 2
+
+def recipes_fingerprint(base_recipes):
+    """ Hash of the recipes as loaded from the recipe files, in the order they were loaded
+    """
+    return hashlib.sha1(json.dumps(base_recipes).encode('utf-8')).hexdigest()
+
+class LibrarySnapshots(object):
+    """ One file per bar in the directory, holding the fingerprint it was made
+    for and DrinkRecipe.dump_examples() of each recipe that had been generated
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, bar_id):
+        return os.path.join(self.directory, 'bar-{}.snapshot'.format(bar_id))
+
+    def load(self, bar_id, fingerprint):
+        """ [(name, DrinkRecipe.dump_examples())] from the bar's snapshot, None if
+        there isn't one for this fingerprint. Recipes that weren't generated when it
+        was saved are left out
+        """
+        try:
+            with open(self._path(bar_id), 'rb') as fp:
+                snapshot = pickle.load(fp)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            log.warning("Ignoring unreadable library snapshot for bar {}: {}: {}".format(bar_id, err.__class__.__name__, err))
+            return None
+        if snapshot.get('format') != SNAPSHOT_FORMAT or snapshot.get('fingerprint') != fingerprint:
+            return None
+        return snapshot['recipes']
+
+    def store(self, library, fingerprint):
+        """ Save the examples and stats of the library's recipes that have been
+        generated, the others are left to generate on demand after loading.
+        Written to a temporary file first so readers never see part of one
+        """
+        snapshot = {
+                'format': SNAPSHOT_FORMAT,
+                'fingerprint': fingerprint,
+                'recipes': [(recipe.name, recipe.dump_examples()) for recipe in library.recipes if recipe.generated],
+                }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(snapshot, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(library.bar_id))
+        except Exception:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1,35 @@
+/* Order history
+ * The "More Orders" button adds the next page from /api/orders
+ * to the order table, then points itself at the page after that
+ */
+$(document).ready(function () {
+    $("#more-orders").on("click", function () {
+        var button = $(this);
+        button.prop("disabled", true);
+        $.getJSON(button.data("url"))
+            .done(function(result) {
+                if (result.status == "error") {
+                    button.prop("disabled", false);
+                    alert("Error: " + result.message);
+                    return;
+                }
+                var tbody = $("#order-table tbody");
+                result.data.orders.forEach(function (order) {
+                    var row = $("<tr>");
+                    [order.id, order.timestamp, order.confirmed ? "yes" : "no", order.user_id, order.bar_id, order.recipe_name].forEach(function (value) {
+                        row.append($("<td>").text(value === null ? "None" : value));
+                    });
+                    tbody.append(row);
+                });
+                if (result.data.next_url) {
+                    button.data("url", result.data.next_url).prop("disabled", false);
+                }
+                else {
+                    button.remove();
+                }
+            })
+            .fail(function() {
+                button.prop("disabled", false);
+            });
+    });
+});
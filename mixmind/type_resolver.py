@@ -0,0 +1,109 @@
+""" Resolve the ingredient names used in recipes to the types in a bar's stock
+Recipes may ask for a whole family of types, e.g. "rum", "any spirit" or "bitters",
+and a stock may spell a type differently than a recipe, e.g. "Scotch Whisky"
+"""
+from collections import OrderedDict
+
+# words that are treated as the same word, in both recipes and stock
+DEFAULT_SYNONYMS = {'whisky': 'whiskey'}
+# these match every stock type containing them, e.g. rum -> dark rum, white rum
+FAMILY_NAMES = ['rum', 'whiskey', 'tequila', 'vermouth']
+# "any spirit" matches exactly these stock types
+ANY_SPIRIT = 'any spirit'
+ANY_SPIRIT_TYPES = ['dry gin', 'rye whiskey', 'bourbon whiskey', 'amber rum', 'dark rum', 'white rum', 'genever', 'cognac', 'brandy', 'aquavit']
+# these match every stock type in the Category
+CATEGORY_NAMES = {'bitters': 'Bitters'}
+
+RESOLVER_CACHE_SIZE = 64
+
+_synonyms = dict(DEFAULT_SYNONYMS)
+_resolvers = OrderedDict()
+
+def configure_synonyms(synonyms):
+    """ Replace the synonym table, e.g. from the app config
+    :param dict synonyms: word -> the word to use in its place
+    """
+    global _synonyms
+    _synonyms = {k.lower(): v.lower() for k, v in (synonyms or {}).items()}
+    _resolvers.clear()
+
+def normalize(name, synonyms=None):
+    """ Lower case, single spaced, with synonyms replaced
+    :param dict synonyms: defaults to the table from configure_synonyms
+    """
+    synonyms = _synonyms if synonyms is None else synonyms
+    return ' '.join(synonyms.get(word, word) for word in name.lower().split())
+
+def names_for_type(type_, category=None, synonyms=None):
+    """ All the recipe ingredient names that a stock type satisfies
+    e.g. "Dark Rum" -> {"dark rum", "rum", "any spirit"}
+    """
+    type_ = normalize(type_, synonyms)
+    names = set([type_])
+    names.update(name for name in FAMILY_NAMES if name in type_)
+    if type_ in _any_spirit_types(synonyms):
+        names.add(ANY_SPIRIT)
+    names.update(name for name, cat in CATEGORY_NAMES.items() if category == cat)
+    return names
+
+def _any_spirit_types(synonyms=None):
+    return set(normalize(t, synonyms) for t in ANY_SPIRIT_TYPES)
+
+class TypeResolver(object):
+    """ Inverted index from recipe ingredient names to the stock types that can be used
+    Build with get_resolver so it is shared until the stock types change.
+    Keeps the synonym table it was built with, so a copy pickled to a worker
+    process resolves names the same way
+    """
+    def __init__(self, stock_types, synonyms=None):
+        """
+        :param stock_types: iterable of (type_, Category), type_ as stored in the stock
+        :param dict synonyms: defaults to the table from configure_synonyms
+        """
+        self.synonyms = dict(_synonyms if synonyms is None else synonyms)
+        self._index = {}
+        for type_, category in stock_types:
+            for name in names_for_type(type_, category, self.synonyms):
+                types = self._index.setdefault(name, [])
+                if type_ not in types:
+                    types.append(type_)
+
+    def resolve(self, name):
+        """ Stock types matching the recipe ingredient name, empty if there are none
+        """
+        return self._index.get(normalize(name, self.synonyms), [])
+
+def get_resolver(stock_types):
+    """ Get a TypeResolver for the given (type_, Category) pairs, only compiling
+    a new one when that set of types hasn't been seen recently
+    """
+    key = frozenset(stock_types)
+    resolver = _resolvers.pop(key, None)
+    if resolver is None:
+        resolver = TypeResolver(sorted(key, key=lambda pair: (pair[0], pair[1] or '')))
+    _resolvers[key] = resolver
+    while len(_resolvers) > RESOLVER_CACHE_SIZE:
+        _resolvers.popitem(last=False)
+    return resolver
+
+class RecipeDependencies(object):
+    """ Inverted index from stock types to the recipes whose examples can use them,
+    following the same rules as TypeResolver, e.g. "Dark Rum" affects a recipe
+    calling for "rum" or "any spirit"
+    """
+    def __init__(self, recipes):
+        """
+        :param recipes: iterable of DrinkRecipe
+        """
+        self._index = {}
+        for recipe in recipes:
+            for name in recipe.stock_dependencies():
+                self._index.setdefault(normalize(name), set()).add(recipe.name)
+
+    def recipes_using(self, type_, category=None):
+        """ Names of the recipes that a change to this stock type can affect
+        """
+        names = set()
+        for name in names_for_type(type_, category):
+            names.update(self._index.get(name, ()))
+        return names
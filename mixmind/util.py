@@ -1,14 +1,24 @@
 """ Miscallanious util funcitons for the mix-mind project
 """
-from functools import wraps
 from fractions import Fraction
 from collections import OrderedDict, namedtuple
 import operator
+import numbers
 import json
 import csv
-import inspect
 import uuid
+import re
+import unicodedata
+import urllib.parse
 import pendulum
+
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+from .search_index import RecipeSearchIndex, bits
 from .logger import get_logger
 log = get_logger(__name__)
 
@@ -19,78 +29,97 @@ PdfOptions = namedtuple('PdfOptions', 'pdf_filename,ncols,liquor_list,liquor_lis
 
 VALID_UNITS = ['oz', 'mL', 'cL']
 
-class ResultRecipes(object):
-    def add_items(self, recipes):
-        pass
-    def get_items(self):
-        pass
-
-class UnionResultRecipes(ResultRecipes):
-    def __init__(self):
-        self.container = OrderedDict()
-    def add_items(self, recipes):
-        for recipe in recipes:
-            self.container[recipe.name] = recipe
-    def get_items(self):
-        return list(self.container.values())
-
-class IntersectionResultRecipes(ResultRecipes):
-    def __init__(self):
-        self.container = None
-    def add_items(self, recipes):
-        if self.container is None:
-            self.container = recipes
-        else:
-            self.container = [x for x in self.container if x in recipes]
-    def get_items(self):
-        return self.container
-
-def filter_recipes(all_recipes, filter_options, union_results=False):
+def filter_recipes(all_recipes, filter_options, union_results=False, search_index=None):
     """Filters the recipe list based on a FilterOptions bundle of parameters
     :param list[Recipe] all_recipes: list of recipe object to filter
     :param FilterOptions filter_options: bundle of filtering parameters
         search str: search an arbitrary string against the ingredients and attributes
     :param bool union_results: for each attributes searched against, combine results
         with set intersection by default, or union if True
+    :param RecipeSearchIndex search_index: index of all_recipes, built here if not given
+    :return: the matching recipes in the order of all_recipes, or for a union in the
+        order each was first matched, and the sorted names of the rest
     """
-    result_recipes = UnionResultRecipes() if union_results else IntersectionResultRecipes()
-    recipes = [recipe for recipe in all_recipes if filter_options.all_ or recipe.can_make]
+    if search_index is None:
+        search_index = RecipeSearchIndex(all_recipes)
+    # map the recipes onto the index's bitmaps
+    by_id = {}
+    position = {}
+    in_order = True
+    last_id = -1
+    every = candidates = 0
+    for recipe in all_recipes:
+        recipe_id = search_index.recipe_id(recipe.name)
+        if recipe_id is None:
+            return filter_recipes(all_recipes, filter_options, union_results)
+        in_order = in_order and recipe_id > last_id
+        last_id = recipe_id
+        position.setdefault(recipe_id, len(position))
+        by_id[recipe_id] = recipe
+        every |= 1 << recipe_id
+        if filter_options.all_ or recipe.can_make:
+            candidates |= 1 << recipe_id
+
+    facets = []
     if filter_options.search:
         include_list = [filter_options.search.lower()]
     else:
         include_list = [i.lower() for i in filter_options.include]
     if include_list:
-        reduce_fn = any if filter_options.include_use_or else all
-        result_recipes.add_items([recipe for recipe in recipes if
-                reduce_fn((recipe.contains_ingredient(ingredient, include_optional=True)
-                for ingredient in include_list))])
+        match = search_index.any_matching if filter_options.include_use_or else search_index.all_matching
+        facets.append(candidates & match('ingredients', include_list))
     if filter_options.exclude:
-        reduce_fn = any if filter_options.exclude_use_or else all
-        result_recipes.add_items([recipe for recipe in recipes if
-                reduce_fn((not recipe.contains_ingredient(ingredient, include_optional=False)
-                for ingredient in filter_options.exclude))])
+        # any/all of the terms missing is the same as not all/any of them present
+        match = search_index.all_matching if filter_options.exclude_use_or else search_index.any_matching
+        facets.append(candidates & ~match('required_ingredients', filter_options.exclude))
     for attr in 'style glass prep ice tag'.split():
-        result_recipes.add_items(filter_on_attribute(recipes, filter_options, attr))
-
-    result_recipes = result_recipes.get_items()
+        facets.append(filter_on_attribute(candidates, filter_options, attr, search_index))
+
+    def ordered(bitmap):
+        ids = bits(bitmap)
+        return ids if in_order else sorted(ids, key=position.get)
+    if union_results:
+        result = 0
+        result_ids = []
+        for facet in facets:
+            result_ids.extend(ordered(facet & ~result))
+            result |= facet
+    else:
+        result = candidates
+        for facet in facets:
+            result &= facet
+        result_ids = ordered(result)
+    result_recipes = [by_id[recipe_id] for recipe_id in result_ids]
 
-    def get_names(items):
-        return set([i.name for i in items])
-    excluded = sorted(list(get_names(all_recipes) - get_names(result_recipes)))
+    excluded = sorted(set(by_id[recipe_id].name for recipe_id in bits(every & ~result)))
     log.debug("Excluded: {}\n".format(', '.join(excluded)))
     return result_recipes, excluded
 
-def filter_on_attribute(recipes, filter_options, attribute):
+def filter_on_attribute(recipes, filter_options, attribute, search_index):
+    """ Bitmap of the recipes whose attribute matches the filter, all of them if unfiltered
+    """
     attr_value = getattr(filter_options, attribute).lower()
     if filter_options.search and not attr_value:
         attr_value = filter_options.search.lower()
     if attr_value:
-        recipes = [recipe for recipe in recipes if attr_value in getattr(recipe, attribute).lower()]
+        recipes &= search_index.matching(attribute, attr_value)
     return recipes
 
 def get_uuid():
     return str(uuid.uuid4())
 
+def normalize_name(name):
+    """ Form of a name for lookups, URL-decoded, case folded and single spaced
+    e.g. "old+FASHIONED" -> "old fashioned"
+    """
+    return ' '.join(urllib.parse.unquote_plus(name).casefold().split())
+
+def slugify(name):
+    """ URL-safe form of a name, e.g. "Tom & Jerry" -> "tom-jerry", "Añejo" -> "anejo"
+    """
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', ascii_name.lower()).strip('-')
+
 class StatTracker(dict):
     # mutable class variables
     _title_width = 0
@@ -160,16 +189,6 @@ def load_recipe_json(recipe_files):
             base_recipes.update(other_recipes)
     return base_recipes
 
-
-def default_initializer(func):
-    names, varargs, keywords, defaults = inspect.getargspec(func)
-    @wraps(func)
-    def wrapper(self, *args, **kwargs):
-        for name, arg in list(zip(names[1:], args)) + list(kwargs.items()):
-            setattr(self, name, arg)
-        func(self, *args, **kwargs)
-    return wrapper
-
 # utils to convert string values
 def from_float(s):
     if not s:
@@ -203,7 +222,7 @@ def calculate_std_drinks(abv, amount, unit):
     """ Standard drink is 1.5 oz or 45 ml at 40% abv
     """
     adjusted_abv = abv / 40.0
-    adjusted_amount = convert_units(amount, unit, 'oz') / 1.5
+    adjusted_amount = amount * unit_factor(unit, 'oz') / 1.5
     return adjusted_abv * adjusted_amount
 
 def calculate_abv(std_drinks, volume, unit):
@@ -231,6 +250,67 @@ OZ_PER_TSP          =  1.0/8.0
 OZ_PER_DS           =  1.0/32.0
 OZ_PER_DROP         =  1.0/240.0
 
+# units the conversion table knows about, also the row/column order of the array form
+UNITS = ['oz', 'mL', 'cL', 'tsp', 'ds', 'drop']
+UNIT_INDEX = {unit: i for i, unit in enumerate(UNITS)}
+
+def _conversion_factors(rounded):
+    """ Multiply an amount in the first unit by the factor to get the second unit,
+    only the pairs listed here can be converted
+    """
+    mL_per_oz = ML_PER_OZ if not rounded else ML_PER_OZ_ROUNDED
+    mL_per_tsp = ML_PER_TSP if not rounded else ML_PER_TSP_ROUNDED
+    return {
+            ('ds', 'mL'): ML_PER_DS,
+            ('ds', 'cL'): ML_PER_DS / ML_PER_CL,
+            ('ds', 'oz'): 1.0 / mL_per_oz,
+            ('tsp', 'oz'): OZ_PER_TSP,
+            ('tsp', 'mL'): mL_per_tsp,
+            ('tsp', 'cL'): mL_per_tsp / ML_PER_CL,
+            ('oz', 'mL'): mL_per_oz,
+            ('oz', 'cL'): mL_per_oz / ML_PER_CL,
+            ('oz', 'tsp'): 1.0 / OZ_PER_TSP,
+            ('oz', 'ds'): 1.0 / OZ_PER_DS,
+            ('oz', 'drop'): 1.0 / OZ_PER_DROP,
+            ('mL', 'oz'): 1.0 / mL_per_oz,
+            ('mL', 'cL'): 1.0 / ML_PER_CL,
+            ('mL', 'ds'): 1.0 / ML_PER_DS,
+            ('mL', 'tsp'): 1.0 / mL_per_tsp,
+            ('mL', 'drop'): 1.0 / ML_PER_DROP,
+            ('drop', 'oz'): OZ_PER_DROP,
+            ('drop', 'mL'): ML_PER_DROP,
+            ('drop', 'cL'): ML_PER_DROP / ML_PER_CL,
+            ('cL', 'oz'): ML_PER_CL / mL_per_oz,
+            ('cL', 'mL'): ML_PER_CL,
+            ('cL', 'ds'): ML_PER_CL / ML_PER_DS,
+            ('cL', 'tsp'): ML_PER_CL / mL_per_tsp,
+            ('cL', 'drop'): ML_PER_CL / ML_PER_DROP,
+            }
+
+def _conversion_matrix(factors):
+    """ The same factors as a UNITS x UNITS array, nan where there's no conversion
+    """
+    matrix = np.full((len(UNITS), len(UNITS)), np.nan)
+    np.fill_diagonal(matrix, 1.0)
+    for (from_unit, to_unit), factor in factors.items():
+        matrix[UNIT_INDEX[from_unit], UNIT_INDEX[to_unit]] = factor
+    return matrix
+
+# keyed on the rounded flag
+CONVERSION_FACTORS = {False: _conversion_factors(False), True: _conversion_factors(True)}
+if has_numpy:
+    CONVERSION_MATRIX = {rounded: _conversion_matrix(factors) for rounded, factors in CONVERSION_FACTORS.items()}
+
+def unit_factor(from_unit, to_unit, rounded=False):
+    """ Factor to multiply by to convert between units
+    """
+    if from_unit == to_unit:
+        return 1.0
+    factor = CONVERSION_FACTORS[bool(rounded)].get((from_unit, to_unit))
+    if factor is None:
+        no_conversion(from_unit, to_unit)
+    return factor
+
 def convert_units(amount, from_unit, to_unit, rounded=False):
     if from_unit == 'literal':
         return amount
@@ -240,104 +320,53 @@ def convert_units(amount, from_unit, to_unit, rounded=False):
         amount = amount
     if from_unit == to_unit:
         return amount
-    unit_conversions = {
-            'ds': dash_to_volume,
-            'tsp': tsp_to_volume,
-            'mL': mL_to_volume,
-            'cL': cL_to_volume,
-            'oz': oz_to_volume,
-            'drop': drop_to_volume,
-            }
-    convert = unit_conversions.get(from_unit, lambda x,y,z: no_conversion(from_unit, to_unit))
-    return convert(amount, to_unit, rounded)
+    return amount * unit_factor(from_unit, to_unit, rounded)
+
+def convert_many(amounts, from_units, to_unit, rounded=False):
+    """ Convert a batch of amounts at once
+    :param amounts: sequence or array of amounts, or a single amount
+    :param from_units: one unit for all the amounts, or a sequence of units, one per amount
+    :returns: numpy array, or a list if numpy is not installed, a float for a single amount
+    """
+    if isinstance(amounts, (numbers.Number, str)):
+        # e.g. one row dict from Barstock_DF.add_row
+        return convert_units(amounts, from_units, to_unit, rounded)
+    if not has_numpy:
+        if isinstance(from_units, str):
+            from_units = [from_units] * len(amounts)
+        return [convert_units(amount, from_unit, to_unit, rounded) for amount, from_unit in zip(amounts, from_units)]
+    amounts = np.asarray(amounts, dtype=float)
+    try:
+        column = CONVERSION_MATRIX[bool(rounded)][:, UNIT_INDEX[to_unit]]
+        if isinstance(from_units, str):
+            factors = column[UNIT_INDEX[from_units]]
+        else:
+            factors = column[[UNIT_INDEX[unit] for unit in from_units]]
+    except KeyError:
+        no_conversion(from_units, to_unit)
+    if np.isnan(factors).any():
+        no_conversion(from_units, to_unit)
+    return amounts * factors
 
 def no_conversion(from_unit, to_unit):
     raise NotImplementedError("conversion from {} to {}".format(from_unit, to_unit))
 
-def dash_to_volume(amount, unit, rounded=False):
-    mL_per_oz = ML_PER_OZ if not rounded else ML_PER_OZ_ROUNDED
-    if unit == 'mL':
-        return amount * ML_PER_DS
-    elif unit == 'cL':
-        return amount * ML_PER_DS / ML_PER_CL
-    elif unit == 'oz':
-        return amount / mL_per_oz
-    else:
-        no_conversion('dash', unit)
-
-def tsp_to_volume(amount, unit, rounded=False):
-    mL_per_tsp = ML_PER_TSP if not rounded else ML_PER_TSP_ROUNDED
-    if unit == 'oz':
-        return amount * OZ_PER_TSP
-    elif unit == 'mL':
-        return amount * mL_per_tsp
-    elif unit == 'cL':
-        return amount * mL_per_tsp / ML_PER_CL
-    else:
-        no_conversion('tsp', unit)
-
-def oz_to_volume(amount, unit, rounded=False):
-    mL_per_oz = ML_PER_OZ if not rounded else ML_PER_OZ_ROUNDED
-    if unit == 'mL':
-        return amount * mL_per_oz
-    elif unit == 'cL':
-        return amount * mL_per_oz / ML_PER_CL
-    elif unit == 'tsp':
-        return amount / OZ_PER_TSP
-    elif unit == 'ds':
-        return amount / OZ_PER_DS
-    elif unit == 'drop':
-        return amount / OZ_PER_DROP
-    else:
-        no_conversion('oz', unit)
-
-def mL_to_volume(amount, unit, rounded=False):
-    mL_per_oz = ML_PER_OZ if not rounded else ML_PER_OZ_ROUNDED
-    mL_per_tsp = ML_PER_TSP if not rounded else ML_PER_TSP_ROUNDED
-    if unit == 'oz':
-        return amount / mL_per_oz
-    elif unit == 'cL':
-        return amount / ML_PER_CL
-    elif unit == 'ds':
-        return amount / ML_PER_DS
-    elif unit == 'tsp':
-        return amount / mL_per_tsp
-    elif unit == 'drop':
-        return amount / ML_PER_DROP
-    elif unit == 'mL':
-        return amount
-    else:
-        no_conversion('mL', unit)
-
-def drop_to_volume(amount, unit, rounded=False):
-    if unit == 'oz':
-        return amount * OZ_PER_DROP
-    elif unit == 'mL':
-        return amount * ML_PER_DROP
-    elif unit == 'cL':
-        return amount * ML_PER_DROP / ML_PER_CL
-    else:
-        no_conversion('drop', unit)
-
-def cL_to_volume(amount, unit, rounded=False):
-    try:
-        return mL_to_volume(amount, unit, rounded) * ML_PER_CL
-    except NotImplementedError:
-        no_conversion('cL', unit)
-
 class IngredientSpecifier(object):
     """ Allow ingredient:kind in recipes,
     e.g. "white rum:Barcadi Catra Blanca" or "aromatic bitters:Angostura"
     """
-    @default_initializer
+    __slots__ = ('ingredient', 'kind', 'extra')
+
     def __init__(self, ingredient, kind=None):
         if ingredient is None:
             raise ValueError("IngredientSpecifier ingredient (type) cannot be None")
+        self.kind = kind
         if '(' in ingredient and ')' in ingredient:
             self.extra = ingredient.strip()[ingredient.find('('):]
             self.ingredient = ingredient.strip()[:ingredient.find('(')].strip()
         else:
             self.extra = None
+            self.ingredient = ingredient
 
     @classmethod
     def from_string(cls, type_str):
@@ -15,20 +15,30 @@ from flask import g, render_template, flash, request, send_file, jsonify, redire
 from flask_security import login_required, roles_required, roles_accepted
 from flask_security.decorators import _get_unauthorized_view
 from flask_login import current_user
+from sqlalchemy.orm import selectinload
 
 from .notifier import send_mail
-from .forms import DrinksForm, OrderForm, OrderFormAnon, RecipeForm, RecipeListSelector, BarstockForm, UploadBarstockForm, LoginForm, CreateBarForm, EditBarForm, EditUserForm, SetBarOwnerForm
+from .forms import DrinksForm, OrderForm, OrderFormAnon, RecipeForm, RecipeListSelector, BarstockForm, UploadBarstockForm, LoginForm, CreateBarForm, EditBarForm, EditUserForm, SetBarOwnerForm, OrderFilterForm
 from .authorization import user_datastore
-from .barstock import Barstock_SQL, Ingredient, _update_computed_fields
+from .barstock import Barstock_SQL, Ingredient, DataError, _update_computed_fields
 from .formatted_menu import filename_from_options, generate_recipes_pdf
-from .compose_html import recipe_as_html, users_as_table, orders_as_table, bars_as_table
+from .compose_html import recipe_as_html, users_as_table, orders_as_table, bars_as_table, FragmentCache
+from .page_cache import PageCache
 from .util import filter_recipes, DisplayOptions, FilterOptions, PdfOptions, load_recipe_json, report_stats, convert_units
+from .shared_cache import SharedFragments
+from .configuration_management import bar_configs
 from .database import db
 from .models import User, Order, Bar
 from . import app, mms, current_bar
 from .logger import get_logger
 log = get_logger(__name__)
 
+# rendered recipe cards, keyed on the recipe's version in its bar's library
+recipe_card_cache = FragmentCache(app.config.get('MIXMIND_FRAGMENT_CACHE_BYTES', 0),
+        shared=SharedFragments(mms.shared_cache) if mms.shared_cache else None)
+# whole pages, see cached_page
+page_cache = PageCache(app.config.get('MIXMIND_RESPONSE_CACHE_BYTES', 0))
+
 """
 BUGS:
 NOTES:
@@ -47,12 +57,12 @@ NOTES:
 def initialize_shared_data():
     g.bar_id = current_bar.id
 
-def get_form(form_class):
+def get_form(form_class, **kwargs):
     """WTForms update 2.2 breaks when an empty request.form
     is given to it """
     if not request.form:
-        return form_class()
-    return form_class(request.form)
+        return form_class(**kwargs)
+    return form_class(request.form, **kwargs)
 
 def bundle_options(tuple_class, args):
     return tuple_class(*(getattr(args, field).data for field in tuple_class._fields))
@@ -66,27 +76,51 @@ def recipes_from_options(form, display_opts=None, filter_opts=None, to_html=Fals
     """
     display_options = bundle_options(DisplayOptions, form) if not display_opts else display_opts
     filter_options = bundle_options(FilterOptions, form) if not filter_opts else filter_opts
-    recipes, excluded = filter_recipes(mms.processed_recipes(current_bar), filter_options, union_results=bool(filter_options.search))
+    library = mms.library(current_bar)
+    recipes, excluded = filter_recipes(library.recipes, filter_options, union_results=bool(filter_options.search),
+            search_index=library.search)
     if form.sorting.data and form.sorting.data != 'None': # TODO this is weird
         reverse = 'X' in form.sorting.data
         attr = 'avg_{}'.format(form.sorting.data.rstrip('X'))
-        recipes = sorted(recipes, key=lambda r: getattr(r.stats, attr), reverse=reverse)
+        recipes = library.sort(recipes, attr, reverse=reverse)
     if convert_to:
-        [r.convert(convert_to) for r in recipes]
+        recipes = [r.in_unit(convert_to) for r in recipes]
     if display_options.stats and recipes:
         stats = report_stats(recipes, as_html=True)
     else:
         stats = None
-    # TODO this can certainly be cached
     if to_html:
-        if order_link:
-            recipes = [recipe_as_html(recipe, display_options,
-                order_link="/order/{}".format(urllib.parse.quote_plus(recipe.name)),
-                **kwargs_for_html) for recipe in recipes]
-        else:
-            recipes = [recipe_as_html(recipe, display_options, **kwargs_for_html) for recipe in recipes]
+        html_options = tuple(sorted(kwargs_for_html.items()))
+        def as_html(recipe):
+            link = "/order/{}".format(library.index.slug(recipe.name)) if order_link else None
+            key = (current_bar.id, recipe.name, library.recipe_version(recipe.name), recipe.unit,
+                    display_options, link, html_options)
+            return recipe_card_cache.get_or_render(key,
+                    lambda: recipe_as_html(recipe, display_options, order_link=link, **kwargs_for_html))
+        recipes = [as_html(recipe) for recipe in recipes]
     return recipes, excluded, stats
 
+def cached_page(page, render):
+    """ Response for the page from page_cache, see PageCache.response,
+    just render() when the cache is turned off
+    """
+    if not page_cache.enabled:
+        return render()
+    return page_cache.response(page_cache_key(page), render)
+
+def page_cache_key(page):
+    """ Everything besides the bar's recipe library that shows up on the
+    current user's view of a page, changes to the bar's settings included
+    """
+    if current_user.is_authenticated:
+        user = (current_user.id, current_user.get_name(short=True), current_user.get_role_names())
+    else:
+        user = None
+    bar = current_bar._replace(owner=current_bar.owner and current_bar.owner.id,
+            bartender=current_bar.bartender and current_bar.bartender.id)
+    bars = tuple((b.id, b.name, b.is_public, b.owner_id) for b in g.bar_list)
+    return (page, bar, mms.library(current_bar).version, user, bars, request.url, app.debug)
+
 def get_tmp_file():
     """ Get a temporary file that will be removed by a callback after
     the current request
@@ -110,6 +144,12 @@ def get_tmp_file():
 
 @app.route("/", methods=['GET', 'POST'])
 def browse():
+    # the library version moves on with every stock edit and regeneration
+    if request.method == 'GET':
+        return cached_page('browse', render_browse)
+    return render_browse()
+
+def render_browse():
     form = get_form(DrinksForm)
     filter_options = None
 
@@ -158,11 +198,11 @@ def order(recipe_name):
     heading = "Order:"
 
     recipe = mms.find_recipe(current_bar, recipe_name)
-    recipe.convert('oz')
     if not recipe:
         flash('Error: unknown recipe "{}"'.format(recipe_name), 'danger')
         return render_template('result.html', heading=heading)
     else:
+        recipe = recipe.in_unit('oz')
         recipe_html = recipe_as_html(recipe, DisplayOptions(
                             prices=current_bar.prices,
                             stats=False,
@@ -330,6 +370,8 @@ def user_profile():
             this_user.nickname = form.nickname.data
             this_user.venmo_id = form.venmo_id.data
             user_datastore.commit()
+            # owners' and bartenders' names are kept with the bar configs
+            bar_configs.invalidate()
             flash("Profile updated", 'success')
             return redirect(request.url)
         else:
@@ -387,6 +429,38 @@ def check_ownership(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def order_filters(filter_form, bar_id=None):
+    """ Order.page keyword arguments from a validated OrderFilterForm
+    :param int bar_id: only this bar's orders, whatever the form says
+    """
+    if bar_id is None and filter_form.bar_id.data:
+        bar_id = int(filter_form.bar_id.data)
+    return dict(bar_id=bar_id, since=filter_form.since.data, until=filter_form.until.data,
+            confirmed={'yes': True, 'no': False}.get(filter_form.confirmed.data))
+
+def orders_page_url(filters, after):
+    """ api_orders url for the page after the cursor, with the same filters
+    """
+    args = {'after': after, 'bar_id': filters['bar_id'],
+            'since': filters['since'].isoformat() if filters['since'] else None,
+            'until': filters['until'].isoformat() if filters['until'] else None,
+            'confirmed': {True: 'yes', False: 'no'}.get(filters['confirmed'])}
+    return url_for('api_orders', **{k: v for k, v in args.items() if v is not None})
+
+def order_history(filter_form, bar_id=None):
+    """ The first page of orders matching the filters as a table, and the url
+    for the page after it, None if that's all of them
+    :param int bar_id: only this bar's orders, whatever the form says
+    """
+    if filter_form.validate():
+        filters = order_filters(filter_form, bar_id)
+    else:
+        flash("Invalid order filters, showing all orders", 'warning')
+        filters = dict(bar_id=bar_id, since=None, until=None, confirmed=None)
+    page = Order.page(app.config.get('MIXMIND_ORDERS_PER_PAGE', 50), **filters)
+    more_orders = orders_page_url(filters, page.next) if page.next else None
+    return orders_as_table(page.orders, table_id="order-table"), more_orders
+
 @app.route("/manage/bar", methods=['GET', 'POST'])
 @login_required
 @roles_accepted('admin', 'owner')
@@ -427,6 +501,7 @@ def bar_settings():
             for attr in BAR_BULK_ATTRS:
                 setattr(bar, attr, getattr(edit_bar_form, attr).data)
             db.session.commit()
+            bar_configs.invalidate()
             flash("Successfully updated config for {}".format(bar.cname))
             return redirect(request.url)
         else:
@@ -439,9 +514,10 @@ def bar_settings():
         setattr(getattr(edit_bar_form, attr), 'data', getattr(current_bar, attr))
     if edit_bar_form is None:
         return redirect(request.url)
-    orders = Order.query.filter_by(bar_id=current_bar.id)
-    order_table = orders_as_table(orders)
-    return render_template('bar_settings.html', edit_bar_form=edit_bar_form, order_table=order_table)
+    filter_form = OrderFilterForm(request.args)
+    order_table, more_orders = order_history(filter_form, bar_id=current_bar.id)
+    return render_template('bar_settings.html', edit_bar_form=edit_bar_form, filter_form=filter_form,
+            order_table=order_table, more_orders=more_orders)
 
 @app.route("/manage/ingredients", methods=['GET','POST'])
 @login_required
@@ -469,29 +545,36 @@ def ingredient_stock():
                 except NameError as e:
                     flash('Error: {}'.format(e), 'danger')
                 else:
-                    mms.regenerate_recipes(current_bar, ingredient=ingredient.type_)
+                    mms.regenerate_recipes(current_bar, ingredient=ingredient.type_, category=ingredient.Category)
                 return redirect(request.url)
             else:
                 form_open = True
                 flash("Error in form validation", 'danger')
 
         elif 'upload-csv' in request.form:
-            # TODO handle files < 500 kb by keeping in mem
             csv_file = request.files['upload_csv']
             if not csv_file or csv_file.filename == '':
                 flash('No selected file', 'danger')
                 return redirect(request.url)
 
-            tmp_filename = get_tmp_file()
-            csv_file.save(tmp_filename)
-            Barstock_SQL(current_bar.id).load_from_csv([tmp_filename], current_bar.id,
-                    replace_existing=upload_form.replace_existing.data)
+            try:
+                # parsed as it's read from the upload, a bad header stops it before the rest is read
+                report = Barstock_SQL(current_bar.id).load_from_stream(csv_file.stream, current_bar.id,
+                        replace_existing=upload_form.replace_existing.data, source=csv_file.filename)
+            except DataError as e:
+                log.error(e)
+                flash("Error: ingredients not imported, nothing was changed: {}".format(e), 'danger')
+                return redirect(request.url)
             mms.generate_recipes(current_bar)
-            msg = "Ingredients database {} {} for {}".format(
+            msg = "Ingredients database {} {} for {}: {}".format(
                     "replaced by" if upload_form.replace_existing.data else "added to from",
-                    csv_file.filename, current_bar.cname)
+                    csv_file.filename, current_bar.cname, report)
             log.info(msg)
             flash(msg, 'success')
+            for rejected in report.rejected[:10]:
+                flash("Skipped line {}: {}".format(rejected.line, rejected.reason), 'warning')
+            if len(report.rejected) > 10:
+                flash("... and {} more lines skipped".format(len(report.rejected) - 10), 'warning')
 
     return render_template('ingredients.html', form=form, upload_form=upload_form, form_open=form_open)
 
@@ -536,6 +619,7 @@ def set_bar_owner():
                     heading="{}, you no longer own {}".format(old_owner.get_name(), bar.name),
                     message="You have been unassigned as the owner of {}.".format(bar.name))
         user_datastore.commit()
+        bar_configs.invalidate()
     else:
         flash("Error in form validation", 'warning')
 
@@ -546,7 +630,6 @@ def set_bar_owner():
 @roles_required('admin')
 def admin_dashboard():
     new_bar_form = get_form(CreateBarForm)
-    set_owner_form = get_form(SetBarOwnerForm)
     if request.method == 'POST':
         if 'create_bar' in request.form:
             if new_bar_form.validate():
@@ -563,6 +646,7 @@ def admin_dashboard():
                 new_bar = Bar(**bar_args)
                 db.session.add(new_bar)
                 db.session.commit()
+                bar_configs.invalidate()
                 flash("Created a new bar", 'success')
             else:
                 flash("Error in form validation", 'warning')
@@ -580,19 +664,24 @@ def admin_dashboard():
             for bar in bars:
                 bar.is_default = (bar.id == bar_id)
             db.session.commit()
+            bar_configs.invalidate()
             flash("Bar ID: {} is now the default".format(bar_id), 'success')
             return redirect(request.url)
 
+    # every user, the owner select needs them all anyway
+    users = User.query.options(selectinload(User.roles)).all()
+    set_owner_form = get_form(SetBarOwnerForm, users=users)
     set_owner_form.owner.data = '' if not current_bar.owner else current_bar.owner.email
-    bars = Bar.query.all()
-    users = User.query.all()
-    orders = Order.query.all()
+    # the bars and their bartenders as cached for every request
+    state = bar_configs.current()
     #bar_table = bars_as_table(bars)
-    user_table = users_as_table(users)
-    order_table = orders_as_table(orders)
+    user_table = users_as_table(users, Order.counts_by(Order.user_id))
+    filter_form = OrderFilterForm(request.args)
+    order_table, more_orders = order_history(filter_form)
     return render_template('dashboard.html', new_bar_form=new_bar_form,
-            set_owner_form=set_owner_form, users=users, orders=orders,
-            bars=bars, user_table=user_table, order_table=order_table)
+            set_owner_form=set_owner_form, users=users, bars=state.bars, bar_configs=state.configs,
+            bar_orders=Order.counts_by(Order.bar_id),
+            user_table=user_table, filter_form=filter_form, order_table=order_table, more_orders=more_orders)
 
 @app.route("/admin/menu_generator", methods=['GET', 'POST'])
 @login_required
@@ -754,6 +843,9 @@ def api_ingredient():
         except ValueError as e:
             return api_error(str(e))
 
+        # stock type before the edit, recipes using it may need updating too
+        old_type = (ingredient.type_, ingredient.Category)
+
         # special handling
         if field == 'Size_oz':
             # convert to mL because that's how everything works
@@ -768,14 +860,16 @@ def api_ingredient():
             return api_error("{}: {}".format(e.__class__.__name__, e))
 
         data = ingredient.as_dict()
-        mms.regenerate_recipes(current_bar, ingredient=ingredient.type_)
+        mms.regenerate_recipes(current_bar, ingredient=ingredient.type_, category=ingredient.Category)
+        if old_type != (ingredient.type_, ingredient.Category):
+            mms.regenerate_recipes(current_bar, ingredient=old_type[0], category=old_type[1])
         return api_success(data, message='Successfully updated "{}" for "{}"'.format(field, ingredient.iid()))
 
     # delete
     elif request.method == 'DELETE':
         db.session.delete(ingredient)
         db.session.commit()
-        mms.regenerate_recipes(current_bar, ingredient=ingredient.type_)
+        mms.regenerate_recipes(current_bar, ingredient=ingredient.type_, category=ingredient.Category)
         return api_success({'iid': ingredient.iid()}, message='Successfully deleted "{}"'.format(ingredient.iid()))
 
     return api_error("Unknwon method")
@@ -793,6 +887,30 @@ def api_ingredients_download():
         fp.writelines((i for i in ingredients))
     return send_file(tmp_filename, 'text/csv', as_attachment=True, attachment_filename=filename)
 
+@app.route("/api/orders", methods=['GET'])
+@login_required
+@roles_accepted('admin', 'owner')
+@check_ownership
+def api_orders():
+    """A page of the order history, newest first
+
+    :param string after: cursor for the page, from the previous page's next, the first page if not given
+    :param int bar_id: only orders for this bar, owners only get the current bar's
+    :param string since: only orders on or after this day, YYYY-MM-DD
+    :param string until: only orders on or before this day, YYYY-MM-DD
+    :param string confirmed: "yes" or "no", only orders that are or aren't confirmed
+    """
+    filter_form = OrderFilterForm(request.args)
+    if not filter_form.validate():
+        return api_error("Invalid order filters", errors=filter_form.errors)
+    filters = order_filters(filter_form, bar_id=None if current_user.has_role('admin') else current_bar.id)
+    try:
+        page = Order.page(app.config.get('MIXMIND_ORDERS_PER_PAGE', 50), after=request.args.get('after'), **filters)
+    except ValueError:
+        return api_error("Invalid cursor '{}'".format(request.args.get('after')))
+    return api_success({'orders': [order.as_dict() for order in page.orders], 'next': page.next,
+        'next_url': orders_page_url(filters, page.next) if page.next else None})
+
 @app.route("/api/user_current_bar", methods=['POST', 'GET', 'PUT', 'DELETE'])
 @login_required
 def api_user_current_bar():
@@ -866,11 +984,10 @@ def dev_debug_error_handler_page():
 
 @app.route('/api/json/<recipe_name>')
 def recipe_json(recipe_name):
-    recipe_name = urllib.parse.unquote_plus(recipe_name)
-    try:
-        return jsonify(mms.base_recipes[recipe_name])
-    except KeyError:
-        return "{} not found".format(recipe_name)
+    recipe = mms.find_recipe_json(recipe_name)
+    if recipe is None:
+        return api_error("{} not found".format(urllib.parse.unquote_plus(recipe_name))), 404
+    return jsonify(recipe)
 
 
 @app.errorhandler(500)
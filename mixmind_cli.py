@@ -105,6 +105,7 @@ Example usage:
     p.add_argument('-r', '--recipes', nargs='+', default=['recipes_schubar.json'], help="Recipes json filename(s)")
     p.add_argument('--save_cache', action='store_true', help="Pickle the generated recipes to cache them for later use (e.g. a quicker build of the pdf)")
     p.add_argument('--load_cache', action='store_true', help="Load the generated recipes from cache for use")
+    p.add_argument('--engine', default='scalar', choices=drink_recipe.EXAMPLE_ENGINES, help="How to calculate the examples for each recipe")
 
     # display options
     p.add_argument('-$', '--prices', action='store_true', help="Display prices for drinks based on stock")
@@ -216,7 +217,7 @@ def main():
         base_recipes = util.load_recipe_json(args.recipes)
         if args.barstock:
             barstock = Barstock.load(args.barstock, args.all_)
-            recipes = [drink_recipe.DrinkRecipe(name, recipe).generate_examples(barstock)
+            recipes = [drink_recipe.DrinkRecipe(name, recipe).generate_examples(barstock, engine=args.engine)
                 for name, recipe in base_recipes.items()]
         else:
             recipes = [drink_recipe.DrinkRecipe(name, recipe) for name, recipe in base_recipes.items()]
@@ -0,0 +1,36 @@
+""" The tests put a bare app on an in-memory database on the package in place of
+mixmind.create_app(), without uploads, mail or views
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mixmind
+
+def _make_app():
+    app = Flask('mixmind', root_path=os.path.join(ROOT, 'mixmind'))
+    app.config.from_object('config')
+    app.config.update(TESTING=True, MIXMIND_DIR=ROOT, SQLALCHEMY_DATABASE_URI='sqlite://')
+    return app
+
+# create_app() returns this one from now on
+mixmind.app = _make_app()
+from mixmind.database import db
+db.init_app(mixmind.app)
+mixmind.db = db
+from mixmind import models, barstock
+
+@pytest.fixture
+def app():
+    """ The test app with empty tables
+    """
+    with mixmind.app.app_context():
+        db.create_all()
+        yield mixmind.app
+        db.session.remove()
+        db.drop_all()
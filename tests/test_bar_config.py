@@ -0,0 +1,146 @@
+""" Bar configs cached between requests, and the writes that invalidate them
+"""
+import pytest
+from flask import g
+from flask_login import AnonymousUserMixin
+
+from mixmind import configuration_management
+from mixmind.configuration_management import BarConfigCache, BarUser, bar_configs, get_bar_config
+from mixmind.shared_cache import LocalCache
+from mixmind.database import db
+from mixmind.models import Bar, User
+
+@pytest.fixture
+def bars(app):
+    """ The default bar and another, cached until invalidated
+    """
+    bar_configs.configure(None, max_age=3600)
+    home = Bar(cname='home', name="Home Bar", is_public=True, is_default=True)
+    other = Bar(cname='other', name="Other Bar", is_public=True, is_default=False)
+    db.session.add_all([home, other])
+    db.session.commit()
+    yield home, other
+    bar_configs.configure(None)
+
+def request_bar(app, user=None):
+    """ get_bar_config as a new request sees it, from the logged in user if given
+    """
+    with app.test_request_context(), pytest.MonkeyPatch.context() as monkeypatch:
+        # g belongs to the test's app context, which outlives the request
+        g.pop('bar_list', None)
+        g.pop('current_bar', None)
+        monkeypatch.setattr(configuration_management, 'current_user', user or AnonymousUserMixin())
+        config = get_bar_config()
+        return config, g.bar_list
+
+def add_user(email, first_name, **kwargs):
+    user = User(email=email, first_name=first_name, last_name='Smith', active=True, **kwargs)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def test_bar_edit(app, bars):
+    home, _ = bars
+    config, _ = request_bar(app)
+    assert config.id == home.id and config.tagline == home.tagline
+    home.tagline = "Now serving"
+    home.markup = 1.5
+    db.session.commit()
+    # kept between requests until the write is announced
+    assert request_bar(app)[0] is config
+    bar_configs.invalidate()
+    config, bar_list = request_bar(app)
+    assert config.tagline == "Now serving" and config.markup == 1.5
+    home.name = "Renamed"
+    db.session.commit()
+    bar_configs.invalidate()
+    config, bar_list = request_bar(app)
+    assert config.name == "Renamed"
+    assert [bar.name for bar in bar_list] == ["Renamed", "Other Bar"]
+
+def test_bartender_change(app, bars):
+    home, _ = bars
+    assert request_bar(app)[0].is_closed
+    bartender = add_user('tender@example.com', 'Terry', nickname='T')
+    home.bartender_on_duty = bartender.id
+    db.session.commit()
+    bar_configs.invalidate()
+    config, _ = request_bar(app)
+    assert not config.is_closed
+    assert config.bartender == bartender and isinstance(config.bartender, BarUser)
+    assert config.bartender.get_name_with_email() == bartender.get_name_with_email() == "T (tender@example.com)"
+
+    # renaming the bartender is a write to the users the configs keep
+    bartender.nickname = 'Tee'
+    db.session.commit()
+    bar_configs.invalidate()
+    assert request_bar(app)[0].bartender.get_name_with_email() == "Tee (tender@example.com)"
+
+    home.bartender_on_duty = None
+    db.session.commit()
+    bar_configs.invalidate()
+    config, _ = request_bar(app)
+    assert config.is_closed and config.bartender is None
+
+def test_owner_change(app, bars):
+    home, _ = bars
+    owner = add_user('owner@example.com', 'Olive')
+    home.owner = owner
+    db.session.commit()
+    bar_configs.invalidate()
+    config, bar_list = request_bar(app)
+    assert config.owner == owner and config.owner.get_name() == "Olive Smith"
+    assert bar_list[0].owner_id == owner.id
+
+    new_owner = add_user('new@example.com', 'Nina')
+    home.owner = new_owner
+    db.session.commit()
+    bar_configs.invalidate()
+    config, bar_list = request_bar(app)
+    assert config.owner == new_owner and config.owner != owner
+    assert bar_list[0].owner_id == new_owner.id
+
+    home.owner = None
+    db.session.commit()
+    bar_configs.invalidate()
+    assert request_bar(app)[0].owner is None
+
+def test_set_default(app, bars):
+    home, other = bars
+    for bar in bars:
+        bar.is_default = bar is other
+    db.session.commit()
+    bar_configs.invalidate()
+    config, bar_list = request_bar(app)
+    assert config.id == other.id
+    assert [bar.is_default for bar in bar_list] == [False, True]
+
+def test_current_bar_of_the_user(app, bars):
+    _, other = bars
+    user = add_user('guest@example.com', 'Gus', current_bar_id=other.id)
+    assert request_bar(app, user)[0].id == other.id
+    # the user's choice isn't cached with the bars
+    user.current_bar_id = None
+    db.session.commit()
+    assert request_bar(app, user)[0].id == bars[0].id
+
+def test_invalidate_reaches_other_workers(app, bars):
+    home, _ = bars
+    cache = LocalCache()
+    first, second = BarConfigCache(cache, max_age=3600), BarConfigCache(cache, max_age=3600)
+    assert first.current().configs[home.id].tagline == second.current().configs[home.id].tagline
+    home.tagline = "Last call"
+    db.session.commit()
+    first.invalidate()
+    assert second.current().configs[home.id].tagline == "Last call"
+
+def test_max_age(app, bars, monkeypatch):
+    home, _ = bars
+    cache = BarConfigCache(max_age=30)
+    state = cache.current()
+    home.tagline = "Unannounced"
+    db.session.commit()
+    assert cache.current() is state
+    now = configuration_management.time.time() + 31
+    monkeypatch.setattr(configuration_management.time, 'time', lambda: now)
+    assert cache.current().configs[home.id].tagline == "Unannounced"
@@ -0,0 +1,118 @@
+""" Bulk ingredient imports
+"""
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+
+from mixmind.database import db
+from mixmind.barstock import Barstock_SQL, DataError, ImportReport, RejectedRow, read_csv_rows
+from mixmind.ingredient import Ingredient
+
+FIELDS = ['Category', 'Ingredient', 'Kind', 'ABV', 'Size (mL)', 'Price Paid']
+
+def csv_row(category, ingredient, kind, abv, size, price):
+    return dict(zip(FIELDS, (category, ingredient, kind, abv, size, price)))
+
+ROWS = [
+    csv_row('Spirit', 'Dry Gin', 'Beefeater', '44', '750', '$22.99'),
+    csv_row('Spirit', 'Dry Gin', 'Plymouth', '41.2', '1000', '35'),
+    csv_row('Vermouth', 'Dry Vermouth', 'Noilly Prat', '18', '375', '$8.00'),
+    csv_row('Bitters', 'Orange Bitters', 'Regans', '45', '', '9.50'),
+]
+
+UPDATES = [
+    csv_row('Spirit', 'Dry Gin', 'Beefeater', '44', '1750', '$39.99'),
+    {'Ingredient': 'Dry Vermouth', 'Kind': 'Noilly Prat', 'Price Paid': '6.50'},
+    {'Ingredient': 'Orange Bitters', 'Kind': 'Regans', 'Size (mL)': '150'},
+    csv_row('Juice', 'Lime Juice', 'Fresh', '0', '1000', '4'),
+]
+
+def numbered(rows, source='stock.csv'):
+    return [(source, line, row) for line, row in enumerate(rows, 2)]
+
+def stock(bar_id):
+    """ Every column of the bar's ingredients that doesn't differ between bars or imports
+    """
+    columns = [column for column in Ingredient.__table__.columns.keys() if column not in ('uuid', 'bar_id')]
+    db.session.expire_all()
+    return {(row.Type, row.Kind): {column: row[column] for column in columns}
+            for row in Ingredient.query.filter_by(bar_id=bar_id)}
+
+def test_import_matches_add_row(app):
+    imported, added = Barstock_SQL(1), Barstock_SQL(2)
+    report = imported.import_rows(numbered(ROWS), 1, replace_existing=False)
+    for row in ROWS:
+        added.add_row(row, 2)
+    assert report.inserted == [('Dry Gin', 'Beefeater'), ('Dry Gin', 'Plymouth'),
+            ('Dry Vermouth', 'Noilly Prat'), ('Orange Bitters', 'Regans')]
+    assert report.updated == [] and report.rejected == []
+    assert stock(1) == stock(2)
+    beefeater = stock(1)[('Dry Gin', 'Beefeater')]
+    assert beefeater['type_'] == 'dry gin'
+    assert beefeater['Cost_per_mL'] == pytest.approx(22.99 / 750)
+    assert beefeater['Cost_per_oz'] == pytest.approx(22.99 / beefeater['Size_oz'])
+
+    report = imported.import_rows(numbered(UPDATES), 1, replace_existing=False)
+    for row in UPDATES:
+        added.add_row(row, 2)
+    assert report.updated == [('Dry Gin', 'Beefeater'), ('Dry Vermouth', 'Noilly Prat'), ('Orange Bitters', 'Regans')]
+    assert report.inserted == [('Lime Juice', 'Fresh')]
+    assert stock(1) == stock(2)
+    assert stock(1)[('Dry Vermouth', 'Noilly Prat')]['Cost_per_cL'] == pytest.approx(65.0 / 375)
+    assert stock(1)[('Orange Bitters', 'Regans')]['Cost_per_mL'] == pytest.approx(9.5 / 150)
+
+def test_replace_existing(app):
+    barstock = Barstock_SQL(1)
+    barstock.import_rows(numbered(ROWS), 1)
+    report = barstock.import_rows(numbered(UPDATES[:1] + UPDATES[3:]), 1)
+    assert report.inserted == [('Dry Gin', 'Beefeater'), ('Lime Juice', 'Fresh')]
+    assert sorted(stock(1)) == [('Dry Gin', 'Beefeater'), ('Lime Juice', 'Fresh')]
+
+def test_rejected_rows(app):
+    rows = [
+        ROWS[0],
+        {'Category': 'Spirit', 'Ingredient': '', 'Kind': 'Nameless', 'ABV': '40'},
+        {'Category': 'Spirit', 'Ingredient': 'Dry Gin', 'ABV': '40'},
+        csv_row('Spirit', 'Dry Gin', 'Tanqueray', 'forty', '750', '25'),
+        csv_row('Spirit', 'Dry Gin', 'Hendricks', '44', '750', 'a lot'),
+        csv_row('Potion', 'Elixir', 'Secret', '10', '100', '5'),
+        dict.fromkeys(FIELDS, ''),
+        csv_row('Spirit', 'Dry Gin', 'Beefeater', '47', '750', '$24.99'),
+    ]
+    report = Barstock_SQL(1).import_rows(numbered(rows), 1)
+    assert [(row.source, row.line) for row in report.rejected] == [('stock.csv', line) for line in (3, 4, 5, 6, 7)]
+    assert all(isinstance(row, RejectedRow) for row in report.rejected)
+    reasons = [row.reason for row in report.rejected]
+    assert reasons[:2] == ["Primary key (Ingredient, Kind) missing"] * 2
+    assert reasons[2].startswith("Bad value") and 'forty' in reasons[2]
+    assert reasons[3].startswith("Bad value") and 'a lot' in reasons[3]
+    assert reasons[4] == "Unknown Category: Potion"
+    # the blank line is skipped, the later row for the same ingredient wins
+    assert report.inserted == [('Dry Gin', 'Beefeater')]
+    assert stock(1)[('Dry Gin', 'Beefeater')]['ABV'] == 47.0
+    assert str(report) == "1 inserted, 0 updated, 5 rejected"
+
+def test_rollback(app, monkeypatch):
+    barstock = Barstock_SQL(1)
+    barstock.import_rows(numbered(ROWS), 1)
+    before = stock(1)
+    def bulk_update_mappings(*args):
+        raise SQLAlchemyError("disk full")
+    monkeypatch.setattr(db.session, 'bulk_update_mappings', bulk_update_mappings)
+    with pytest.raises(DataError):
+        barstock.import_rows(numbered(UPDATES), 1)
+    assert stock(1) == before
+    with pytest.raises(DataError):
+        barstock.import_rows(numbered(UPDATES), 1, replace_existing=False)
+    assert stock(1) == before
+
+def test_report():
+    report = ImportReport()
+    assert str(report) == "0 inserted, 0 updated, 0 rejected"
+    report.reject('upload', 3, "Bad value")
+    assert report.rejected == [RejectedRow('upload', 3, "Bad value")]
+
+def test_read_csv_rows_checks_the_header():
+    with pytest.raises(DataError):
+        list(read_csv_rows(iter(["Category,ABV\n", "Spirit,40\n"]), 'stock.csv'))
+    rows = list(read_csv_rows(iter(["Ingredient,Kind\n", "Dry Gin,Beefeater\n"]), 'stock.csv'))
+    assert rows == [('stock.csv', 2, {'Ingredient': 'Dry Gin', 'Kind': 'Beefeater'})]
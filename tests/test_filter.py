@@ -0,0 +1,139 @@
+""" filter_recipes with the search index gives what scanning every recipe did
+"""
+import os
+import random
+from collections import OrderedDict
+
+import pytest
+
+from mixmind import util
+from mixmind.util import FilterOptions, filter_recipes
+from mixmind.search_index import RecipeSearchIndex, bits
+from mixmind.recipe import DrinkRecipe
+from mixmind.generate import Barstock_Snapshot, StockRow
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECIPE_FILES = [os.path.join(ROOT, 'recipes', name) for name in ('recipes_schubar.json', 'IBA_all.json')]
+
+def row(category, type_, kind, abv, cost_per_oz):
+    return StockRow(category, type_.title(), type_, kind, abv, cost_per_oz / 29.5735, cost_per_oz / 2.95735, cost_per_oz)
+
+STOCK = [
+    row('Spirit', 'dry gin', 'Beefeater', 44.0, 0.80),
+    row('Spirit', 'white rum', 'Flor de Cana', 40.0, 0.60),
+    row('Spirit', 'bourbon', 'Buffalo Trace', 45.0, 1.00),
+    row('Spirit', 'rye whiskey', 'Rittenhouse', 50.0, 1.10),
+    row('Vermouth', 'dry vermouth', 'Noilly Prat', 18.0, 0.45),
+    row('Vermouth', 'sweet vermouth', 'Carpano Antica', 16.5, 0.90),
+    row('Liqueur', 'campari', 'Campari', 24.0, 1.00),
+    row('Bitters', 'angostura bitters', 'Angostura', 44.7, 1.50),
+    row('Juice', 'lime juice', 'Fresh', 0.0, 0.25),
+    row('Juice', 'lemon juice', 'Fresh', 0.0, 0.25),
+    row('Syrup', 'simple syrup', 'House', 0.0, 0.10),
+]
+
+@pytest.fixture(scope='module')
+def recipes():
+    barstock = Barstock_Snapshot(1, STOCK)
+    recipes = [DrinkRecipe(name, recipe) for name, recipe in util.load_recipe_json(RECIPE_FILES).items()]
+    for recipe in recipes:
+        recipe.defer_examples(barstock)
+    return recipes
+
+def scan(all_recipes, filter_options, union_results=False):
+    """ filter_recipes as it was before the index, checking every recipe
+    """
+    if union_results:
+        container = OrderedDict()
+        def add_items(recipes):
+            for recipe in recipes:
+                container[recipe.name] = recipe
+            return container
+    else:
+        container = [None]
+        def add_items(recipes):
+            container[0] = recipes if container[0] is None else [x for x in container[0] if x in recipes]
+            return container
+    recipes = [recipe for recipe in all_recipes if filter_options.all_ or recipe.can_make]
+    if filter_options.search:
+        include_list = [filter_options.search.lower()]
+    else:
+        include_list = [i.lower() for i in filter_options.include]
+    if include_list:
+        reduce_fn = any if filter_options.include_use_or else all
+        add_items([recipe for recipe in recipes if
+                reduce_fn(recipe.contains_ingredient(ingredient, include_optional=True) for ingredient in include_list)])
+    if filter_options.exclude:
+        reduce_fn = any if filter_options.exclude_use_or else all
+        add_items([recipe for recipe in recipes if
+                reduce_fn(not recipe.contains_ingredient(ingredient, include_optional=False) for ingredient in filter_options.exclude)])
+    for attr in 'style glass prep ice tag'.split():
+        attr_value = getattr(filter_options, attr).lower()
+        if filter_options.search and not attr_value:
+            attr_value = filter_options.search.lower()
+        if attr_value:
+            # a few recipes have null attributes, which the scan raised on
+            add_items([recipe for recipe in recipes if attr_value in (getattr(recipe, attr) or '').lower()])
+        else:
+            add_items(recipes)
+    result = list(container.values()) if union_results else container[0]
+    excluded = sorted(set(r.name for r in all_recipes) - set(r.name for r in result))
+    return result, excluded
+
+def options(search='', all_=True, include=(), exclude=(), include_use_or=False, exclude_use_or=False,
+        style='', glass='', prep='', ice='', tag=''):
+    return FilterOptions(search, all_, list(include), list(exclude), include_use_or, exclude_use_or, style, glass, prep, ice, tag)
+
+FILTERS = {
+    'empty': options(),
+    'empty, can make': options(all_=False),
+    'exact': options(include=['dry gin']),
+    'contains': options(include=['gin']),
+    'contains, case': options(include=['RUM']),
+    'include all': options(include=['gin', 'vermouth']),
+    'include any': options(include=['gin', 'vermouth'], include_use_or=True),
+    'no match': options(include=['unobtainium']),
+    'exclude': options(exclude=['vermouth']),
+    'exclude all': options(exclude=['gin', 'lime'], exclude_use_or=True),
+    'exclude any': options(exclude=['gin', 'lime']),
+    'search': options(search='rum'),
+    'search attributes': options(search='stir'),
+    'fields': options(include=['juice'], style='cocktail', glass='rocks', prep='shake'),
+    'fields, can make': options(all_=False, include=['bitters'], exclude=['egg'], ice='cubed', tag='core'),
+    'attribute': options(glass='martini'),
+}
+
+@pytest.mark.parametrize('union_results', [False, True])
+@pytest.mark.parametrize('name', list(FILTERS))
+def test_matches_scan(recipes, name, union_results):
+    filter_options = FILTERS[name]
+    index = RecipeSearchIndex(recipes)
+    expected, expected_excluded = scan(recipes, filter_options, union_results)
+    result, excluded = filter_recipes(recipes, filter_options, union_results, search_index=index)
+    assert [r.name for r in result] == [r.name for r in expected]
+    assert excluded == expected_excluded
+
+@pytest.mark.parametrize('union_results', [False, True])
+@pytest.mark.parametrize('name', list(FILTERS))
+def test_matches_scan_on_a_shuffled_subset(recipes, name, union_results):
+    filter_options = FILTERS[name]
+    index = RecipeSearchIndex(recipes)
+    subset = random.Random(name).sample(recipes, len(recipes) // 2)
+    expected, expected_excluded = scan(subset, filter_options, union_results)
+    result, excluded = filter_recipes(subset, filter_options, union_results, search_index=index)
+    assert [r.name for r in result] == [r.name for r in expected]
+    assert excluded == expected_excluded
+
+def test_unindexed_recipe(recipes):
+    index = RecipeSearchIndex(recipes[1:])
+    filter_options = FILTERS['contains']
+    result, excluded = filter_recipes(recipes, filter_options, search_index=index)
+    expected, expected_excluded = scan(recipes, filter_options)
+    assert [r.name for r in result] == [r.name for r in expected]
+    assert excluded == expected_excluded
+
+def test_index_matching(recipes):
+    index = RecipeSearchIndex(recipes)
+    for term in ('g', 'gi', 'gin', 'dry gin', 'lime juice', 'xyzzy', ''):
+        expected = [recipe.name for recipe in recipes if recipe.contains_ingredient(term, include_optional=True)]
+        assert [recipes[i].name for i in bits(index.matching('ingredients', term))] == expected, term
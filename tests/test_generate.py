@@ -0,0 +1,35 @@
+""" Recipe generation in worker processes matches generating in this one
+"""
+import pytest
+
+from mixmind import type_resolver
+from mixmind.generate import Barstock_Snapshot, generate_partition, generate_in_pool, partition
+
+from test_recipe_engines import STOCK, RECIPES, row
+
+@pytest.fixture
+def synonyms():
+    """ Stock spelled "liqueur" where recipes say "liquor"
+    """
+    type_resolver.configure_synonyms({'whisky': 'whiskey', 'liquor': 'liqueur'})
+    yield
+    type_resolver.configure_synonyms(type_resolver.DEFAULT_SYNONYMS)
+
+def test_partition():
+    items = list(range(10))
+    assert partition(items, 3) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert partition(items, 20) == [[i] for i in items]
+    assert partition([], 4) == []
+
+def test_pool_matches_serial_with_synonyms(synonyms):
+    stock = STOCK + [row('Liqueur', 'maraschino liqueur', 'Luxardo', 32.0, 1.40)]
+    recipes = dict(RECIPES, **{'Aviation': {'ingredients': {'dry gin': 2, 'maraschino liquor': 0.5, 'lemon juice': 0.75}},
+        'Martinez': {'ingredients': {'old tom gin': 1.5, 'sweet vermouth': 1.5, 'maraschino liquor': '1 tsp'}}})
+    items = list(recipes.items())
+    barstock = Barstock_Snapshot(1, stock)
+    serial = generate_partition(items, barstock, 'closed_form', 1000)
+    pooled = generate_in_pool(items, {1: barstock}, 'closed_form', 2, 1000)[1]
+    assert pooled == serial
+    # the synonym is what lets it be made
+    examples = dict(serial)['Martinez'][1]
+    assert [example[0] for example in examples] == ['Ransom, Carpano Antica, Luxardo']
@@ -0,0 +1,131 @@
+""" Recipe library snapshots, their sort orders and name lookups
+"""
+import random
+import urllib.parse
+
+import pytest
+
+from mixmind.configuration_management import RecipeLibrary, RecipeNameIndex, SortOrder, SORTABLE_STATS, MixMindServer
+
+class Stats(object):
+    def __init__(self, avg_abv, avg_cost, avg_std_drinks):
+        self.avg_abv = avg_abv
+        self.avg_cost = avg_cost
+        self.avg_std_drinks = avg_std_drinks
+
+class Recipe(object):
+    """ What sorting uses of a DrinkRecipe, no stats if it can't be made
+    """
+    def __init__(self, name, stats):
+        self.name = name
+        self.stats = stats
+
+    def __repr__(self):
+        return "<Recipe {}>".format(self.name)
+
+def random_stats(rng):
+    if rng.random() < 0.2:
+        return None
+    # few distinct values, so there are plenty of ties
+    return Stats(rng.choice([12.5, 15.0, 20.0, 25.0]), rng.choice([1.0, 1.5, 2.25]), rng.randint(1, 4) / 2.0)
+
+def make_library(rng, size=60):
+    recipes = [Recipe("Recipe {}".format(i), random_stats(rng)) for i in range(size)]
+    names = [recipe.name for recipe in recipes]
+    # the indexes only matter for lookups and filtering
+    return RecipeLibrary(1, 1, recipes, index=names, search=names)
+
+def expected_sort(recipes, attr, reverse):
+    made = [recipe for recipe in recipes if recipe.stats is not None]
+    return sorted(made, key=lambda r: getattr(r.stats, attr), reverse=reverse) + \
+            [recipe for recipe in recipes if recipe.stats is None]
+
+def check_sorts(library, rng):
+    recipes = list(library.recipes)
+    subset = rng.sample(recipes, len(recipes) // 3)
+    in_order = sorted(subset, key=lambda r: library.positions[r.name])
+    for attr in SORTABLE_STATS:
+        built = SortOrder.build(attr, library.recipes)
+        order = library.sort_order(attr)
+        assert order.keys == built.keys
+        assert order.missing == built.missing
+        assert order.ties == built.ties
+        for reverse in (False, True):
+            for candidates in (recipes, subset, in_order, []):
+                assert library.sort(candidates, attr, reverse=reverse) == expected_sort(candidates, attr, reverse)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sort_matches_sorted(seed):
+    rng = random.Random(seed)
+    check_sorts(make_library(rng), rng)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sort_after_replace_matches_sorted(seed):
+    rng = random.Random(seed)
+    library = make_library(rng)
+    check_sorts(library, rng)
+    for _ in range(4):
+        changed = rng.sample(library.recipes, rng.randint(1, 10))
+        # changed stats, including recipes becoming or no longer unmakeable
+        library = library.replace({recipe.name: Recipe(recipe.name, random_stats(rng)) for recipe in changed})
+        if rng.random() < 0.5:
+            # sort orders not used in this version carry their changes over to the next
+            library = library.replace({changed[0].name: Recipe(changed[0].name, None)})
+        check_sorts(library, rng)
+
+def test_sort_all_ties():
+    recipes = [Recipe(name, Stats(20.0, 1.0, 1.0)) for name in 'cab'] + [Recipe('d', None), Recipe('e', None)]
+    names = [recipe.name for recipe in recipes]
+    library = RecipeLibrary(1, 1, recipes, index=names, search=names)
+    for reverse in (False, True):
+        assert library.sort(recipes, 'avg_abv', reverse) == recipes
+        shuffled = recipes[::-1]
+        assert library.sort(shuffled, 'avg_abv', reverse) == shuffled[2:] + shuffled[:2]
+
+def test_sort_recipes_from_another_library():
+    rng = random.Random(0)
+    library = make_library(rng)
+    other = [Recipe("Other {}".format(i), Stats(i, i, i)) for i in range(3, 0, -1)]
+    assert library.sort(other, 'avg_cost') == other[::-1]
+
+NAMES = ["Martini", "Mai-Tai", "Mai-tai", "Tom & Jerry", "Tom and Jerry", "Añejo Highball", "Anejo Highball",
+        "Dark 'n' Stormy", "日本", "!!!", "Japanese Cocktail #1"]
+
+def test_slugs_are_unique():
+    index = RecipeNameIndex(NAMES)
+    slugs = [index.slug(name) for name in NAMES]
+    assert slugs == ['martini', 'mai-tai', 'mai-tai-2', 'tom-jerry', 'tom-and-jerry', 'anejo-highball',
+            'anejo-highball-2', 'dark-n-stormy', 'recipe', 'recipe-2', 'japanese-cocktail-1']
+    for name, slug in zip(NAMES, slugs):
+        assert index.lookup(slug) == name
+
+def test_lookup():
+    index = RecipeNameIndex(NAMES)
+    for name in NAMES:
+        assert index.lookup(name) == name
+        assert index.lookup(urllib.parse.quote_plus(name)) == name
+        assert index.lookup(urllib.parse.quote(name)) == name
+    assert index.lookup("martini") == "Martini"
+    assert index.lookup("  MARTINI ") == "Martini"
+    assert index.lookup("dark+%27N%27+stormy") == "Dark 'n' Stormy"
+    assert index.lookup("a%C3%B1ejo+highball") == "Añejo Highball"
+    # names differing only in case go to the first, the other by its exact name or slug
+    assert index.lookup("mai-tai") == "Mai-Tai"
+    assert index.lookup("Mai-tai") == "Mai-tai"
+    assert index.lookup("mai-tai-2") == "Mai-tai"
+
+@pytest.mark.parametrize('name', ["Manhattan", "", " ", "%", "%zz", "mai-tai-3", "recipe-3", "martini-2", "../martini", "\x00"])
+def test_lookup_miss(name):
+    index = RecipeNameIndex(NAMES)
+    assert index.lookup(name) is None
+    library = RecipeLibrary(1, 1, [Recipe(name, None) for name in NAMES], index=index, search=NAMES)
+    assert library.find(name) is None
+
+def test_find_recipe_json(app):
+    server = MixMindServer(app)
+    assert server.find_recipe_json("Martini") is server.base_recipes["Martini"]
+    assert server.find_recipe_json("dark-n-stormy") is server.base_recipes["Dark 'n' Stormy"]
+    assert server.find_recipe_json("Bee%27s+Knees") is server.base_recipes["Bee's Knees"]
+    # the view answers 404 for these
+    assert server.find_recipe_json("Unobtainium Sour") is None
+    assert server.find_recipe_json("%") is None
@@ -0,0 +1,125 @@
+""" Paging through the order history
+"""
+import datetime
+import random
+
+import pytest
+
+from mixmind.database import db
+from mixmind.models import Order, parse_order_cursor
+
+START = datetime.datetime(2025, 1, 1, 12)
+
+@pytest.fixture
+def orders(app):
+    """ Orders over a few days at three bars, many at the same time as another
+    """
+    rng = random.Random(0)
+    timestamps = [START + datetime.timedelta(minutes=rng.randint(0, 4*24*60)) for _ in range(40)]
+    orders = []
+    for i in range(200):
+        timestamp = rng.choice(timestamps)
+        confirmed = timestamp + datetime.timedelta(minutes=2) if rng.random() < 0.5 else None
+        orders.append(Order(bar_id=rng.randint(1, 3), timestamp=timestamp, confirmed=confirmed,
+            user_email='guest@example.com', recipe_name="Recipe {}".format(i)))
+    db.session.add_all(orders)
+    db.session.commit()
+    return orders
+
+def expected(orders, bar_id=None, since=None, until=None, confirmed=None):
+    matching = [order for order in orders if (bar_id is None or order.bar_id == bar_id)
+            and (since is None or order.timestamp.date() >= since)
+            and (until is None or order.timestamp.date() <= until)
+            and (confirmed is None or (order.confirmed is not None) == confirmed)]
+    return [order.id for order in sorted(matching, key=lambda order: (order.timestamp, order.id), reverse=True)]
+
+def walk(limit, **filters):
+    ids, pages, after = [], 0, None
+    while True:
+        page = Order.page(limit, after=after, **filters)
+        assert len(page.orders) <= limit
+        ids.extend(order.id for order in page.orders)
+        pages += 1
+        if page.next is None:
+            return ids, pages
+        assert page.next == page.orders[-1].cursor()
+        after = page.next
+
+FILTERS = [
+    {},
+    dict(bar_id=2),
+    dict(confirmed=True),
+    dict(confirmed=False),
+    dict(since=datetime.date(2025, 1, 2)),
+    dict(until=datetime.date(2025, 1, 2)),
+    dict(since=datetime.date(2025, 1, 2), until=datetime.date(2025, 1, 2)),
+    dict(bar_id=1, since=datetime.date(2025, 1, 3), confirmed=False),
+    dict(bar_id=3, since=datetime.date(2025, 1, 2), until=datetime.date(2025, 1, 4), confirmed=True),
+    dict(until=datetime.date(2024, 12, 31)),
+    dict(bar_id=4),
+]
+
+@pytest.mark.parametrize('limit', [1, 7, 500])
+@pytest.mark.parametrize('filters', FILTERS, ids=repr)
+def test_pages_match_a_full_sort(orders, filters, limit):
+    ids, pages = walk(limit, **filters)
+    assert ids == expected(orders, **filters)
+    # the last page is only empty when there aren't any orders at all
+    assert pages == max(1, -(-len(ids) // limit))
+
+def test_page_boundary(orders):
+    ids = expected(orders, bar_id=2)
+    # exactly a page's worth isn't followed by an empty page
+    page = Order.page(len(ids), bar_id=2)
+    assert [order.id for order in page.orders] == ids and page.next is None
+    page = Order.page(len(ids) - 1, bar_id=2)
+    assert page.next == page.orders[-1].cursor()
+    last = Order.page(len(ids), after=page.next, bar_id=2)
+    assert [order.id for order in last.orders] == ids[-1:] and last.next is None
+
+def test_ties_break_on_id(orders):
+    timestamp = orders[0].timestamp
+    tied = sorted(order.id for order in orders if order.timestamp == timestamp)
+    assert len(tied) > 2
+    # a cursor in the middle of the tied orders, the rest of them come first on the next page
+    after = Order.query.get(tied[1]).cursor()
+    page = Order.page(len(tied), after=after)
+    assert [order.id for order in page.orders[:1]] == [tied[0]]
+    assert all(order.timestamp < timestamp for order in page.orders[1:])
+
+def test_cursor_round_trip(orders):
+    for order in orders[:10]:
+        assert parse_order_cursor(order.cursor()) == (order.timestamp, order.id)
+
+def test_cursor_from_another_filter(orders):
+    # a cursor is just a position in the history, whichever page it came from
+    order = next(order for order in orders if order.bar_id == 1)
+    all_ids = expected(orders)
+    page = Order.page(len(orders), after=order.cursor(), bar_id=2)
+    after = all_ids[all_ids.index(order.id)+1:]
+    assert [o.id for o in page.orders] == [i for i in after if Order.query.get(i).bar_id == 2]
+
+@pytest.mark.parametrize('cursor', [
+    'garbage',
+    '_',
+    '20250101T120000_1',
+    '20251301T120000.000000_1',
+    '20250101T120000.000000_',
+    '20250101T120000.000000_-1',
+    '20250101T120000.000000_1_2',
+    '20250101T120000.000000_1 ',
+    '20250101T120000.000000_' + '9'*30,
+    '٢٠٢٥٠١٠١T120000.000000_1',
+])
+def test_malformed_cursor(app, cursor):
+    with pytest.raises(ValueError):
+        parse_order_cursor(cursor)
+    # which the api turns into an error response
+    with pytest.raises(ValueError):
+        Order.page(10, after=cursor)
+
+def test_cursor_past_the_end(orders):
+    page = Order.page(10, after=datetime.datetime(2000, 1, 1).strftime('%Y%m%dT%H%M%S.%f') + '_1')
+    assert page.orders == [] and page.next is None
+    page = Order.page(10, after=datetime.datetime(2100, 1, 1).strftime('%Y%m%dT%H%M%S.%f') + '_1')
+    assert [order.id for order in page.orders] == expected(orders)[:10]
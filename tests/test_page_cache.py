@@ -0,0 +1,117 @@
+""" Whole page responses from the page cache
+"""
+import gzip
+
+import pytest
+from flask import Flask, flash, get_flashed_messages
+
+from mixmind import page_cache
+from mixmind.page_cache import PageCache, CachedPage
+
+BODY = "<html>" + "Martini " * 200 + "</html>"
+
+@pytest.fixture
+def rendered():
+    return []
+
+def make_client(max_bytes, rendered):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    cache = PageCache(max_bytes)
+
+    def render():
+        # as the templates do, showing the messages uses them up
+        rendered.append(get_flashed_messages())
+        return BODY
+
+    @app.route('/')
+    def browse():
+        return cache.response('browse', render)
+
+    @app.route('/flash')
+    def flashing():
+        flash("Bartender's choice!")
+        return 'flashed'
+
+    client = app.test_client()
+    client.cache = cache
+    return client
+
+@pytest.fixture
+def client(rendered):
+    return make_client(1024 * 1024, rendered)
+
+def test_plain_then_not_modified(client, rendered):
+    response = client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == BODY
+    assert 'Content-Encoding' not in response.headers
+    etag, weak = response.get_etag()
+    assert etag == CachedPage(BODY.encode('utf-8')).etag and not weak
+    last_modified = response.headers['Last-Modified']
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    response = client.get('/', headers={'Accept-Encoding': 'identity', 'If-None-Match': '"{}"'.format(etag)})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    response = client.get('/', headers={'Accept-Encoding': 'identity',
+        'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    assert len(rendered) == 1
+
+def test_gzip(client, rendered):
+    response = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()).decode('utf-8') == BODY
+    etag, _ = response.get_etag()
+    assert etag == CachedPage(BODY.encode('utf-8')).etag + '-gzip'
+
+    response = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"{}"'.format(etag)})
+    assert response.status_code == 304
+    # the plain body's etag doesn't match the gzipped one, and vice versa
+    response = client.get('/', headers={'Accept-Encoding': 'identity', 'If-None-Match': '"{}"'.format(etag)})
+    assert response.status_code == 200 and response.get_data(as_text=True) == BODY
+    plain, _ = response.get_etag()
+    response = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"{}"'.format(plain)})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    assert len(rendered) == 1
+
+def test_gzip_only_when_asked_for(client, monkeypatch):
+    def compress(data):
+        raise AssertionError("compressed a page no client accepted gzip for")
+    monkeypatch.setattr(page_cache.gzip, 'compress', compress)
+    for _ in range(2):
+        assert client.get('/', headers={'Accept-Encoding': 'identity'}).status_code == 200
+    page = client.cache.pages.get('browse')
+    assert not page.compressed
+    assert client.cache.pages.size == len(page.body)
+
+def test_gzipped_copy_is_counted(client):
+    client.get('/', headers={'Accept-Encoding': 'gzip'})
+    page = client.cache.pages.get('browse')
+    assert page.compressed
+    assert client.cache.pages.size == len(page.body) + len(page.gzipped())
+
+def test_disabled(rendered, monkeypatch):
+    client = make_client(0, rendered)
+    def unexpected(*args):
+        raise AssertionError("hashed or compressed a page that isn't cached")
+    monkeypatch.setattr(page_cache.gzip, 'compress', unexpected)
+    monkeypatch.setattr(page_cache.hashlib, 'sha1', unexpected)
+    for _ in range(2):
+        response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200 and response.get_data(as_text=True) == BODY
+        assert 'Content-Encoding' not in response.headers and 'ETag' not in response.headers
+    assert len(rendered) == 2
+    assert client.cache.pages.size == 0
+
+def test_not_cached_with_flashes(client, rendered):
+    with client:
+        client.get('/flash')
+        response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert response.get_data(as_text=True) == BODY and 'ETag' not in response.headers
+    assert client.cache.pages.get('browse') is None
+    client.get('/')
+    client.get('/')
+    assert len(rendered) == 2
@@ -0,0 +1,23 @@
+""" Converting recipes between units
+"""
+from mixmind.recipe import DrinkRecipe, Ingredient, Garnish
+
+MARTINI = {'ingredients': {'dry gin': 2.5, 'dry vermouth': 0.5}, 'optional': {'orange bitters': 'dash'},
+        'misc': 'Stir with ice', 'garnish': 'Lemon twist', 'unit': 'oz'}
+
+def test_convert_with_garnish_and_misc_lines():
+    recipe = DrinkRecipe('Martini', MARTINI)
+    recipe.convert('mL')
+    assert recipe.unit == 'mL'
+    assert recipe.ingredient_lines() == ['75 mL dry gin', '15 mL dry vermouth', 'dash of orange bitters, (optional)',
+            'Stir with ice', 'Lemon twist, for garnish']
+    misc, garnish = recipe.ingredients[-2:]
+    assert type(misc) == Ingredient and type(garnish) == Garnish
+    assert misc.recipe_unit == garnish.recipe_unit == 'mL'
+
+def test_in_unit_with_garnish_and_misc_lines():
+    recipe = DrinkRecipe('Martini', MARTINI)
+    converted = recipe.in_unit('mL')
+    assert converted.ingredient_lines()[-2:] == ['Stir with ice', 'Lemon twist, for garnish']
+    assert recipe.unit == 'oz'
+    assert recipe.ingredients[-1].recipe_unit is None
@@ -0,0 +1,72 @@
+""" The example engines agree on the same stock
+"""
+import pytest
+
+from mixmind.recipe import DrinkRecipe, EXAMPLE_ENGINES
+from mixmind.generate import Barstock_Snapshot, StockRow
+
+def row(category, type_, kind, abv, cost_per_oz):
+    return StockRow(category, type_.title(), type_, kind, abv, cost_per_oz / 29.5735, cost_per_oz / 2.95735, cost_per_oz)
+
+STOCK = [
+    row('Spirit', 'dry gin', 'Beefeater', 44.0, 0.80),
+    row('Spirit', 'dry gin', 'Plymouth', 41.2, 1.10),
+    row('Spirit', 'old tom gin', 'Ransom', 44.0, 1.60),
+    row('Spirit', 'white rum', 'Flor de Cana', 40.0, 0.60),
+    row('Spirit', 'aged rum', 'Appleton', 43.0, 1.20),
+    row('Vermouth', 'dry vermouth', 'Noilly Prat', 18.0, 0.45),
+    row('Vermouth', 'sweet vermouth', 'Carpano Antica', 16.5, 0.90),
+    row('Bitters', 'orange bitters', 'Regans', 45.0, 1.50),
+    row('Juice', 'lime juice', 'Fresh', 0.0, 0.25),
+    row('Syrup', 'simple syrup', 'House', 0.0, 0.10),
+]
+
+RECIPES = {
+    'Martini': {'ingredients': {'dry gin': 2.5, 'dry vermouth': 0.5}, 'optional': {'orange bitters': 'dash'}, 'unit': 'oz'},
+    'Daiquiri': {'ingredients': {'rum': 2, 'lime juice': 0.75, 'simple syrup': 0.75}, 'unit': 'oz'},
+    'Martinez': {'ingredients': {'old tom gin': 1.5, 'sweet vermouth': 1.5, 'maraschino liqueur': '1 tsp'}, 'unit': 'oz'},
+    'Last Word': {'ingredients': {'dry gin': 0.75, 'green chartreuse': 0.75, 'lime juice': 0.75}, 'unit': 'oz'},
+    'Unobtainium Sour': {'ingredients': {'unobtainium': 2, 'lime juice': 1}, 'optional': {'dry vermouth': 0.5}, 'unit': 'oz'},
+    'Gin Rickey': {'ingredients': {'dry gin': 60, 'lime juice': 15}, 'unit': 'mL'},
+    'Spirit Sour': {'ingredients': {'any spirit': 2, 'lime juice': 0.75, 'simple syrup': 0.5, 'bitters': '2 dashes'},
+        'optional': {'vermouth': 0.25}, 'unit': 'oz'},
+}
+
+def generate(engine):
+    barstock = Barstock_Snapshot(1, STOCK)
+    return {name: DrinkRecipe(name, recipe).generate_examples(barstock, stats=True, engine=engine)
+            for name, recipe in RECIPES.items()}
+
+def summary(recipe):
+    stats = None
+    if recipe.stats:
+        stats = [tuple(value) if isinstance(value, DrinkRecipe.RecipeExample) else value for value in recipe.stats]
+    examples = sorted(tuple(example) for example in recipe.examples)
+    return recipe.max_cost, examples, stats
+
+@pytest.mark.parametrize('engine', [e for e in EXAMPLE_ENGINES if e != 'scalar'])
+def test_engines_match_scalar(engine):
+    expected = generate('scalar')
+    generated = generate(engine)
+    for name in RECIPES:
+        max_cost, examples, stats = summary(generated[name])
+        expected_max_cost, expected_examples, expected_stats = summary(expected[name])
+        assert max_cost == pytest.approx(expected_max_cost), name
+        assert [e[0] for e in examples] == [e[0] for e in expected_examples], name
+        assert [e[1:] for e in examples] == pytest.approx([e[1:] for e in expected_examples]), name
+        assert (stats is None) == (expected_stats is None), name
+        if stats:
+            assert stats == pytest.approx(expected_stats), name
+
+def test_missing_and_unknown_ingredients_have_no_examples():
+    for engine in EXAMPLE_ENGINES:
+        generated = generate(engine)
+        for name in ('Martinez', 'Last Word', 'Unobtainium Sour'):
+            assert generated[name].examples == [], (engine, name)
+            assert not generated[name].can_make, (engine, name)
+
+def test_optional_ingredients_dont_multiply_examples():
+    for engine in EXAMPLE_ENGINES:
+        martini = generate(engine)['Martini']
+        assert sorted(e.kinds for e in martini.examples) == ['Beefeater, Noilly Prat', 'Plymouth, Noilly Prat'], engine
+        assert len(generate(engine)['Daiquiri'].examples) == 2, engine
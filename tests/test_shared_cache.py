@@ -0,0 +1,249 @@
+""" Shared cache backends, and recipe libraries shared between MixMindServers
+"""
+import threading
+import time
+
+import pytest
+
+from mixmind import shared_cache, configuration_management
+from mixmind.shared_cache import LocalCache, SQLiteCache, RedisCache, SharedLibraries
+from mixmind.configuration_management import MixMindServer
+from mixmind.models import Bar
+
+class FakeRedis(object):
+    """ The parts of a redis-py client RedisCache uses, values come back as bytes
+    """
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        value = int(self.values.get(key, b'0')) + 1
+        self.values[key] = str(value).encode()
+        return value
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture(params=['local', 'sqlite', 'redis'])
+def cache(request, tmp_path):
+    if request.param == 'local':
+        return LocalCache()
+    if request.param == 'sqlite':
+        return SQLiteCache(str(tmp_path / 'cache.db'))
+    return RedisCache(FakeRedis())
+
+def test_get_set_delete(cache):
+    assert cache.get('key') is None
+    cache.set('key', b'value')
+    assert cache.get('key') == b'value'
+    cache.set('key', b'other')
+    assert cache.get('key') == b'other'
+    cache.delete('key')
+    assert cache.get('key') is None
+    cache.delete('key')
+
+def test_set_nx(cache):
+    assert cache.set('key', b'first', nx=True)
+    assert cache.set('key', b'second', nx=True) is None
+    assert cache.get('key') == b'first'
+    cache.delete('key')
+    assert cache.set('key', b'third', nx=True)
+    assert cache.get('key') == b'third'
+
+def test_incr(cache):
+    assert cache.incr('counter') == 1
+    assert cache.incr('counter') == 2
+    assert int(cache.get('counter')) == 2
+
+@pytest.mark.parametrize('backend', ['local', 'sqlite'])
+def test_expiry(backend, tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shared_cache, 'time', clock)
+    cache = LocalCache() if backend == 'local' else SQLiteCache(str(tmp_path / 'cache.db'))
+    cache.set('key', b'value', ex=10)
+    assert cache.set('key', b'other', ex=10, nx=True) is None
+    clock.now += 11
+    assert cache.get('key') is None
+    assert cache.set('key', b'other', ex=10, nx=True)
+    assert cache.get('key') == b'other'
+
+def test_sqlite_shared_between_connections(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = SQLiteCache(path), SQLiteCache(path)
+    first.set('key', b'value')
+    assert second.get('key') == b'value'
+    assert first.incr('counter') == 1
+    assert second.incr('counter') == 2
+    assert first.set('lease', b'a', ex=60, nx=True)
+    assert second.set('lease', b'b', ex=60, nx=True) is None
+
+class Library(object):
+    """ What SharedLibraries.store reads from a RecipeLibrary
+    """
+    def __init__(self, bar_id, version, recipes=()):
+        self.bar_id = bar_id
+        self.version = version
+        self.recipes = list(recipes)
+        self.versions = {recipe.name: version for recipe in self.recipes}
+
+class Recipe(object):
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def dump_examples(self):
+        return self.data
+
+def test_version_counter_is_not_published(cache):
+    libraries = SharedLibraries(cache)
+    assert libraries.version(1) == 0
+    assert libraries.next_version(1) == 1
+    assert libraries.next_version(1) == 2
+    assert libraries.next_version(2) == 1
+    assert libraries.version(1) == 0
+    assert libraries.load(1, 2) is None
+
+def test_store_publishes_after_writing(cache):
+    libraries = SharedLibraries(cache)
+    libraries.store(Library(1, 3, [Recipe('Martini', (1.0, [], None))]))
+    assert libraries.version(1) == 3
+    assert libraries.load(1, 3) == ({'Martini': 3}, [('Martini', (1.0, [], None))])
+    libraries.store(Library(1, 5, [Recipe('Martini', (2.0, [], None))]))
+    assert libraries.version(1) == 5
+    assert libraries.load(1, 3) is None
+    assert libraries.load(1, 5)[1] == [('Martini', (2.0, [], None))]
+    assert libraries.version(2) == 0
+
+def test_lease(cache):
+    libraries = SharedLibraries(cache)
+    token = libraries.acquire(1)
+    assert token
+    assert libraries.acquire(1) is None
+    assert libraries.acquire(2)
+    libraries.release(1, b'not the token')
+    assert libraries.acquire(1) is None
+    libraries.release(1, token)
+    assert libraries.acquire(1)
+
+def test_lease_expires(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shared_cache, 'time', clock)
+    libraries = SharedLibraries(LocalCache(), lease_ttl=30)
+    assert libraries.acquire(1)
+    clock.now += 31
+    assert libraries.acquire(1)
+
+
+@pytest.fixture
+def servers(app, monkeypatch):
+    """ Two MixMindServers, as if in two workers, sharing one cache
+    """
+    cache = LocalCache()
+    monkeypatch.setattr(configuration_management, 'get_shared_cache', lambda url: cache)
+    monkeypatch.setattr(configuration_management, 'SHARED_POLL_INTERVAL', 0.01)
+    monkeypatch.setitem(app.config, 'MIXMIND_SHARED_CACHE', 'local')
+    monkeypatch.setitem(app.config, 'MIXMIND_SHARED_LIBRARY_WAIT', 10)
+    first, second = MixMindServer(app), MixMindServer(app)
+    yield first, second
+    for server in (first, second):
+        wait_for_stores(server)
+
+def wait_for_stores(server, timeout=60):
+    deadline = time.time() + timeout
+    while server._unstored:
+        assert time.time() < deadline, "library never stored"
+        time.sleep(0.01)
+
+def examples(library):
+    return {recipe.name: recipe.dump_examples() for recipe in library.recipes}
+
+def no_generating(server, monkeypatch):
+    def generate_recipes(bar, engine=None):
+        raise AssertionError("generated a library another server published")
+    monkeypatch.setattr(server, 'generate_recipes', generate_recipes)
+
+def test_second_server_loads_the_first_ones_library(servers, monkeypatch):
+    first, second = servers
+    bar = Bar.query.one()
+    library = first.library(bar)
+    assert library.version == 1
+    wait_for_stores(first)
+    assert first.shared_libraries.version(bar.id) == 1
+
+    no_generating(second, monkeypatch)
+    loaded = second.library(bar)
+    assert loaded.version == library.version
+    assert examples(loaded) == examples(library)
+    assert second.library(bar) is loaded
+
+def test_second_server_waits_for_the_lease_holder(servers, monkeypatch):
+    first, second = servers
+    bar = Bar.query.one()
+    # the first server is generating, as if it got there first
+    assert first._claim_shared(bar.id)
+    no_generating(second, monkeypatch)
+    loaded = []
+    waiting = threading.Thread(target=lambda: loaded.append(second.library(bar)))
+    waiting.start()
+    time.sleep(0.1)
+    assert waiting.is_alive()
+
+    library = first.library(bar)
+    waiting.join(60)
+    assert not waiting.is_alive()
+    assert loaded[0].version == library.version
+    assert examples(loaded[0]) == examples(library)
+
+def test_stock_edits_reach_the_other_server(servers):
+    first, second = servers
+    bar = Bar.query.one()
+    first.library(bar)
+    wait_for_stores(first)
+    before = second.library(bar)
+
+    first.regenerate_recipes(bar, recipe_name='Martini')
+    wait_for_stores(first)
+    version = first.shared_libraries.version(bar.id)
+    assert version > before.version
+    after = second.library(bar)
+    assert after.version == version
+    assert after.versions['Martini'] == version
+
+def test_edits_through_both_servers_survive(servers):
+    first, second = servers
+    bar = Bar.query.one()
+    first.library(bar)
+    wait_for_stores(first)
+    stale = second.library(bar)
+
+    first.regenerate_recipes(bar, recipe_name='Martini')
+    wait_for_stores(first)
+    # the second server's copy hasn't seen the Martini edit yet
+    assert stale.versions['Martini'] == stale.version
+    second.regenerate_recipes(bar, recipe_name='Manhattan')
+    wait_for_stores(second)
+
+    version = first.shared_libraries.version(bar.id)
+    versions, _ = first.shared_libraries.load(bar.id, version)
+    assert versions['Martini'] > stale.version
+    assert versions['Manhattan'] == version > versions['Martini']
+    for server in servers:
+        library = server.library(bar)
+        assert library.version == version
+        assert library.versions == versions
@@ -0,0 +1,92 @@
+""" Recipe libraries saved to disk between starts
+"""
+import threading
+import time
+
+import pytest
+
+from mixmind import configuration_management
+from mixmind.configuration_management import MixMindServer
+from mixmind.generate import Barstock_Snapshot
+from mixmind.models import Bar
+from mixmind.recipe import DrinkRecipe
+from mixmind.snapshots import LibrarySnapshots
+
+from test_recipe_engines import STOCK, RECIPES
+
+class Library(object):
+    def __init__(self, bar_id, recipes):
+        self.bar_id = bar_id
+        self.recipes = recipes
+
+def recipes():
+    barstock = Barstock_Snapshot(1, STOCK)
+    return [DrinkRecipe(name, recipe).defer_examples(barstock, stats=True, engine='closed_form')
+            for name, recipe in RECIPES.items()]
+
+def test_only_generated_recipes_are_saved(tmp_path):
+    snapshots = LibrarySnapshots(str(tmp_path))
+    library = Library(1, recipes())
+    martini = library.recipes[0]
+    assert not martini.generated
+    martini.examples
+    assert martini.generated
+    snapshots.store(library, 'fingerprint')
+    assert snapshots.load(1, 'fingerprint') == [(martini.name, martini.dump_examples())]
+    assert snapshots.load(1, 'other fingerprint') is None
+    assert snapshots.load(2, 'fingerprint') is None
+
+@pytest.fixture
+def server(app, tmp_path, monkeypatch):
+    exits = []
+    monkeypatch.setattr(configuration_management.atexit, 'register', exits.append)
+    monkeypatch.setitem(app.config, 'MIXMIND_SNAPSHOT_DIR', str(tmp_path))
+    server = MixMindServer(app)
+    assert exits == [server.save_snapshots]
+    return server
+
+def wait_for_saves(server, timeout=60):
+    deadline = time.time() + timeout
+    while server._unsaved:
+        assert time.time() < deadline, "snapshot never saved"
+        time.sleep(0.01)
+
+def test_building_a_library_doesnt_generate_it(server, monkeypatch):
+    stored = []
+    monkeypatch.setattr(server.snapshots, 'store', lambda library, fingerprint: stored.append(library))
+    library = server.library(Bar.query.one())
+    wait_for_saves(server)
+    assert stored == []
+    assert not any(recipe.generated for recipe in library.recipes)
+
+def test_restart_loads_what_was_generated(server, app):
+    bar = Bar.query.one()
+    library = server.library(bar)
+    read = library.find('Martini')
+    read.examples
+    server.save_snapshots()
+
+    restarted = MixMindServer(app)
+    loaded = restarted.library(bar)
+    assert loaded.find('Martini').generated
+    assert loaded.find('Martini').dump_examples() == read.dump_examples()
+    assert not any(recipe.generated for recipe in loaded.recipes if recipe.name != 'Martini')
+    # and the others are still generated when they're read
+    other = next(recipe for recipe in loaded.recipes if recipe.name != 'Martini')
+    assert other.dump_examples() == library.find(other.name).dump_examples()
+
+def test_saves_are_coalesced(server, monkeypatch):
+    stored = []
+    release = threading.Event()
+    def store(library, fingerprint):
+        release.wait(10)
+        stored.append(library)
+    monkeypatch.setattr(server.snapshots, 'store', store)
+    bar = Bar.query.one()
+    server.library(bar)
+    for _ in range(5):
+        server.regenerate_recipes(bar, recipe_name='Martini')
+    release.set()
+    wait_for_saves(server)
+    assert len(stored) <= 2
+    assert stored[-1] is server.library(bar)
@@ -0,0 +1,61 @@
+""" Unit conversion, and the forms of recipe names used for lookups
+"""
+import pytest
+
+from mixmind import util
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'no_numpy'])
+def numpy(request, monkeypatch):
+    if request.param and not util.has_numpy:
+        pytest.skip("numpy not installed")
+    monkeypatch.setattr(util, 'has_numpy', request.param)
+    return request.param
+
+def test_convert_many_matches_convert_units(numpy):
+    amounts = [0, 1, 2.5, 750]
+    expected = [util.convert_units(amount, 'mL', 'oz') for amount in amounts]
+    assert list(util.convert_many(amounts, 'mL', 'oz')) == pytest.approx(expected)
+    units = ['oz', 'mL', 'ds', 'oz']
+    expected = [util.convert_units(amount, unit, 'mL', rounded=True) for amount, unit in zip(amounts, units)]
+    assert list(util.convert_many(amounts, units, 'mL', rounded=True)) == pytest.approx(expected)
+
+def test_convert_many_single_amount(numpy):
+    result = util.convert_many(750, 'mL', 'oz')
+    assert isinstance(result, float)
+    assert result == pytest.approx(util.convert_units(750, 'mL', 'oz'))
+
+def test_convert_many_unknown_unit(numpy):
+    with pytest.raises(NotImplementedError):
+        util.convert_many([1, 2], 'mL', 'furlong')
+
+@pytest.mark.parametrize('name,slug', [
+    ("Martini", 'martini'),
+    ("Tom & Jerry", 'tom-jerry'),
+    ("Bee's Knees", 'bee-s-knees'),
+    ("Rose, Fruit, & Smoke", 'rose-fruit-smoke'),
+    ("Japanese Cocktail #1", 'japanese-cocktail-1'),
+    ("  Mai-Tai  ", 'mai-tai'),
+    ("Añejo Highball", 'anejo-highball'),
+    ("Café Brûlot", 'cafe-brulot'),
+    ("Negroni 🍸", 'negroni'),
+    ("日本", ''),
+    ("!!!", ''),
+])
+def test_slugify(name, slug):
+    assert util.slugify(name) == slug
+
+@pytest.mark.parametrize('name,normalized', [
+    ("Old Fashioned", 'old fashioned'),
+    ("old+FASHIONED", 'old fashioned'),
+    ("Old%20Fashioned", 'old fashioned'),
+    ("  Old \t Fashioned ", 'old fashioned'),
+    ("Dark 'n' Stormy", "dark 'n' stormy"),
+    ("Dark+%27n%27+Stormy", "dark 'n' stormy"),
+    ("Añejo", 'añejo'),
+    ("A%C3%B1ejo", 'añejo'),
+    ("STRASSE", 'strasse'),
+    ("Straße", 'strasse'),
+    ("100%", '100%'),
+])
+def test_normalize_name(name, normalized):
+    assert util.normalize_name(name) == normalized